@@ -5,23 +5,187 @@
 # in +PreCmd as a separate script.
 
 # Get static version of parrot.
-# Note: We depend on curl for this.
+# The controller publishes parrot under its checksum and transfers it with
+# the job. Copies whose checksum matches are reused: the transferred one,
+# the one cached on this node or the one on the shared volume. Otherwise it
+# is downloaded and cached on this node for the next jobs.
+# Note: We depend on curl for downloading.
 # Assumed to be available on HPC worker nodes (might need to transfer a static version otherwise).
+parrot_url="${reana_parrot_url:-http://download.virtualclusters.org/builder-files/parrot_static_run_v7.0.11}"
+node_cache_dir="${REANA_NODE_CACHE_DIR:-${TMPDIR:-/tmp}/reana-cache-$(id -u)}"
+
+checksum_matches(){
+    [ -n "$reana_parrot_sha256" ] && [ -r "$1" ] && \
+        echo "$reana_parrot_sha256  $1" | sha256sum -c --status - 2>/dev/null
+}
+
+cache_parrot(){
+    local cached="$node_cache_dir/$reana_parrot_sha256/parrot_static_run"
+    if [ -z "$reana_parrot_sha256" ] || [ -e "$cached" ]; then return 0; fi
+    mkdir -p "$(dirname "$cached")" 2>/dev/null || return 0
+    local tmp_cached
+    tmp_cached=$(mktemp -p "$(dirname "$cached")") || return 0
+    cp "$1" "$tmp_cached" && chmod +x "$tmp_cached" && mv "$tmp_cached" "$cached"
+    rm -f "$tmp_cached"
+}
+
 get_parrot(){
-    curl --retry 5 -o parrot_static_run http://download.virtualclusters.org/builder-files/parrot_static_run_v7.0.11
-    if [ -e "parrot_static_run" ]; then
-        chmod +x parrot_static_run
-    else
+    local parrot="$_CONDOR_SCRATCH_DIR/parrot_static_run"
+    local cached="$node_cache_dir/$reana_parrot_sha256/parrot_static_run"
+    if checksum_matches "$parrot"; then
+        chmod +x "$parrot"
+        cache_parrot "$parrot"
+        return 0
+    fi
+    for candidate in "$cached" "$reana_parrot_path"; do
+        if checksum_matches "$candidate"; then
+            cp "$candidate" "$parrot" && chmod +x "$parrot"
+            cache_parrot "$parrot"
+            return 0
+        fi
+    done
+    rm -f "$parrot"
+    curl --retry 5 -o "$parrot" "$parrot_url"
+    if [ ! -e "$parrot" ]; then
         echo "[Error] Could not download parrot" >&2
         exit 210
     fi
+    if [ -n "$reana_parrot_sha256" ] && ! checksum_matches "$parrot"; then
+        echo "[Error] Checksum of the downloaded parrot does not match" >&2
+        exit 210
+    fi
+    chmod +x "$parrot"
+    cache_parrot "$parrot"
+}
+
+# The controller transfers a manifest of the workflow directory with the job,
+# one "<sha256><TAB><size><TAB><relative path>" line per file. Only the files
+# it lists are staged in, and only the files which are new or whose content
+# differs from it are staged out. Without manifest, the whole workflow
+# directory is copied in both directions.
+# Staged in files are cached on this node under their checksum, so the next
+# jobs of the node only transfer the content it does not have yet. Cached
+# files unused for REANA_NODE_CACHE_MAX_AGE days are removed.
+input_manifest="$_CONDOR_SCRATCH_DIR/reana_input_manifest.tsv"
+stage_in_stamp="$_CONDOR_SCRATCH_DIR/.reana_stage_in_stamp"
+files_cache_dir="$node_cache_dir/files"
+files_cache_max_age="${REANA_NODE_CACHE_MAX_AGE:-7}"
+files_cache_max_file_size="${REANA_NODE_CACHE_MAX_FILE_SIZE:-1073741824}"
+
+# Copy the files listed in a file, one relative path per line, from a
+# directory to another one. Run under parrot, so one parrot serves all files.
+# Files removed from the workspace since the manifest was built are skipped.
+copy_listed_files='
+while IFS= read -r path; do
+    [ -e "$1/$path" ] || continue
+    mkdir -p "$(dirname "$2/$path")" && cp "$1/$path" "$2/$path" || exit 1
+done < "$3"
+'
+
+# Copy the files of the manifest cached on this node to the workflow
+# directory and write the relative paths of the ones to transfer.
+copy_cached_files(){
+    local sha256 size path cached target
+    mkdir -p "$files_cache_dir" 2>/dev/null && \
+        find "$files_cache_dir" -type f -mtime +"$files_cache_max_age" -delete 2>/dev/null
+    while IFS=$'\t' read -r sha256 size path; do
+        cached="$files_cache_dir/$sha256"
+        target="$_CONDOR_SCRATCH_DIR/$reana_workflow_dir/$path"
+        if [ -r "$cached" ] && mkdir -p "$(dirname "$target")" && \
+                cp --reflink=auto "$cached" "$target" 2>/dev/null; then
+            touch "$cached"
+        else
+            echo "$path"
+        fi
+    done < "$input_manifest"
+}
+
+# Cache on this node the staged in files which are not cached yet, once
+# their content is checked against the manifest.
+cache_input_files(){
+    local sha256 size path cached tmp_cached
+    [ -d "$files_cache_dir" ] || return 0
+    cd "$_CONDOR_SCRATCH_DIR/$reana_workflow_dir" || return 0
+    while IFS=$'\t' read -r sha256 size path; do
+        cached="$files_cache_dir/$sha256"
+        if [ -e "$cached" ] || [ "$size" -gt "$files_cache_max_file_size" ]; then
+            continue
+        fi
+        echo "$sha256  $path" | sha256sum -c --status - 2>/dev/null || continue
+        tmp_cached=$(mktemp -p "$files_cache_dir") || return 0
+        cp --reflink=auto "$path" "$tmp_cached" && mv "$tmp_cached" "$cached"
+        rm -f "$tmp_cached"
+    done < "$input_manifest"
 }
 
 populate(){
-    if [ ! -x "$_CONDOR_SCRATCH_DIR/parrot_static_run" ]; then get_parrot; fi
+    if [ -n "$reana_parrot_sha256" ] || [ ! -x "$_CONDOR_SCRATCH_DIR/parrot_static_run" ]; then get_parrot; fi
     mkdir -p "$_CONDOR_SCRATCH_DIR/$reana_workflow_dir"
-    local parent="$(dirname $reana_workflow_dir)"
-    $_CONDOR_SCRATCH_DIR/parrot_static_run -T 30 cp --no-clobber -r "/chirp/CONDOR/$reana_workflow_dir" "$_CONDOR_SCRATCH_DIR/$parent"
+    if [ ! -r "$input_manifest" ]; then
+        local parent="$(dirname $reana_workflow_dir)"
+        $_CONDOR_SCRATCH_DIR/parrot_static_run -T 30 cp --no-clobber -r "/chirp/CONDOR/$reana_workflow_dir" "$_CONDOR_SCRATCH_DIR/$parent"
+        return
+    fi
+    local input_list
+    input_list=$(mktemp -p "$_CONDOR_SCRATCH_DIR")
+    (copy_cached_files) > "$input_list"
+    if [ -s "$input_list" ]; then
+        $_CONDOR_SCRATCH_DIR/parrot_static_run -T 30 /bin/bash -c "$copy_listed_files" stage_in \
+            "/chirp/CONDOR/$reana_workflow_dir" "$_CONDOR_SCRATCH_DIR/$reana_workflow_dir" "$input_list"
+        if [ $? != 0 ]; then
+            echo "[Error] Could not stage in the input files" >&2
+            exit 211
+        fi
+    fi
+    rm -f "$input_list"
+    (cache_input_files)
+    # Files modified after this point are checked against the manifest.
+    sleep 1
+    touch "$stage_in_stamp"
+}
+
+# Write the relative paths of the files of the workflow directory which are
+# not in the manifest or whose checksum differs from it.
+list_changed_files(){
+    declare -A input_sha256
+    local sha256 size path
+    while IFS=$'\t' read -r sha256 size path; do
+        input_sha256["$path"]="$sha256"
+    done < "$input_manifest"
+    cd "$_CONDOR_SCRATCH_DIR/$reana_workflow_dir" || return 1
+    find . -type f -print | sed 's|^\./||' | while IFS= read -r path; do
+        if [ -z "${input_sha256[$path]+x}" ]; then
+            echo "$path"
+        elif [ "$path" -nt "$stage_in_stamp" ] && \
+                ! echo "${input_sha256[$path]}  $path" | sha256sum -c --status - 2>/dev/null; then
+            echo "$path"
+        fi
+    done
+}
+
+# Get the SIF file of the image converted by the controller, if any. It is
+# read from the shared volume if mounted, otherwise copied once per node.
+get_image(){
+    [ -n "$reana_singularity_image" ] || return 1
+    local cached="$node_cache_dir/images/$(basename "$reana_singularity_image")"
+    if [ -r "$cached" ]; then
+        image_path="$cached"
+        return 0
+    fi
+    if [ -r "$reana_singularity_image" ]; then
+        image_path="$reana_singularity_image"
+        return 0
+    fi
+    mkdir -p "$(dirname "$cached")" 2>/dev/null || return 1
+    local tmp_cached
+    tmp_cached=$(mktemp -p "$(dirname "$cached")") || return 1
+    if $_CONDOR_SCRATCH_DIR/parrot_static_run -T 30 cp "/chirp/CONDOR/$reana_singularity_image" "$tmp_cached" && \
+            mv "$tmp_cached" "$cached"; then
+        image_path="$cached"
+        return 0
+    fi
+    rm -f "$tmp_cached"
+    return 1
 }
 
 find_module(){
@@ -86,10 +250,11 @@ find_container(){
 # @TODO: This should be done in a prologue
 # in condor via +PreCmd, eventually.
 #############################
-# Send cache to $SCRATCH or to the condor scratch directory
-# otherwise
+# Send cache to $SCRATCH or to the cache of this node
+# otherwise, so the jobs of the node share the pulled images.
 if [ "x$SCRATCH" == "x" ]; then
-    export SINGULARITY_CACHEDIR="$_CONDOR_SCRATCH_DIR"
+    export SINGULARITY_CACHEDIR="$node_cache_dir/singularity"
+    mkdir -p "$SINGULARITY_CACHEDIR" 2>/dev/null || export SINGULARITY_CACHEDIR="$_CONDOR_SCRATCH_DIR"
 else
     export SINGULARITY_CACHEDIR="$SCRATCH"
 fi
@@ -101,6 +266,20 @@ if [ $? != 0 ]; then
 fi
 populate
 
+# Run the converted image instead of pulling it.
+if get_image; then
+    args=()
+    for arg in "$@"; do
+        if [ -z "$image_replaced" ] && [[ "$arg" == docker://* ]]; then
+            args+=("$image_path")
+            image_replaced=1
+        else
+            args+=("$arg")
+        fi
+    done
+    set -- "${args[@]}"
+fi
+
 ######## Execution ##########
 # exec "$singularity_path" "$@"
 # Note: Double quoted arguments are broken
@@ -139,8 +318,25 @@ if [ "x$reana_workflow_dir" == "x" ]; then
     exit $res
 fi
 
-parent="$(dirname $reana_workflow_dir)"
-# TODO: Check for parrot exit code and propagate it in case of errors.
-./parrot_static_run -T 30 cp --no-clobber -r "$_CONDOR_SCRATCH_DIR/$reana_workflow_dir" "/chirp/CONDOR/$parent"
+if [ ! -r "$input_manifest" ]; then
+    parent="$(dirname $reana_workflow_dir)"
+    # TODO: Check for parrot exit code and propagate it in case of errors.
+    ./parrot_static_run -T 30 cp --no-clobber -r "$_CONDOR_SCRATCH_DIR/$reana_workflow_dir" "/chirp/CONDOR/$parent"
+    exit $res
+fi
+
+output_list=$(mktemp -p "$_CONDOR_SCRATCH_DIR")
+(list_changed_files) > "$output_list"
+if [ -s "$output_list" ]; then
+    ./parrot_static_run -T 30 /bin/bash -c "$copy_listed_files" stage_out \
+        "$_CONDOR_SCRATCH_DIR/$reana_workflow_dir" "/chirp/CONDOR/$reana_workflow_dir" "$output_list"
+    if [ $? != 0 ]; then
+        echo "[Error] Could not stage out the output files" >&2
+        exit 212
+    fi
+else
+    echo "[Info]: Nothing to stage out"
+fi
+rm -f "$output_list"
 
 exit $res
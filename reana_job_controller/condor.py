@@ -8,11 +8,13 @@
 
 """HTCondor wrapper. Utilize libfactory's htcondorlib for job submission"""
 
+import heapq
 import re
 import json
 import logging
 import os
 import sys
+import tempfile
 import time
 import threading
 import traceback
@@ -25,9 +27,15 @@ from flask import current_app as app
 from reana_db.database import Session
 from reana_db.models import Job
 
+from reana_job_controller import config
 from reana_job_controller.errors import ComputingBackendSubmissionError
 from reana_job_controller.htcondor_job_manager import HTCondorJobManager
-from reana_job_controller.htcondor_job_manager import get_schedd
+from reana_job_controller.htcondor_job_manager import (
+    SCHEDD_CACHE, build_condor_job_constraint, get_output_paths,
+    parse_condor_job_id)
+from reana_job_controller.job_db import mark_job_deleted_in_db
+from reana_job_controller.job_logs import stream_condor_job_output
+from reana_job_controller.log_storage import save_job_logs
 
 condorJobStatus = {
     'Unexpanded': 0,
@@ -39,58 +47,542 @@ condorJobStatus = {
     'Submission_Error': 6
 }
 
+
+def build_clusters_constraint(cluster_ids):
+    """Build a ClassAd constraint matching several HTCondor clusters.
+
+    :param cluster_ids: Iterable of HTCondor cluster IDs.
+    :returns: ClassAd expression as a string.
+    """
+    return 'member(ClusterId, {{{0}}})'.format(
+        ', '.join(str(cluster_id) for cluster_id in sorted(cluster_ids)))
+
+
+def build_jobs_constraint(condor_job_ids):
+    """Build a ClassAd constraint matching exactly several HTCondor jobs.
+
+    :param condor_job_ids: Iterable of ``(cluster, proc)`` tuples.
+    :returns: ClassAd expression as a string.
+    """
+    procs = {}
+    for cluster_id, proc_id in condor_job_ids:
+        procs.setdefault(cluster_id, set()).add(proc_id)
+    # Jobs which are alone in their cluster are matched all together.
+    single_clusters = [cluster_id for cluster_id, proc_ids in procs.items()
+                       if proc_ids == {0}]
+    clauses = []
+    if single_clusters:
+        clauses.append('{0} && ProcId == 0'.format(
+            build_clusters_constraint(single_clusters)))
+    for cluster_id, proc_ids in sorted(procs.items()):
+        if proc_ids != {0}:
+            clauses.append('ClusterId == {0} && member(ProcId, {{{1}}})'
+                           .format(cluster_id,
+                                   ', '.join(str(proc_id)
+                                             for proc_id in sorted(proc_ids))))
+    return ' || '.join('({0})'.format(clause) for clause in clauses)
+
+
+def query_condor_jobs(schedd, condor_job_ids):
+    """Query the status of several HTCondor jobs at once.
+
+    Jobs still in the queue are retrieved with a single queue query, only
+    the ones which already left it are looked up, all together, in the
+    schedd history.
+
+    :param schedd: htcondor schedd object.
+    :param condor_job_ids: Iterable of ``(cluster, proc)`` tuples.
+    :returns: Dictionary mapping ``(cluster, proc)`` tuples to the job
+        ClassAds.
+    """
+    ads = ['ClusterId', 'ProcId', 'JobStatus', 'ExitCode']
+    condor_job_ids = list(condor_job_ids)
+    condor_jobs = {}
+    for condor_job in schedd.xquery(
+            build_clusters_constraint(set(
+                cluster_id for cluster_id, _ in condor_job_ids)), ads):
+        condor_jobs[(condor_job['ClusterId'],
+                     condor_job.get('ProcId', 0))] = condor_job
+    left_queue = [condor_job_id for condor_job_id in condor_job_ids
+                  if condor_job_id not in condor_jobs]
+    if left_queue:
+        for condor_job in schedd.history(
+                build_jobs_constraint(left_queue), ads, len(left_queue)):
+            condor_jobs.setdefault((condor_job['ClusterId'],
+                                    condor_job.get('ProcId', 0)), condor_job)
+    return {condor_job_id: condor_jobs[condor_job_id]
+            for condor_job_id in condor_job_ids
+            if condor_job_id in condor_jobs}
+
+
+def retrieve_condor_job_id(job_db, cluster_id, proc_id=0):
+    """Get the ID of the job corresponding to an HTCondor job.
+
+    :param job_db: :class:`JobStore` which contains all current jobs.
+    :param cluster_id: HTCondor cluster ID.
+    :param proc_id: HTCondor process ID.
+    :returns: ID of the job, or None if the job is not followed.
+    """
+    # Items of job arrays are ``cluster.proc``, other jobs ``cluster``.
+    return job_db.retrieve_job_id_by_backend_job_id(
+        '{0}.{1}'.format(cluster_id, proc_id)) or \
+        job_db.retrieve_job_id_by_backend_job_id(cluster_id)
+
+
+def store_condor_job_logs(job_db, job_id, backend_job_id):
+    """Store the output of a finished HTCondor job and remove its files.
+
+    Only the end of stdout and stderr, up to ``HTCONDOR_JOB_LOGS_MAX_SIZE``
+    bytes each, is read. The files are removed even if the output could not
+    be stored after ``HTCONDOR_JOB_LOGS_STORE_ATTEMPTS`` attempts, so they do
+    not pile up.
+
+    :param job_db: :class:`JobStore` which contains all current jobs.
+    :param job_id: ID of the job.
+    :param backend_job_id: HTCondor job ID, ``cluster`` or ``cluster.proc``.
+    """
+    for attempt in range(config.HTCONDOR_JOB_LOGS_STORE_ATTEMPTS):
+        try:
+            save_job_logs(job_db, job_id,
+                          stream_condor_job_output(backend_job_id))
+            break
+        except Exception as e:
+            logging.debug('Could not store logs of job job_id: {0}, '
+                          'condor_job_id: {1}'.format(job_id, backend_job_id))
+            logging.debug('Exception: {}'.format(str(e)))
+    else:
+        logging.warning('Logs of job job_id: {0}, condor_job_id: {1} could '
+                        'not be stored, they are lost.'.format(
+                            job_id, backend_job_id))
+    for path in get_output_paths(*parse_condor_job_id(backend_job_id)):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.warning('Could not remove output file {0} of job '
+                            'job_id: {1}: {2}'.format(path, job_id, e))
+
+
+def process_condor_job(job_db, job_id, condor_job):
+    """Update the job DB according to the ClassAd of an HTCondor job.
+
+    :param job_db: :class:`JobStore` which contains all current jobs.
+    :param job_id: ID of the job.
+    :param condor_job: ClassAd of the corresponding HTCondor job.
+    :returns: Whether the job is finished.
+    """
+    backend_job_id = job_db[job_id].backend_job_id
+    if condor_job['JobStatus'] == condorJobStatus['Completed']:
+        if condor_job.get('ExitCode') == 0:
+            job_db.update(job_id, status='succeeded')
+        else:
+            logging.info('Job job_id: {0}, condor_job_id: {1} failed'.format(
+                job_id, backend_job_id))
+            job_db.update(job_id, status='failed')
+    elif condor_job['JobStatus'] == condorJobStatus['Removed']:
+        logging.info('Job job_id: {0}, condor_job_id: {1} was '
+                     'removed'.format(job_id, backend_job_id))
+        job_db.update(job_id, status='failed')
+    elif condor_job['JobStatus'] == condorJobStatus['Held']:
+        logging.info('Job was held, will delete and set as failed')
+        condor_delete_job(backend_job_id)
+        job_db.update(job_id, status='failed')
+    else:
+        return False
+    store_condor_job_logs(job_db, job_id, backend_job_id)
+    job_db.update(job_id, deleted=True)
+    mark_job_deleted_in_db(job_id)
+    return True
+
+
+def fail_missing_condor_job(job_db, job_id, condor_job_id):
+    """Mark as failed a job which is neither in the queue nor in history.
+
+    :param job_db: :class:`JobStore` which contains all current jobs.
+    :param job_id: ID of the job.
+    :param condor_job_id: Tuple with the HTCondor cluster and process IDs.
+    """
+    job_db.update(job_id, status='failed')
+    store_condor_job_logs(job_db, job_id, '{0}.{1}'.format(*condor_job_id))
+    job_db.update(job_id, deleted=True)
+    mark_job_deleted_in_db(job_id)
+
+
+class CondorPollScheduler(object):
+    """Priority queue deciding when each HTCondor job is polled next.
+
+    Young jobs are checked often, so that short jobs are noticed quickly,
+    while the interval between checks grows with the age of the job up to
+    ``HTCONDOR_POLL_MAX_INTERVAL``. Jobs missing from the schedd are checked
+    again with an exponential backoff, capped at the same interval.
+    """
+
+    IDLE_AGE_FACTOR = 0.5
+    """Fraction of its age an idle job waits before its next check."""
+
+    RUNNING_AGE_FACTOR = 0.25
+    """Fraction of its age a running job waits before its next check."""
+
+    def __init__(self):
+        """Instantiate an empty scheduler."""
+        self.heap = []
+        self.jobs = {}
+
+    def __contains__(self, cluster_id):
+        """Check whether a job is scheduled."""
+        return cluster_id in self.jobs
+
+    def __len__(self):
+        """Return the number of scheduled jobs."""
+        return len(self.jobs)
+
+    def get_job_id(self, cluster_id):
+        """Get the job ID of a scheduled HTCondor job."""
+        return self.jobs[cluster_id]['job_id']
+
+    def next_interval(self, age, job_status=None, misses=0):
+        """Compute the number of seconds to wait before the next check.
+
+        :param age: Seconds since the job was first scheduled.
+        :param job_status: Last seen HTCondor ``JobStatus``, if any.
+        :param misses: Number of checks in a row the job was not found.
+        """
+        if job_status == condorJobStatus['Idle']:
+            interval = age * self.IDLE_AGE_FACTOR
+        elif job_status is None:
+            interval = config.HTCONDOR_POLL_MIN_INTERVAL * 2 ** misses
+        else:
+            interval = age * self.RUNNING_AGE_FACTOR
+        return min(max(interval, config.HTCONDOR_POLL_MIN_INTERVAL),
+                   config.HTCONDOR_POLL_MAX_INTERVAL)
+
+    def add(self, cluster_id, job_id, now):
+        """Start polling an HTCondor job.
+
+        :param cluster_id: HTCondor cluster ID.
+        :param job_id: ID of the job.
+        :param now: Current timestamp.
+        """
+        self.jobs[cluster_id] = {'job_id': job_id, 'first_seen': now,
+                                 'misses': 0}
+        self.schedule(cluster_id, now)
+
+    def schedule(self, cluster_id, now, job_status=None):
+        """Set the next check deadline of a job.
+
+        :param cluster_id: HTCondor cluster ID.
+        :param now: Current timestamp.
+        :param job_status: Last seen HTCondor ``JobStatus``, if any.
+        """
+        job = self.jobs[cluster_id]
+        if job_status is not None:
+            job['misses'] = 0
+        age = now - job['first_seen']
+        job['deadline'] = now + self.next_interval(age, job_status,
+                                                   job['misses'])
+        heapq.heappush(self.heap, (job['deadline'], cluster_id))
+
+    def schedule_missing(self, cluster_id, now):
+        """Check again later a job which the schedd does not know about.
+
+        :param cluster_id: HTCondor cluster ID.
+        :param now: Current timestamp.
+        :returns: Number of checks in a row the job was not found.
+        """
+        job = self.jobs[cluster_id]
+        job['misses'] += 1
+        self.schedule(cluster_id, now)
+        return job['misses']
+
+    def remove(self, cluster_id):
+        """Stop polling an HTCondor job."""
+        self.jobs.pop(cluster_id, None)
+
+    def pop_due(self, now):
+        """Pop the jobs whose check deadline has passed.
+
+        :param now: Current timestamp.
+        :returns: List of HTCondor cluster IDs.
+        """
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            deadline, cluster_id = heapq.heappop(self.heap)
+            job = self.jobs.get(cluster_id)
+            # Skip entries of removed or rescheduled jobs.
+            if job and job['deadline'] == deadline:
+                due.append(cluster_id)
+        return due
+
+    def next_deadline(self):
+        """Get the earliest check deadline, if any job is scheduled."""
+        while self.heap:
+            deadline, cluster_id = self.heap[0]
+            job = self.jobs.get(cluster_id)
+            if job and job['deadline'] == deadline:
+                return deadline
+            heapq.heappop(self.heap)
+        return None
+
+
 def condor_watch_jobs(job_db):
     """Watch currently running HTCondor jobs.
-    :param job_db: Dictionary which contains all current jobs.
+
+    :param job_db: :class:`JobStore` which contains all current jobs.
     """
-    schedd = get_schedd()
-    ads = ['ClusterId', 'JobStatus', 'ExitCode']
+    scheduler = CondorPollScheduler()
     while True:
-        logging.debug('Starting a new stream request to watch Condor Jobs')
+        try:
+            now = time.time()
+            for backend_job_id, job_id in job_db.unfinished_jobs():
+                condor_job_id = parse_condor_job_id(backend_job_id)
+                if condor_job_id is None:
+                    # Not an HTCondor job ID.
+                    continue
+                if condor_job_id not in scheduler and job_id in job_db:
+                    scheduler.add(condor_job_id, job_id, now)
+            due = scheduler.pop_due(now)
+            if due:
+                logging.debug('Checking status of {0} Condor jobs'.format(
+                    len(due)))
+                try:
+                    condor_jobs = query_condor_jobs(SCHEDD_CACHE.get(), due)
+                except Exception:
+                    # Check the jobs again with a new connection.
+                    SCHEDD_CACHE.invalidate()
+                    for condor_job_id in due:
+                        scheduler.schedule(condor_job_id, now)
+                    raise
+                for condor_job_id in due:
+                    job_id = scheduler.get_job_id(condor_job_id)
+                    condor_job = condor_jobs.get(condor_job_id)
+                    job = job_db.get(job_id)
+                    if job is None or job.deleted or (
+                            condor_job and
+                            process_condor_job(job_db, job_id, condor_job)):
+                        scheduler.remove(condor_job_id)
+                    elif condor_job:
+                        scheduler.schedule(condor_job_id, now,
+                                           condor_job['JobStatus'])
+                    elif scheduler.schedule_missing(condor_job_id, now) >= \
+                            config.HTCONDOR_POLL_MAX_MISSES:
+                        logging.warning(
+                            'Job {0} not found in the schedd, will set as '
+                            'failed'.format(job_id))
+                        fail_missing_condor_job(job_db, job_id,
+                                                condor_job_id)
+                        scheduler.remove(condor_job_id)
+        except Exception as e:
+            logging.error(traceback.format_exc())
+            logging.debug("Unexpected error: {}".format(e))
+
+        # Wake up for the next deadline, but often enough to start polling
+        # newly submitted jobs quickly.
+        next_deadline = scheduler.next_deadline()
+        sleep_time = config.HTCONDOR_POLL_MIN_INTERVAL
+        if next_deadline is not None:
+            sleep_time = min(sleep_time, next_deadline - time.time())
+        time.sleep(max(sleep_time, 1))
+
+
+class CondorJobEventLogReader(object):
+    """Incremental reader of an HTCondor job event log.
+
+    The position up to which events have been consumed is saved next to the
+    log, so a restarted controller resumes where the previous one stopped.
+    """
+
+    EVENT_SEPARATOR = b'...\n'
+    """Line terminating every event in the log."""
+
+    MAX_READ_SIZE = 8 * 1024 * 1024
+    """Maximum number of bytes read from the log at once."""
+
+    MAX_EVENT_ATTEMPTS = 5
+    """Number of times an event is processed before it is skipped."""
+
+    def __init__(self, path):
+        """Instantiate reader.
+
+        :param path: Path of the HTCondor job event log.
+        """
+        self.path = path
+        self.offset_path = '{0}.offset'.format(path)
+        self.offset = 0
+        self.read_size = 0
+        self.consumed_events = 0
+        self.failed_attempts = 0
+        if os.path.exists(self.offset_path):
+            with open(self.offset_path) as f:
+                self.offset = int(f.read().strip() or 0)
+
+    def consume_event(self):
+        """Mark the first event not consumed yet as processed."""
+        self.consumed_events += 1
+        self.failed_attempts = 0
+
+    def save_offset(self):
+        """Consume all the events read and persist the position after them."""
+        if not self.read_size:
+            return
+        self.offset += self.read_size
+        self.read_size = 0
+        self.consumed_events = 0
+        tmp_offset_path = '{0}.tmp'.format(self.offset_path)
+        with open(tmp_offset_path, 'w') as f:
+            f.write(str(self.offset))
+        os.rename(tmp_offset_path, self.offset_path)
 
-        for job_id, job_dict in job_db.items():
-            if job_db[job_id]['deleted']:
-                continue
-            condor_it = schedd.history('ClusterId == {0}'.format(
-                job_dict['backend_job_id']), ads, match=1)
+    def read_events(self):
+        """Read the events written since the last consumed one.
+
+        Call :meth:`consume_event` after processing each event, and
+        :meth:`save_offset` once all of them have been processed. The events
+        not consumed are returned again by the next call.
+
+        :returns: List of :class:`htcondor.JobEvent`.
+        """
+        if not os.path.exists(self.path):
+            return []
+        if os.path.getsize(self.path) < self.offset:
+            logging.info('HTCondor job event log {0} was truncated, reading '
+                         'it from the beginning.'.format(self.path))
+            self.offset = 0
+            self.consumed_events = 0
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read(self.MAX_READ_SIZE)
+        # Only consume complete events, partially written ones are read on
+        # the next call.
+        end = data.rfind(self.EVENT_SEPARATOR)
+        if end == -1:
+            return []
+        chunk = data[:end + len(self.EVENT_SEPARATOR)]
+        with tempfile.NamedTemporaryFile() as chunk_file:
+            chunk_file.write(chunk)
+            chunk_file.flush()
             try:
-                condor_job = next(condor_it)
-            except:
-                # Did not match to any job in the history queue yet
-                continue
-            if condor_job['JobStatus'] == condorJobStatus['Completed']:
-                if condor_job['ExitCode'] == 0:
-                    job_db[job_id]['status'] = 'succeeded'
-                else:
-                    logging.info(
-                        'Job job_id: {0}, condor_job_id: {1} failed'.format(
-                            job_id, condor_job['ClusterId']))
-                    job_db[job_id]['status'] = 'failed'
-                # @todo: Grab/Save logs when job either succeeds or fails.
-                job_db[job_id]['deleted'] = True
-            elif condor_job['JobStatus'] == condorJobStatus['Held']:
-                logging.info('Job Was held, will delette and set as failed')
-                CondorJobManager.condor_delete_job(condor_job['ClusterId'])
-                job_db[job_id]['deleted'] == True
-             
-        time.sleep(120)
+                events = list(
+                    htcondor.JobEventLog(chunk_file.name).events(0))
+            except OSError as e:
+                # Skip malformed events instead of failing on them forever.
+                logging.error('Could not parse HTCondor job event log {0} '
+                              'at offset {1}: {2}'.format(self.path,
+                                                          self.offset, e))
+                events = []
+        self.read_size = len(chunk)
+        return events[self.consumed_events:]
+
+
+def process_condor_event(job_db, event):
+    """Update the job DB according to an HTCondor job event.
+
+    :param job_db: :class:`JobStore` which contains all current jobs.
+    :param event: :class:`htcondor.JobEvent`.
+    """
+    job_id = retrieve_condor_job_id(job_db, event.cluster, event.proc)
+    if not job_db.get(job_id):
+        # Ignore jobs not created by this specific instance or already
+        # finished jobs.
+        return
+    backend_job_id = job_db[job_id].backend_job_id
+    if event.type == htcondor.JobEventType.JOB_TERMINATED:
+        if event.get('TerminatedNormally') and \
+                event.get('ReturnValue') == 0:
+            job_db.update(job_id, status='succeeded')
+        else:
+            logging.info('Job job_id: {0}, condor_job_id: {1} failed'.format(
+                job_id, backend_job_id))
+            job_db.update(job_id, status='failed')
+    elif event.type == htcondor.JobEventType.JOB_ABORTED:
+        logging.info('Job job_id: {0}, condor_job_id: {1} was removed'.format(
+            job_id, backend_job_id))
+        job_db.update(job_id, status='failed')
+    elif event.type == htcondor.JobEventType.JOB_HELD:
+        logging.info('Job was held, will delete and set as failed')
+        condor_delete_job(backend_job_id)
+        job_db.update(job_id, status='failed')
+    elif event.type == htcondor.JobEventType.JOB_EVICTED:
+        job = job_db.update(job_id,
+                            restart_count=job_db[job_id].restart_count + 1)
+        if job.restart_count < job.max_restart_count:
+            logging.info('Job job_id: {0}, condor_job_id: {1} was evicted, '
+                         'it will be rescheduled'.format(job_id,
+                                                         backend_job_id))
+            return
+        logging.info('Job job_id: {0}, condor_job_id: {1} was evicted too '
+                     'many times, will delete and set as failed'.format(
+                         job_id, backend_job_id))
+        condor_delete_job(backend_job_id)
+        job_db.update(job_id, status='failed')
+    else:
+        return
+    store_condor_job_logs(job_db, job_id, backend_job_id)
+    job_db.update(job_id, deleted=True)
+    mark_job_deleted_in_db(job_id)
+
+
+def condor_watch_jobs_event_log(job_db, event_log_path):
+    """Watch HTCondor jobs following their job event log.
+
+    :param job_db: :class:`JobStore` which contains all current jobs.
+    :param event_log_path: Path of the job event log the jobs write to.
+    """
+    reader = CondorJobEventLogReader(event_log_path)
+    while True:
+        try:
+            process_condor_event_log(job_db, reader)
+        except Exception as e:
+            logging.error(traceback.format_exc())
+            logging.debug("Unexpected error: {}".format(e))
+
+        time.sleep(config.HTCONDOR_EVENT_LOG_READ_INTERVAL)
+
+
+def process_condor_event_log(job_db, reader):
+    """Process the events written to the job event log since the last call.
+
+    An event which can not be processed stops the processing, it is
+    processed again with the following events on the next call. It is
+    skipped after ``MAX_EVENT_ATTEMPTS`` failures.
+
+    :param job_db: :class:`JobStore` which contains all current jobs.
+    :param reader: :class:`CondorJobEventLogReader` of the job event log.
+    """
+    for event in reader.read_events():
+        try:
+            process_condor_event(job_db, event)
+        except Exception:
+            logging.error(traceback.format_exc())
+            reader.failed_attempts += 1
+            if reader.failed_attempts < reader.MAX_EVENT_ATTEMPTS:
+                return
+            logging.error('Skipping HTCondor event of job {0}.{1} after {2} '
+                          'failed attempts.'.format(event.cluster, event.proc,
+                                                    reader.failed_attempts))
+        reader.consume_event()
+    reader.save_offset()
+
 
 def condor_delete_job(job, asynchronous=True):
     """Delete HTCondor job.
 
-    :param job: The :string: HTCondor cluster ID of the job to be removed.
+    :param job: The :string: HTCondor job ID of the job to be removed,
+        ``cluster`` or ``cluster.proc``.
     :param asynchronous: Place holder for comparison to k8s.
     """
+    SCHEDD_CACHE.act(htcondor.JobAction.Remove,
+                     build_condor_job_constraint(job))
 
-    schedd = get_schedd()
-    schedd.act(htcondor.JobAction.Remove, 'ClusterID==%d' % job)
 
 def start_watch_jobs_thread(JOB_DB):
     """Watch changes on jobs within HTCondor."""
-
-    job_event_reader_thread = threading.Thread(target=condor_watch_jobs,
-                                               args=(JOB_DB,))
+    if config.HTCONDOR_JOB_EVENT_LOG:
+        job_event_reader_thread = threading.Thread(
+            target=condor_watch_jobs_event_log,
+            args=(JOB_DB, config.HTCONDOR_JOB_EVENT_LOG))
+    else:
+        job_event_reader_thread = threading.Thread(target=condor_watch_jobs,
+                                                   args=(JOB_DB,))
     job_event_reader_thread.daemon = True
     job_event_reader_thread.start()
-
-
@@ -18,3 +18,238 @@ SHARED_VOLUME_PATH_ROOT = os.getenv('SHARED_VOLUME_PATH_ROOT', '/var/reana')
 
 JOB_BACKENDS = ['Kubernetes','HTCondor']
 """Supported job backends."""
+
+BATCH_SUBMISSION_WORKERS = int(os.getenv('BATCH_SUBMISSION_WORKERS', 16))
+"""Number of concurrent backend requests used by batch job submission."""
+
+HTCONDOR_JOB_EVENT_LOG = os.getenv('HTCONDOR_JOB_EVENT_LOG', '')
+"""Job event log shared by the HTCondor jobs submitted by this controller.
+
+If set, the HTCondor watcher follows this log instead of polling the schedd.
+"""
+
+HTCONDOR_EVENT_LOG_READ_INTERVAL = int(
+    os.getenv('HTCONDOR_EVENT_LOG_READ_INTERVAL', 5))
+"""Seconds to wait between reads of the HTCondor job event log."""
+
+HTCONDOR_SCHEDD_HEALTH_CHECK_INTERVAL = int(
+    os.getenv('HTCONDOR_SCHEDD_HEALTH_CHECK_INTERVAL', 60))
+"""Seconds after which a cached schedd connection is checked before use."""
+
+HTCONDOR_SUBMISSION_HELPERS = int(os.getenv('HTCONDOR_SUBMISSION_HELPERS', 2))
+"""Number of helper processes submitting jobs to HTCondor."""
+
+HTCONDOR_SUBMISSION_TIMEOUT = int(
+    os.getenv('HTCONDOR_SUBMISSION_TIMEOUT', 300))
+"""Seconds to wait for a submission helper, which is restarted after."""
+
+HTCONDOR_JOB_WRAPPER = os.getenv('HTCONDOR_JOB_WRAPPER',
+                                 '/code/files/job_wrapper.sh')
+"""Wrapper script running the HTCondor jobs."""
+
+HTCONDOR_PARROT_URL = os.getenv(
+    'HTCONDOR_PARROT_URL', 'http://download.virtualclusters.org/'
+    'builder-files/parrot_static_run_v7.0.11')
+"""Download location of the static parrot binary used by the job wrapper."""
+
+HTCONDOR_PARROT_PATH = os.getenv('HTCONDOR_PARROT_PATH', '')
+"""Local copy of the static parrot binary. If set, it is not downloaded."""
+
+JOB_FILES_PATH = os.getenv(
+    'JOB_FILES_PATH', os.path.join(SHARED_VOLUME_PATH_ROOT, 'job-files'))
+"""Directory where the files needed by the jobs are published."""
+
+INPUT_MANIFEST_BUILD_WORKERS = int(
+    os.getenv('INPUT_MANIFEST_BUILD_WORKERS', 2))
+"""Number of threads building the input manifests of the HTCondor jobs."""
+
+INPUT_MANIFEST_BUILD_TIMEOUT = float(
+    os.getenv('INPUT_MANIFEST_BUILD_TIMEOUT', 5))
+"""Seconds a submission waits for the input manifest of its workspace. If
+it is not ready, the job copies the whole workspace."""
+
+INPUT_MANIFEST_MAX_AGE = int(
+    os.getenv('INPUT_MANIFEST_MAX_AGE', 7 * 24 * 3600))
+"""Seconds after which a published input manifest no job was submitted with
+is removed."""
+
+SINGULARITY_IMAGE_CACHE_PATH = os.getenv('SINGULARITY_IMAGE_CACHE_PATH', '')
+"""Directory where the images of the HTCondor jobs are kept as SIF files,
+e.g. ``/var/reana/singularity-images``.
+
+If empty, the jobs pull their images themselves."""
+
+SINGULARITY_BUILD_COMMAND = os.getenv('SINGULARITY_BUILD_COMMAND',
+                                      'singularity')
+"""Singularity executable converting the images of the HTCondor jobs."""
+
+SINGULARITY_IMAGE_BUILD_WORKERS = int(
+    os.getenv('SINGULARITY_IMAGE_BUILD_WORKERS', 2))
+"""Maximum number of images converted to SIF files at the same time."""
+
+SINGULARITY_IMAGE_BUILD_TIMEOUT = int(
+    os.getenv('SINGULARITY_IMAGE_BUILD_TIMEOUT', 60 * 60))
+"""Seconds after which the conversion of an image is given up."""
+
+SINGULARITY_IMAGE_DIGEST_TTL = int(
+    os.getenv('SINGULARITY_IMAGE_DIGEST_TTL', 5 * 60))
+"""Seconds during which the digest an image tag resolved to is reused."""
+
+SINGULARITY_IMAGE_RESOLVE_WORKERS = int(
+    os.getenv('SINGULARITY_IMAGE_RESOLVE_WORKERS', 4))
+"""Number of threads resolving the image tags of the HTCondor jobs."""
+
+SINGULARITY_IMAGE_CACHE_MAX_AGE = int(
+    os.getenv('SINGULARITY_IMAGE_CACHE_MAX_AGE', 14 * 24 * 3600))
+"""Seconds after which a SIF file no job was submitted with is removed."""
+
+SINGULARITY_IMAGE_CACHE_MAX_SIZE = int(
+    os.getenv('SINGULARITY_IMAGE_CACHE_MAX_SIZE', 100 * 1024 ** 3))
+"""Maximum number of bytes of SIF files kept. The least recently used files
+are removed first. If 0, the size is not limited."""
+
+HTCONDOR_POLL_MIN_INTERVAL = int(os.getenv('HTCONDOR_POLL_MIN_INTERVAL', 10))
+"""Minimum number of seconds between two status checks of an HTCondor job."""
+
+HTCONDOR_POLL_MAX_INTERVAL = int(os.getenv('HTCONDOR_POLL_MAX_INTERVAL', 120))
+"""Maximum number of seconds between two status checks of an HTCondor job."""
+
+HTCONDOR_POLL_MAX_MISSES = int(os.getenv('HTCONDOR_POLL_MAX_MISSES', 5))
+"""Number of checks in a row an HTCondor job can be missing from the schedd
+queue and history before it is considered failed."""
+
+HTCONDOR_JOB_LOGS_MAX_SIZE = int(
+    os.getenv('HTCONDOR_JOB_LOGS_MAX_SIZE', 16 * 1024 * 1024))
+"""Maximum number of bytes kept from the end of the stdout and of the stderr
+of an HTCondor job."""
+
+HTCONDOR_JOB_LOGS_STORE_ATTEMPTS = int(
+    os.getenv('HTCONDOR_JOB_LOGS_STORE_ATTEMPTS', 3))
+"""Number of attempts to store the logs of an HTCondor job before its output
+files are removed anyway."""
+
+K8S_JOB_CONTROLLER_LABEL = 'reana-job-controller'
+"""Label identifying the Kubernetes jobs created by a job controller."""
+
+K8S_JOB_CONTROLLER_NAME = os.getenv('K8S_JOB_CONTROLLER_NAME', 'default')
+"""Value of ``K8S_JOB_CONTROLLER_LABEL`` for the jobs of this controller."""
+
+K8S_JOB_ARRAY_MAX_PARALLELISM = int(
+    os.getenv('K8S_JOB_ARRAY_MAX_PARALLELISM', 100))
+"""Maximum number of items of a job array running at once in Kubernetes."""
+
+K8S_JOB_ARRAY_TTL = int(os.getenv('K8S_JOB_ARRAY_TTL', 3600))
+"""Seconds after which Kubernetes deletes a finished job array."""
+
+K8S_JOB_COMPLETION_INDEX_ANNOTATION = \
+    'batch.kubernetes.io/job-completion-index'
+"""Annotation with the index of the pods of a Kubernetes Indexed Job."""
+
+K8S_JOB_ARRAY_ITEMS_PATH = '/etc/reana/job-array-items'
+"""Directory where the scripts of the items of a job array are mounted."""
+
+K8S_WATCH_BACKOFF_BASE = float(os.getenv('K8S_WATCH_BACKOFF_BASE', 1))
+"""Seconds to wait before watching Kubernetes jobs again after a failure,
+doubled after every further failure in a row."""
+
+K8S_WATCH_BACKOFF_MAX = float(os.getenv('K8S_WATCH_BACKOFF_MAX', 60))
+"""Maximum number of seconds to wait before watching Kubernetes jobs again."""
+
+K8S_FINALIZATION_WORKERS = int(os.getenv('K8S_FINALIZATION_WORKERS', 4))
+"""Number of threads collecting logs and cleaning up finished K8s jobs."""
+
+K8S_FINALIZATION_QUEUE_SIZE = int(
+    os.getenv('K8S_FINALIZATION_QUEUE_SIZE', 1000))
+"""Maximum number of finished K8s jobs waiting to be finalized."""
+
+K8S_FINALIZATION_MAX_ATTEMPTS = int(
+    os.getenv('K8S_FINALIZATION_MAX_ATTEMPTS', 5))
+"""Number of times the finalization of a finished K8s job is attempted."""
+
+K8S_FINALIZATION_RETRY_DELAY = float(
+    os.getenv('K8S_FINALIZATION_RETRY_DELAY', 10))
+"""Seconds to wait before finalizing a K8s job again after a failure,
+doubled after every further failure."""
+
+JOB_STORE_MAX_FINISHED_JOBS = int(
+    os.getenv('JOB_STORE_MAX_FINISHED_JOBS', 10000))
+"""Maximum number of finished jobs kept in memory."""
+
+JOB_STORE_FINISHED_JOB_TTL = int(
+    os.getenv('JOB_STORE_FINISHED_JOB_TTL', 24 * 60 * 60))
+"""Seconds a finished job is kept in memory after it was last accessed."""
+
+JOB_STATUS_MAX_WAIT = int(os.getenv('JOB_STATUS_MAX_WAIT', 60))
+"""Maximum number of seconds a request waits for a job status change."""
+
+JOB_EVENTS_REPLAY_SIZE = int(os.getenv('JOB_EVENTS_REPLAY_SIZE', 10000))
+"""Number of job status events kept for clients resuming their stream."""
+
+JOB_EVENTS_KEEPALIVE_INTERVAL = 15
+"""Seconds without events after which the event stream sends a keepalive."""
+
+WORKSPACE_HASH_CACHE_SIZE = int(os.getenv('WORKSPACE_HASH_CACHE_SIZE', 32))
+"""Number of workspaces whose file digests are kept to speed up hashing."""
+
+WORKSPACE_HASH_CACHE_MAX_DIGEST_SIZE = int(
+    os.getenv('WORKSPACE_HASH_CACHE_MAX_DIGEST_SIZE', 256 * 1024 * 1024))
+"""Maximum number of bytes of file digests kept to speed up hashing."""
+
+WORKSPACE_HASH_RESCAN_INTERVAL = float(
+    os.getenv('WORKSPACE_HASH_RESCAN_INTERVAL', 5))
+"""Seconds during which the file listing of a workspace is reused for the
+input manifests while no job changed status. Workspaces modified meanwhile
+by running jobs or other services are only noticed after this interval. The
+job cache lookups always check the workspace."""
+
+JOB_INPUT_HASH_CACHE_SIZE = int(os.getenv('JOB_INPUT_HASH_CACHE_SIZE', 10000))
+"""Number of job input hashes kept to speed up job cache lookups."""
+
+JOB_CACHE_BATCH_DELAY = float(os.getenv('JOB_CACHE_BATCH_DELAY', 0.2))
+"""Seconds to wait for other submitted jobs to share a workspace scan."""
+
+JOB_CACHE_BATCH_SIZE = 500
+"""Maximum number of job cache entries created in one transaction."""
+
+JOB_DB_GROUP_COMMIT_INTERVAL = float(
+    os.getenv('JOB_DB_GROUP_COMMIT_INTERVAL', 0))
+"""Seconds during which the DB rows of concurrently submitted jobs are
+grouped in one transaction. If 0, each job is committed on its own."""
+
+JOB_DB_GROUP_COMMIT_MAX_SIZE = int(
+    os.getenv('JOB_DB_GROUP_COMMIT_MAX_SIZE', 100))
+"""Maximum number of job DB rows committed in one transaction."""
+
+JOB_DB_GROUP_COMMIT_TIMEOUT = float(
+    os.getenv('JOB_DB_GROUP_COMMIT_TIMEOUT', 30))
+"""Seconds a job submission waits for its DB row to be committed."""
+
+JOB_DB_REHYDRATION_PAGE_SIZE = int(
+    os.getenv('JOB_DB_REHYDRATION_PAGE_SIZE', 1000))
+"""Number of unfinished jobs loaded at once from the DB on startup."""
+
+JOB_DB_REHYDRATION_MAX_AGE = int(
+    os.getenv('JOB_DB_REHYDRATION_MAX_AGE', 7 * 24 * 60 * 60))
+"""Seconds after their creation unfinished jobs are not loaded on startup
+anymore. Older rows are left over by job controllers which did not record
+the end of the jobs."""
+
+JOB_DB_REHYDRATION_MAX_JOBS = int(
+    os.getenv('JOB_DB_REHYDRATION_MAX_JOBS', 10000))
+"""Maximum number of unfinished jobs loaded from the DB on startup."""
+
+JOB_LOGS_CHUNK_SIZE = 64 * 1024
+"""Number of bytes read at once when streaming job logs."""
+
+JOB_LOGS_FOLLOW_INTERVAL = 1
+"""Seconds to wait for new output when following job logs."""
+
+JOB_LOGS_STORAGE_PATH = os.getenv(
+    'JOB_LOGS_STORAGE_PATH', os.path.join(SHARED_VOLUME_PATH_ROOT, 'job-logs'))
+"""Directory where the compressed logs of finished jobs are stored."""
+
+JOB_LOGS_EXCERPT_HEAD_SIZE = 16 * 1024
+"""Number of bytes from the start of a log kept in memory and in the DB."""
+
+JOB_LOGS_EXCERPT_TAIL_SIZE = 48 * 1024
+"""Number of bytes from the end of a log kept in memory and in the DB."""
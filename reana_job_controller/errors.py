@@ -11,3 +11,7 @@
 
 class ComputingBackendSubmissionError(Exception):
     """Operation to computer backend could not be performed."""
+
+
+class JobDBCreationError(Exception):
+    """Job submitted to the computing backend could not be created in DB."""
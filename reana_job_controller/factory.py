@@ -13,13 +13,34 @@ import threading
 
 from flask import Flask
 from reana_commons.config import REANA_LOG_FORMAT, REANA_LOG_LEVEL
+from reana_db.database import Session
 
 from reana_job_controller import config
 #from reana_job_controller.k8s import start_watch_jobs_thread
 from reana_job_controller.condor import start_watch_jobs_thread
+from reana_job_controller.htcondor_job_manager import get_job_files
+from reana_job_controller.job_db import rehydrate_job_db
 from reana_job_controller.spec import build_openapi_spec
 
 
+def start_job_watchers(JOB_DB):
+    """Reload the unfinished jobs from the DB and start watching them.
+
+    :param JOB_DB: :class:`JobStore` which contains all current jobs.
+    """
+    try:
+        # Downloads of the job files start before the first submission.
+        get_job_files()
+    except Exception as e:
+        logging.error('Could not publish the job files: {0}'.format(e))
+    try:
+        loaded_jobs = rehydrate_job_db(JOB_DB)
+        logging.info('Loaded {0} unfinished jobs from DB'.format(loaded_jobs))
+    except Exception as e:
+        logging.error('Could not load unfinished jobs from DB: {0}'.format(e))
+    start_watch_jobs_thread(JOB_DB)
+
+
 def create_app(JOB_DB=None, watch_jobs=True, config_mapping=None):
     """Create REANA-Job-Controller application."""
     logging.basicConfig(
@@ -38,7 +59,17 @@ def create_app(JOB_DB=None, watch_jobs=True, config_mapping=None):
     from reana_job_controller.rest import blueprint  # noqa
     app.register_blueprint(blueprint, url_prefix='/')
 
+    @app.teardown_appcontext
+    def shutdown_session(response_or_exc):
+        """Close the DB session of the request thread."""
+        Session.remove()
+
     if watch_jobs:
-        start_watch_jobs_thread(JOB_DB)
+        # Jobs are reloaded in background so the API is served meanwhile,
+        # watchers start once they are all known.
+        job_watchers_thread = threading.Thread(target=start_job_watchers,
+                                               args=(JOB_DB,))
+        job_watchers_thread.daemon = True
+        job_watchers_thread.start()
 
     return app
@@ -8,17 +8,15 @@
 
 """HTCondor Job Manager."""
 
-import ast
 import logging
 import traceback
 import uuid
 import htcondor
 import classad
 import os
-from retrying import retry
 import re
-import shutil
-import filecmp
+import threading
+import time
 
 from kubernetes.client.rest import ApiException
 from reana_commons.config import CVMFS_REPOSITORIES, K8S_DEFAULT_NAMESPACE
@@ -27,85 +25,197 @@ from reana_commons.config import CVMFS_REPOSITORIES, K8S_DEFAULT_NAMESPACE
 #from reana_commons.k8s.api_client import current_k8s_batchv1_api_client
 #from reana_commons.k8s.volumes import get_k8s_cvmfs_volume, get_shared_volume
 
-from reana_job_controller.config import (MAX_JOB_RESTARTS,
-                                         SHARED_VOLUME_PATH_ROOT)
+from reana_job_controller.config import (
+    HTCONDOR_JOB_EVENT_LOG, HTCONDOR_JOB_WRAPPER, HTCONDOR_PARROT_PATH,
+    HTCONDOR_PARROT_URL, HTCONDOR_SCHEDD_HEALTH_CHECK_INTERVAL)
 from reana_job_controller.errors import ComputingBackendSubmissionError
+from reana_job_controller.htcondor_submitter import SUBMISSION_HELPER_POOL
+from reana_job_controller.job_db import JOB_DB
+from reana_job_controller.job_files import INPUT_MANIFESTS, JOB_FILES
 from reana_job_controller.job_manager import JobManager
+from reana_job_controller.singularity_images import (SINGULARITY_IMAGES,
+                                                     pin_image_reference)
 
-def detach(f):
-    """Decorator for creating a forked process"""
-    def fork(*args, **kwargs):
-        r, w = os.pipe()
-        pid = os.fork()
-        if pid: # parent
-            os.close(w)
-            r = os.fdopen(r)
-            fout = r.read()
-            return fout
-        else: # child
-            try:
-                os.close(r)
-                w = os.fdopen(w, 'w')
-                os.setuid(int(os.environ.get('VC3USERID')))
-                out = f(*args, **kwargs)
-                w.write(str(out))
-                w.close()
-            finally:
-                os._exit(0)
-
-    return fork
-
-@retry(stop_max_attempt_number=MAX_JOB_RESTARTS)
-@detach
-def submit(schedd, sub):
+HTCONDOR_OUTPUT_TEMPLATE = '/tmp/{0}-{1}.{2}'
+"""Path of the stdout and stderr files of the HTCondor jobs."""
+
+
+def get_input_manifest(workflow_workspace):
+    """Get the manifest of the input files of a job.
+
+    :param workflow_workspace: Workflow directory.
+    :returns: Path of the published manifest, or None if there is none, in
+        which case the job wrapper copies the whole workflow directory.
+    """
     try:
-        with schedd.transaction() as txn:
-            clusterid = sub.queue(txn)
+        # Workspaces only change while jobs run, a manifest built since the
+        # last job event is still valid.
+        return INPUT_MANIFESTS.get(workflow_workspace,
+                                   version=JOB_DB.events.last_event_id)
     except Exception as e:
-        logging.debug("Error submission: {0}".format(e))
-        raise e
+        logging.error(traceback.format_exc())
+        logging.error('Could not publish the input manifest of {0}: '
+                      '{1}'.format(workflow_workspace, e))
+        return None
 
-    return clusterid
 
-def get_input_files(workflow_workspace):
-    """Get files from workflow space
-    :param workflow_workspace: Workflow directory
+def get_output_paths(cluster_id, process_id=0):
+    """Get the paths of the stdout and stderr files of an HTCondor job.
+
+    :param cluster_id: HTCondor cluster ID.
+    :param process_id: HTCondor process ID.
+    :returns: Tuple with the stdout and stderr paths.
     """
-    # First, get list of input files
-    input_files = []
-    for root, dirs, files in os.walk(workflow_workspace):
-        for filename in files:
-           input_files.append(os.path.join(root, filename))
-    
-    return ",".join(input_files)
+    return (HTCONDOR_OUTPUT_TEMPLATE.format(cluster_id, process_id, 'out'),
+            HTCONDOR_OUTPUT_TEMPLATE.format(cluster_id, process_id, 'err'))
 
-def get_schedd():
-    """Find and return the HTCondor sched.
-    :returns: htcondor schedd object."""
 
+def connect_schedd(address=None):
+    """Connect to the HTCondor schedd.
+
+    :param address: Address of the schedd, ``HTCONDOR_ADDR`` by default.
+    :returns: htcondor schedd object.
+    """
     # Getting remote scheduler
     schedd_ad = classad.ClassAd()
-    schedd_ad["MyAddress"] = os.environ.get("HTCONDOR_ADDR", None) 
+    schedd_ad["MyAddress"] = address or os.environ.get("HTCONDOR_ADDR", None)
     schedd = htcondor.Schedd(schedd_ad)
     return schedd
 
-def get_wrapper(shared_path):
-    """Get wrapper for job. Transfer if it does not exist.
-    :param shared_path: Shared FS directory, e.g.: /var/reana."""
-    
-    wrapper = os.path.join(shared_path, 'wrapper', 'job_wrapper.sh')
-    local_wrapper = '/code/files/job_wrapper.sh'
-    if os.path.exists(wrapper) and filecmp.cmp(local_wrapper, wrapper):
-        return wrapper
-    try:
-        if not os.path.isdir(os.path.dirname(wrapper)):
-            os.mkdir(os.path.dirname(wrapper))
-        shutil.copy('/code/files/job_wrapper.sh', wrapper)
-    except Exception as e:
-        logging.debug("Error transfering wrapper : {0}.".format(e))
-        raise e
-    
-    return wrapper
+
+class ScheddCache(object):
+    """Schedd connections shared by the whole process, keyed by address.
+
+    Connections which were not used for a while are checked with a cheap
+    query before being handed out, and replaced if the check fails. Checks
+    and connections are done outside of the lock, so a slow schedd does not
+    block the threads using the other ones.
+    """
+
+    def __init__(self, health_check_interval=None, connect=connect_schedd):
+        """Instantiate empty cache.
+
+        :param health_check_interval: Seconds after which a connection is
+            checked before being used again.
+        :param connect: Function connecting to the schedd at an address.
+        """
+        self.health_check_interval = health_check_interval \
+            if health_check_interval is not None \
+            else HTCONDOR_SCHEDD_HEALTH_CHECK_INTERVAL
+        self.connect = connect
+        self.lock = threading.Lock()
+        self.schedds = {}
+
+    def get(self, address=None):
+        """Get a working connection to a schedd.
+
+        :param address: Address of the schedd, ``HTCONDOR_ADDR`` by default.
+        :returns: htcondor schedd object.
+        """
+        address = address or os.environ.get('HTCONDOR_ADDR')
+        now = time.time()
+        with self.lock:
+            cached_schedd, checked = self.schedds.get(address, (None, 0))
+            if cached_schedd is not None:
+                if now - checked < self.health_check_interval:
+                    self.schedds[address] = (cached_schedd, now)
+                    return cached_schedd
+                # The other threads keep using it while it is checked.
+                self.schedds[address] = (cached_schedd, now)
+        schedd = cached_schedd
+        if schedd is not None:
+            try:
+                schedd.query('false', ['ClusterId'])
+            except Exception:
+                logging.warning('Connection to schedd {0} lost, '
+                                'reconnecting.'.format(address))
+                schedd = None
+        if schedd is None:
+            schedd = self.connect(address)
+        with self.lock:
+            current_schedd, _ = self.schedds.get(address, (None, 0))
+            if current_schedd is not None and \
+                    current_schedd is not cached_schedd:
+                # Another thread reconnected in the meantime.
+                return current_schedd
+            self.schedds[address] = (schedd, now)
+            return schedd
+
+    def invalidate(self, address=None):
+        """Drop the connection to a schedd, the next one is a new one.
+
+        :param address: Address of the schedd, ``HTCONDOR_ADDR`` by default.
+        """
+        address = address or os.environ.get('HTCONDOR_ADDR')
+        with self.lock:
+            self.schedds.pop(address, None)
+
+    def act(self, action, constraint, address=None):
+        """Perform an action on jobs, reconnecting once if it fails.
+
+        :param action: htcondor.JobAction to perform.
+        :param constraint: Constraint selecting the jobs.
+        :param address: Address of the schedd, ``HTCONDOR_ADDR`` by default.
+        """
+        try:
+            return self.get(address).act(action, constraint)
+        except Exception:
+            logging.error(traceback.format_exc())
+            self.invalidate(address)
+            return self.get(address).act(action, constraint)
+
+
+SCHEDD_CACHE = ScheddCache()
+"""Schedd connections of this job controller."""
+
+
+def parse_condor_job_id(backend_job_id):
+    """Parse the ID of an HTCondor job, ``cluster`` or ``cluster.proc``.
+
+    :param backend_job_id: Backend job ID of the job.
+    :returns: Tuple with the cluster and process IDs, or None if the ID is
+        not the one of an HTCondor job.
+    """
+    match = re.match(r'^(\d+)(?:\.(\d+))?$', str(backend_job_id))
+    if not match:
+        return None
+    return int(match.group(1)), int(match.group(2) or 0)
+
+
+def build_condor_job_constraint(backend_job_id):
+    """Build a ClassAd constraint matching a single HTCondor job.
+
+    :param backend_job_id: Backend job ID of the job, ``cluster`` or
+        ``cluster.proc``.
+    :returns: ClassAd expression as a string.
+    """
+    if '.' not in str(backend_job_id):
+        return 'ClusterId=={0}'.format(int(backend_job_id))
+    cluster_id, proc_id = parse_condor_job_id(backend_job_id)
+    return 'ClusterId=={0} && ProcId=={1}'.format(cluster_id, proc_id)
+
+
+def get_schedd():
+    """Find and return the HTCondor sched.
+
+    :returns: htcondor schedd object, shared with the rest of the process.
+    """
+    return SCHEDD_CACHE.get()
+
+def get_job_files():
+    """Publish the wrapper and the helper binaries of the jobs.
+
+    :returns: Tuple with the path of the wrapper and, if available, a tuple
+        with the path and the SHA-256 of the parrot binary.
+    """
+    wrapper, _ = JOB_FILES.publish(HTCONDOR_JOB_WRAPPER)
+    if HTCONDOR_PARROT_PATH:
+        parrot = JOB_FILES.publish(HTCONDOR_PARROT_PATH, 'parrot_static_run')
+    else:
+        parrot = JOB_FILES.publish_url(HTCONDOR_PARROT_URL,
+                                       'parrot_static_run')
+    return wrapper, parrot
+
 
 class HTCondorJobManager(JobManager):
     """HTCondor job management."""
@@ -141,39 +251,130 @@ class HTCondorJobManager(JobManager):
         self.workflow_workspace = workflow_workspace
         self.cvmfs_mounts = cvmfs_mounts
         self.shared_file_system = shared_file_system
-        self.schedd = get_schedd()
-        self.wrapper = get_wrapper(SHARED_VOLUME_PATH_ROOT)
+        self.wrapper, self.parrot = get_job_files()
+        self.image = SINGULARITY_IMAGES.get(self.docker_img) \
+            if self.docker_img else None
 
 
     @JobManager.execution_hook
     def execute(self):
         """Execute / submit a job with HTCondor."""
-        sub = htcondor.Submit()
-        sub['executable'] = self.wrapper
+        sub = self.build_submit_description()
+        clusterid, = SUBMISSION_HELPER_POOL.submit([dict(sub.items())])
+        logging.warning("Submitting job clusterid: {0}".format(clusterid))
+        return str(clusterid)
+
+    @classmethod
+    @JobManager.batch_execution_hook
+    def execute_batch(cls, job_managers):
+        """Submit several jobs to HTCondor in a single schedd transaction.
+
+        :param job_managers: List of HTCondor job managers to submit.
+        :returns: List with, for each job manager, its cluster ID or the
+            exception which prevented its submission.
+        """
+        descriptions = [dict(job_manager.build_submit_description().items())
+                        for job_manager in job_managers]
+        try:
+            clusterids = SUBMISSION_HELPER_POOL.submit(descriptions)
+        except ComputingBackendSubmissionError as e:
+            logging.error(traceback.format_exc())
+            return [e] * len(job_managers)
+        logging.warning("Submitting job clusterids: {0}".format(clusterids))
+        return [str(clusterid) for clusterid in clusterids]
+
+    @JobManager.array_execution_hook
+    def execute_array(self, item_managers):
+        """Submit a job array to HTCondor as one cluster, one proc per item.
+
+        :param item_managers: List of job managers of the items, built with
+            :meth:`build_array_item`.
+        :returns: List with the backend job ID of each item,
+            ``cluster.proc``.
+        """
+        sub = self.build_submit_description()
+        sub['arguments'] = '$(reana_arguments)'
+        sub['environment'] = '$(reana_environment)'
+        itemdata = [{'reana_arguments': item_manager.build_arguments(),
+                     'reana_environment': item_manager.build_environment()}
+                    for item_manager in item_managers]
+        clusterid, = SUBMISSION_HELPER_POOL.submit(
+            [dict(sub.items())], [itemdata])
+        logging.warning("Submitting job array clusterid: {0}".format(
+            clusterid))
+        return ['{0}.{1}'.format(clusterid, proc_id)
+                for proc_id in range(len(item_managers))]
+
+    def build_arguments(self):
+        """Build the arguments of the job wrapper.
+
+        :returns: Arguments as a string.
+        """
+        docker_img = self.docker_img
+        if self.image:
+            # Jobs pulling the image themselves run the converted one too.
+            docker_img = pin_image_reference(docker_img, self.image[0])
         # condor arguments require double quotes to be escaped
-        sub['arguments'] = 'exec --home .{0}:{0} docker://{1} {2}'.format(self.workflow_workspace,
-                self.docker_img, re.sub(r'"', '\\"', self.cmd))
-        sub['Output'] = '/tmp/$(Cluster)-$(Process).out'
-        sub['Error'] = '/tmp/$(Cluster)-$(Process).err'
-        #sub['transfer_input_files'] = get_input_files(self.workflow_workspace)
-        sub['InitialDir'] = '/tmp'
-        sub['+WantIOProxy'] = 'true'
+        return 'exec --home .{0}:{0} docker://{1} {2}'.format(
+            self.workflow_workspace, docker_img,
+            re.sub(r'"', '\\"', self.cmd))
+
+    def build_environment(self):
+        """Build the environment of the job wrapper.
+
+        :returns: Environment in HTCondor submit syntax.
+        """
         job_env = 'reana_workflow_dir={0}'.format(self.workflow_workspace)
+        job_env += '; reana_parrot_url={0}'.format(HTCONDOR_PARROT_URL)
+        if self.parrot:
+            parrot_path, parrot_sha256 = self.parrot
+            job_env += '; reana_parrot_path={0}; reana_parrot_sha256={1}' \
+                .format(parrot_path, parrot_sha256)
+        if self.image and self.image[1]:
+            job_env += '; reana_singularity_image={0}'.format(self.image[1])
         for key, value in self.env_vars.items():
             job_env += '; {0}={1}'.format(key, value)
-        sub['environment'] = job_env
-        clusterid = submit(self.schedd, sub)
-        logging.warning("Submitting job clusterid: {0}".format(clusterid))
-        return str(clusterid)
+        return job_env
+
+    def build_submit_description(self):
+        """Build the HTCondor submit description of the job.
+
+        :returns: :class:`htcondor.Submit` object.
+        """
+        sub = htcondor.Submit()
+        sub['executable'] = self.wrapper
+        sub['arguments'] = self.build_arguments()
+        sub['Output'], sub['Error'] = get_output_paths('$(Cluster)',
+                                                       '$(Process)')
+        input_files = []
+        if self.parrot:
+            input_files.append(self.parrot[0])
+        input_manifest = get_input_manifest(self.workflow_workspace)
+        if input_manifest:
+            input_files.append(input_manifest)
+        if input_files:
+            sub['transfer_input_files'] = ','.join(input_files)
+        sub['InitialDir'] = '/tmp'
+        if HTCONDOR_JOB_EVENT_LOG:
+            sub['log'] = HTCONDOR_JOB_EVENT_LOG
+        sub['+WantIOProxy'] = 'true'
+        sub['environment'] = self.build_environment()
+        return sub
 
 
-    def stop(self, backend_job_id, asynchronous=True):
+    @staticmethod
+    def stop(backend_job_id, asynchronous=True):
         """Stop HTCondor job execution.
 
         :param backend_job_id: HTCondor job id.
         :param asynchronous: Ignored.
         """
-        self.schedd.act(htcondor.JobAction.Remove, 'ClusterId==%d' % backend_job_id)
+        try:
+            SCHEDD_CACHE.act(htcondor.JobAction.Remove,
+                             build_condor_job_constraint(backend_job_id))
+        except Exception as e:
+            logging.error(traceback.format_exc())
+            raise ComputingBackendSubmissionError(str(e))
 
 
     def add_shared_volume(self, job):
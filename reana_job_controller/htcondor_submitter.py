@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of REANA.
+# Copyright (C) 2019 CERN.
+#
+# REANA is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""HTCondor submission helpers.
+
+Jobs are submitted to HTCondor as the ``VC3USERID`` user. Instead of forking
+the job controller for every submission, long-lived helper processes, which
+drop their privileges once when they start, keep a schedd connection open
+and receive the submit descriptions as JSON lines on their standard input.
+A submit description can come with item data, a list of dictionaries of
+macros, to queue one job per item in its cluster. Each request is answered
+with one JSON line with the cluster IDs, in the same order as the submit
+descriptions, or with an error.
+
+The jobs of a request are tagged with its ID, so a request whose answer was
+lost, because the helper was stopped or the schedd connection broke, can be
+looked up in the schedd instead of being queued twice. Failed submissions
+are only queued again when the schedd can not be reached.
+
+Run a helper with ``python -m reana_job_controller.htcondor_submitter``.
+"""
+
+import json
+import logging
+import os
+import queue
+import select
+import subprocess
+import sys
+import traceback
+import uuid
+
+from reana_job_controller import config
+from reana_job_controller.errors import ComputingBackendSubmissionError
+
+SUBMISSION_TAG_ATTRIBUTE = 'ReanaSubmissionTag'
+"""Job attribute with the ID of the request which queued the job."""
+
+SUBMISSION_INDEX_ATTRIBUTE = 'ReanaSubmissionIndex'
+"""Job attribute with the index of the submit description of the job."""
+
+
+def tag_description(description, submission_tag, index):
+    """Add the attributes identifying its request to a submit description.
+
+    :param description: Submit description, as a dictionary.
+    :param submission_tag: ID of the request.
+    :param index: Index of the submit description in the request.
+    :returns: Tagged copy of the submit description.
+    """
+    return dict(description, **{
+        '+' + SUBMISSION_TAG_ATTRIBUTE: '"{0}"'.format(submission_tag),
+        '+' + SUBMISSION_INDEX_ATTRIBUTE: str(index)})
+
+
+def find_submitted_clusters(schedd, submission_tag, count):
+    """Find the clusters queued by a request.
+
+    :param schedd: htcondor schedd object.
+    :param submission_tag: ID of the request.
+    :param count: Number of submit descriptions of the request.
+    :returns: List of cluster IDs, in the same order as the submit
+        descriptions, or None if the request was not queued.
+    """
+    ads = schedd.query('{0} == "{1}"'.format(SUBMISSION_TAG_ATTRIBUTE,
+                                             submission_tag),
+                       ['ClusterId', SUBMISSION_INDEX_ATTRIBUTE])
+    cluster_ids = {}
+    for ad in ads:
+        cluster_ids[int(ad[SUBMISSION_INDEX_ATTRIBUTE])] = int(ad['ClusterId'])
+    # The submit descriptions of a request are queued in one transaction.
+    if len(cluster_ids) < count:
+        return None
+    return [cluster_ids[index] for index in range(count)]
+
+
+def is_reachable(schedd):
+    """Check whether a schedd answers queries.
+
+    :param schedd: htcondor schedd object.
+    """
+    try:
+        schedd.query('false', ['ClusterId'])
+        return True
+    except Exception:
+        return False
+
+
+def serve(input_file, output_file, connect):
+    """Answer submission requests until the input is closed.
+
+    :param input_file: Text file the requests are read from.
+    :param output_file: Text file the responses are written to.
+    :param connect: Function returning a new htcondor schedd object.
+    """
+    import htcondor
+
+    def queue(txn, description, itemdata):
+        if itemdata is None:
+            return htcondor.Submit(description).queue(txn)
+        return htcondor.Submit(description).queue_with_itemdata(
+            txn, 1, iter(itemdata)).cluster()
+
+    schedd = connect()
+    for line in input_file:
+        request = json.loads(line)
+        if 'lookup' in request:
+            try:
+                response = {'cluster_ids': find_submitted_clusters(
+                    schedd, request['lookup'], request['count'])}
+            except Exception as e:
+                response = {'error': str(e)}
+                schedd = connect()
+            output_file.write(json.dumps(response) + '\n')
+            output_file.flush()
+            continue
+        submission_tag = request.get('submission_tag')
+        descriptions = request['descriptions']
+        if submission_tag:
+            descriptions = [
+                tag_description(description, submission_tag, index)
+                for index, description in enumerate(descriptions)]
+        itemdata = request.get('itemdata') or [None] * len(descriptions)
+        response = {}
+        for attempt in range(config.MAX_JOB_RESTARTS):
+            try:
+                cluster_ids = None
+                if attempt and submission_tag:
+                    # The failed transaction may have been committed.
+                    cluster_ids = find_submitted_clusters(
+                        schedd, submission_tag, len(descriptions))
+                if cluster_ids is None:
+                    with schedd.transaction() as txn:
+                        cluster_ids = [
+                            queue(txn, description, items)
+                            for description, items in zip(descriptions,
+                                                          itemdata)]
+                response = {'cluster_ids': cluster_ids}
+                break
+            except Exception as e:
+                logging.debug('Error submission: {0}'.format(e))
+                response = {'error': str(e)}
+                if is_reachable(schedd):
+                    # The submission itself is wrong, it would fail again.
+                    break
+                schedd = connect()
+        output_file.write(json.dumps(response) + '\n')
+        output_file.flush()
+
+
+def main():
+    """Run a submission helper on the standard input and output."""
+    from reana_job_controller.htcondor_job_manager import connect_schedd
+    # Only responses can be written to the standard output.
+    output_file = os.fdopen(os.dup(sys.stdout.fileno()), 'w')
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    if os.environ.get('VC3USERID'):
+        os.setuid(int(os.environ['VC3USERID']))
+    serve(sys.stdin, output_file, connect_schedd)
+
+
+class HTCondorSubmissionHelper(object):
+    """Connection to a submission helper process."""
+
+    def __init__(self, args=None, timeout=None):
+        """Instantiate helper.
+
+        :param args: Command running the helper process.
+        :param timeout: Seconds to wait for the answer of the helper.
+        """
+        self.args = args or [sys.executable, '-m',
+                             'reana_job_controller.htcondor_submitter']
+        self.timeout = timeout or config.HTCONDOR_SUBMISSION_TIMEOUT
+        self.process = None
+
+    def start(self):
+        """Start the helper process."""
+        self.process = subprocess.Popen(self.args, stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE,
+                                        universal_newlines=True)
+
+    def submit(self, descriptions, itemdata=None):
+        """Submit jobs within a single schedd transaction.
+
+        A helper which does not answer in time is killed and restarted, and
+        the jobs it may have queued meanwhile are looked up.
+
+        :param descriptions: List of submit descriptions, as dictionaries.
+        :param itemdata: List with, for each submit description, None or the
+            list of items to queue in its cluster.
+        :returns: List of cluster IDs, in the same order as `descriptions`.
+        """
+        submission_tag = uuid.uuid4().hex
+        request = {'descriptions': descriptions,
+                   'submission_tag': submission_tag}
+        if itemdata:
+            request['itemdata'] = itemdata
+        response = self.request(request)
+        if response is None:
+            response = self.request({'lookup': submission_tag,
+                                     'count': len(descriptions)})
+            if not response or not response.get('cluster_ids'):
+                raise ComputingBackendSubmissionError(
+                    'HTCondor submission helper did not answer within {0} '
+                    'seconds.'.format(self.timeout))
+            logging.warning('Submission {0} was queued before its helper was '
+                            'stopped.'.format(submission_tag))
+        if 'error' in response:
+            raise ComputingBackendSubmissionError(response['error'])
+        return response['cluster_ids']
+
+    def request(self, request):
+        """Send a request to the helper process and wait for its answer.
+
+        :param request: Request, as a dictionary.
+        :returns: Answer, as a dictionary, or None if the helper did not
+            answer in time, in which case it is restarted.
+        """
+        if self.process is None or self.process.poll() is not None:
+            self.start()
+        try:
+            self.process.stdin.write(json.dumps(request) + '\n')
+            self.process.stdin.flush()
+            ready, _, _ = select.select([self.process.stdout], [], [],
+                                        self.timeout)
+            if not ready:
+                self.stop()
+                self.start()
+                return None
+            response = self.process.stdout.readline()
+        except (IOError, OSError) as e:
+            self.stop()
+            raise ComputingBackendSubmissionError(
+                'HTCondor submission helper failed: {0}'.format(e))
+        if not response:
+            self.stop()
+            raise ComputingBackendSubmissionError(
+                'HTCondor submission helper exited.')
+        return json.loads(response)
+
+    def stop(self):
+        """Stop the helper process."""
+        if self.process is not None:
+            try:
+                self.process.kill()
+                self.process.wait()
+            except OSError:
+                logging.error(traceback.format_exc())
+            self.process = None
+
+
+class HTCondorSubmissionHelperPool(object):
+    """Pool of submission helpers shared by the submitting threads."""
+
+    def __init__(self, size=None, args=None, timeout=None):
+        """Instantiate pool, helpers are started when first used.
+
+        :param size: Number of helper processes.
+        :param args: Command running a helper process.
+        :param timeout: Seconds to wait for the answer of a helper.
+        """
+        self.idle_helpers = queue.Queue()
+        for _ in range(size or config.HTCONDOR_SUBMISSION_HELPERS):
+            self.idle_helpers.put(HTCondorSubmissionHelper(args, timeout))
+
+    def submit(self, descriptions, itemdata=None):
+        """Submit jobs within a single schedd transaction.
+
+        :param descriptions: List of submit descriptions, as dictionaries.
+        :param itemdata: List with, for each submit description, None or the
+            list of items to queue in its cluster.
+        :returns: List of cluster IDs, in the same order as `descriptions`.
+        """
+        helper = self.idle_helpers.get()
+        try:
+            return helper.submit(descriptions, itemdata)
+        finally:
+            self.idle_helpers.put(helper)
+
+
+SUBMISSION_HELPER_POOL = HTCondorSubmissionHelperPool()
+"""Submission helpers of this job controller."""
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of REANA.
+# Copyright (C) 2019 CERN.
+#
+# REANA is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""REANA-Job-Controller job cache entries creation."""
+
+import logging
+import queue
+import threading
+import time
+import traceback
+from collections import OrderedDict
+
+from reana_commons.utils import calculate_file_access_time
+from reana_db.database import Session
+from reana_db.models import JobCache, Workflow
+
+from reana_job_controller import config
+
+
+class JobCacheWorker(object):
+    """Background creation of the job cache entries of submitted jobs.
+
+    Scanning the access times of a workspace walks all of it, so jobs
+    submitted close together are grouped: each workspace is scanned once
+    per group and the cache entries of the group are written in one
+    transaction.
+    """
+
+    WORKSPACES_CACHE_SIZE = 1000
+    """Number of workflows whose workspace path is kept."""
+
+    def __init__(self, batch_delay=None, batch_size=None):
+        """Instantiate worker.
+
+        :param batch_delay: Seconds to wait for more jobs to group.
+        :param batch_size: Maximum number of jobs in a group.
+        """
+        self.batch_delay = batch_delay if batch_delay is not None \
+            else config.JOB_CACHE_BATCH_DELAY
+        self.batch_size = batch_size or config.JOB_CACHE_BATCH_SIZE
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.workspaces = OrderedDict()
+
+    def start(self):
+        """Start the worker thread if it is not running."""
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.work)
+                self.thread.daemon = True
+                self.thread.start()
+
+    def submit(self, job_id, workflow_uuid):
+        """Queue the creation of the cache entry of a job.
+
+        :param job_id: UUID of the job.
+        :param workflow_uuid: UUID of the workflow of the job.
+        """
+        self.start()
+        self.queue.put((job_id, workflow_uuid))
+
+    def work(self):
+        """Create the cache entries of the queued jobs group by group."""
+        while True:
+            jobs = [self.queue.get()]
+            deadline = time.time() + self.batch_delay
+            while len(jobs) < self.batch_size:
+                try:
+                    jobs.append(self.queue.get(
+                        timeout=max(deadline - time.time(), 0)))
+                except queue.Empty:
+                    break
+            try:
+                self.create_job_cache_entries(jobs)
+            finally:
+                for _ in jobs:
+                    self.queue.task_done()
+
+    def get_workspace(self, workflow_uuid):
+        """Get the workspace of a workflow, querying the DB only once.
+
+        :param workflow_uuid: UUID of the workflow.
+        :returns: Path of the workspace or None if the workflow is unknown.
+        """
+        workspace = self.workspaces.pop(workflow_uuid, None)
+        if workspace is None:
+            workflow = Session.query(Workflow).filter_by(
+                id_=workflow_uuid).one_or_none()
+            if workflow is None:
+                return None
+            workspace = workflow.get_workspace()
+        self.workspaces[workflow_uuid] = workspace
+        while len(self.workspaces) > self.WORKSPACES_CACHE_SIZE:
+            self.workspaces.popitem(last=False)
+        return workspace
+
+    def scan_workspace(self, workflow_uuid):
+        """Get the access times of the files of the workspace of a workflow.
+
+        :param workflow_uuid: UUID of the workflow.
+        :returns: Access times, or None if the workspace can not be scanned.
+        """
+        try:
+            workspace = self.get_workspace(workflow_uuid)
+            if workspace is None:
+                logging.error('Workflow {0} not found.'.format(workflow_uuid))
+                return None
+            return calculate_file_access_time(workspace)
+        except Exception:
+            logging.error(traceback.format_exc())
+            return None
+
+    def create_job_cache_entries(self, jobs):
+        """Create the cache entries of a group of jobs in one transaction.
+
+        If the group can not be committed, its entries are created again one
+        by one, so a single bad entry only loses its own job.
+
+        :param jobs: List of tuples (job UUID, workflow UUID).
+        """
+        access_times = {}
+        entries = []
+        try:
+            for job_id, workflow_uuid in jobs:
+                if workflow_uuid not in access_times:
+                    access_times[workflow_uuid] = self.scan_workspace(
+                        workflow_uuid)
+                if access_times[workflow_uuid] is None:
+                    logging.error('Workspace of workflow {0} of job {1} could '
+                                  'not be scanned, not caching it.'.format(
+                                      workflow_uuid, job_id))
+                    continue
+                entries.append((job_id, access_times[workflow_uuid]))
+            try:
+                self.commit_entries(entries)
+            except Exception as e:
+                if len(entries) == 1:
+                    raise
+                logging.warning('Could not create {0} cache entries '
+                                'together, creating them one by one: '
+                                '{1}'.format(len(entries), e))
+                for entry in entries:
+                    try:
+                        self.commit_entries([entry])
+                    except Exception as e:
+                        logging.error(traceback.format_exc())
+                        logging.debug('Could not create cache entry of job '
+                                      '{0}: {1}'.format(entry[0], e))
+        except Exception as e:
+            logging.error(traceback.format_exc())
+            logging.debug('Could not create cache entries of jobs {0}: '
+                          '{1}'.format([job_id for job_id, _ in jobs], e))
+        finally:
+            Session.remove()
+
+    @staticmethod
+    def commit_entries(entries):
+        """Create cache entries in one transaction.
+
+        :param entries: List of tuples (job UUID, access times).
+        """
+        if not entries:
+            return
+        try:
+            for job_id, access_times in entries:
+                prepared_job_cache = JobCache()
+                prepared_job_cache.job_id = job_id
+                prepared_job_cache.access_times = access_times
+                Session.add(prepared_job_cache)
+            Session.commit()
+        except Exception:
+            Session.rollback()
+            raise
+
+
+JOB_CACHE_WORKER = JobCacheWorker()
+"""Worker creating the job cache entries of the jobs of this controller."""
@@ -8,11 +8,444 @@
 
 """REANA-Job-Controller job database."""
 
-from reana_commons.utils import calculate_hash_of_dir, calculate_job_input_hash
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from hashlib import md5
+
+from reana_commons.utils import calculate_job_input_hash
 from reana_db.database import Session
-from reana_db.models import JobCache
+from reana_db.models import Job, JobCache, JobStatus
+
+from reana_job_controller import config
+from reana_job_controller.job_events import JobEventBuffer
+from reana_job_controller.workspace_hash import WORKSPACE_HASH_CACHE
+
+
+class JobRecord(object):
+    """Compact record of a job known by the job controller.
+
+    Records are read like dictionaries, they are modified through
+    :meth:`JobStore.update` so the indexes of the store stay consistent.
+    """
+
+    __slots__ = ('job_id', 'job_name', 'workflow_uuid', 'backend',
+                 'backend_job_id', 'docker_img', 'cmd', 'cvmfs_mounts',
+                 'experiment', 'status', 'restart_count', 'max_restart_count',
+                 'deleted', 'log', 'log_path', 'created', 'finished', 'seq')
+
+    def __init__(self, **fields):
+        """Instantiate record.
+
+        :param fields: Values of the record fields, missing ones are None.
+        """
+        for field in self.__slots__:
+            setattr(self, field, fields.get(field))
+
+    def __getitem__(self, field):
+        """Get the value of a field."""
+        if field not in self.__slots__:
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def get(self, field, default=None):
+        """Get the value of a field, or `default` if it is not set."""
+        value = getattr(self, field, None)
+        return default if value is None else value
+
+
+def discard_seq(seqs, seq):
+    """Remove a sequence number from a sorted list, if it is there.
+
+    :param seqs: Sorted list of sequence numbers.
+    :param seq: Sequence number to remove.
+    """
+    index = bisect.bisect_left(seqs, seq)
+    if index < len(seqs) and seqs[index] == seq:
+        del seqs[index]
+
+
+class JobStore(object):
+    """Thread-safe in-memory store of the jobs of the job controller.
+
+    Besides the records, the store indexes jobs by status, by workflow and
+    unfinished jobs by their backend job ID. The status and workflow indexes
+    are lists of sequence numbers kept sorted, so pages of jobs are read
+    from their cursor on, and it publishes the status
+    transitions of the jobs to :attr:`events`. Finished jobs are evicted once
+    they have not been accessed for ``JOB_STORE_FINISHED_JOB_TTL`` seconds
+    or when there are more than ``JOB_STORE_MAX_FINISHED_JOBS`` of them,
+    least recently accessed first. Unfinished jobs are never evicted.
+    """
+
+    FINAL_STATUSES = ('succeeded', 'failed')
+    """Statuses after which the backend does not report on a job anymore."""
+
+    def __init__(self, max_finished_jobs=None, finished_job_ttl=None):
+        """Instantiate empty store.
+
+        :param max_finished_jobs: Maximum number of finished jobs kept.
+        :param finished_job_ttl: Seconds a finished job is kept after it was
+            last accessed.
+        """
+        self.max_finished_jobs = max_finished_jobs \
+            if max_finished_jobs is not None \
+            else config.JOB_STORE_MAX_FINISHED_JOBS
+        self.finished_job_ttl = finished_job_ttl \
+            if finished_job_ttl is not None \
+            else config.JOB_STORE_FINISHED_JOB_TTL
+        self.lock = threading.RLock()
+        self.jobs = {}
+        self.seqs = []
+        self.job_ids_by_seq = {}
+        self.status_index = {}
+        self.workflow_index = {}
+        self.sequence = 0
+        self.backend_job_id_index = {}
+        self.finished_jobs = OrderedDict()
+        self.status_waiters = {}
+        self.events = JobEventBuffer()
+
+    def __contains__(self, job_id):
+        """Check if a job is in the store."""
+        return job_id in self.jobs
+
+    def __len__(self):
+        """Get the number of jobs in the store."""
+        return len(self.jobs)
+
+    def __getitem__(self, job_id):
+        """Get the record of a job, raising KeyError if it is not stored."""
+        job = self.get(job_id)
+        if job is None:
+            raise KeyError(job_id)
+        return job
+
+    def get(self, job_id, default=None):
+        """Get the record of a job.
+
+        :param job_id: UUID which identifies the job.
+        :param default: Value returned if the job is not stored.
+        :returns: :class:`JobRecord` of the job.
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return default
+            if job_id in self.finished_jobs:
+                self.finished_jobs[job_id] = time.time()
+                self.finished_jobs.move_to_end(job_id)
+            return job
+
+    def add(self, job_id, **fields):
+        """Add a job to the store.
+
+        :param job_id: UUID which identifies the job.
+        :param fields: Values of the :class:`JobRecord` fields.
+        :returns: :class:`JobRecord` of the job.
+        """
+        fields.setdefault('created', time.time())
+        job = JobRecord(job_id=job_id, **fields)
+        with self.lock:
+            if job_id in self.jobs:
+                self._remove(job_id)
+            self.sequence += 1
+            job.seq = self.sequence
+            self.jobs[job_id] = job
+            self.seqs.append(job.seq)
+            self.job_ids_by_seq[job.seq] = job_id
+            self._index(job_id, job)
+            self.evict()
+        return job
+
+    def update(self, job_id, **fields):
+        """Update the fields of a job.
+
+        :param job_id: UUID which identifies the job.
+        :param fields: New values of the :class:`JobRecord` fields.
+        :returns: :class:`JobRecord` of the job or None if it is not stored.
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            self._unindex(job_id, job)
+            previous_status = job.status
+            for field, value in fields.items():
+                setattr(job, field, value)
+            if job.status != previous_status:
+                self._notify_status_waiters(job_id)
+                self.events.publish(job_id, job.workflow_uuid, job.status)
+            if job.deleted and job.finished is None:
+                job.finished = time.time()
+            self._index(job_id, job)
+            self.evict()
+        return job
+
+    def wait_for_status_change(self, job_id, since_status, timeout):
+        """Wait until the status of a job is not `since_status` anymore.
+
+        :param job_id: UUID which identifies the job.
+        :param since_status: Status the job is expected to leave.
+        :param timeout: Maximum number of seconds to wait.
+        :returns: :class:`JobRecord` of the job or None if it is not stored.
+        """
+        status_changed = threading.Event()
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.status != since_status:
+                return job
+            self.status_waiters.setdefault(job_id, []).append(status_changed)
+        try:
+            status_changed.wait(timeout)
+        finally:
+            with self.lock:
+                waiters = self.status_waiters.get(job_id, [])
+                if status_changed in waiters:
+                    waiters.remove(status_changed)
+                    if not waiters:
+                        del self.status_waiters[job_id]
+        return self.get(job_id)
+
+    def remove(self, job_id):
+        """Remove a job from the store.
+
+        :param job_id: UUID which identifies the job.
+        """
+        with self.lock:
+            if job_id in self.jobs:
+                self._remove(job_id)
+
+    def job_ids(self, status=None):
+        """Get the IDs of the stored jobs.
+
+        :param status: Only get the jobs with this status.
+        :returns: List of job IDs.
+        """
+        with self.lock:
+            if status is None:
+                return list(self.jobs)
+            return [self.job_ids_by_seq[seq]
+                    for seq in self.status_index.get(status, ())]
+
+    def records(self):
+        """Get the records of all the stored jobs.
+
+        :returns: List of :class:`JobRecord`.
+        """
+        with self.lock:
+            return list(self.jobs.values())
+
+    def page(self, status=None, workflow_uuid=None, after=None, limit=None):
+        """Get a page of the stored jobs, in the order they were added.
+
+        :param status: Only get the jobs with this status.
+        :param workflow_uuid: Only get the jobs of this workflow.
+        :param after: Cursor returned with the previous page.
+        :param limit: Maximum number of jobs in the page.
+        :returns: Tuple with the list of :class:`JobRecord` and the cursor of
+            the next page, None if this is the last one.
+        """
+        with self.lock:
+            seqs = self.seqs
+            if status is not None:
+                seqs = self.status_index.get(status, [])
+            if workflow_uuid is not None:
+                workflow_seqs = self.workflow_index.get(workflow_uuid, [])
+                if status is None or len(workflow_seqs) < len(seqs):
+                    seqs = workflow_seqs
+            start = 0 if after is None else bisect.bisect_right(seqs, after)
+            jobs = []
+            for index in range(start, len(seqs)):
+                job = self.jobs[self.job_ids_by_seq[seqs[index]]]
+                if (status is not None and job.status != status) or \
+                        (workflow_uuid is not None and
+                         job.workflow_uuid != workflow_uuid):
+                    continue
+                if limit is not None and len(jobs) == limit:
+                    return jobs, jobs[-1].seq
+                jobs.append(job)
+            return jobs, None
+
+    def count_by_status(self):
+        """Get the number of stored jobs per status.
+
+        :returns: Dictionary with the number of jobs of each status.
+        """
+        with self.lock:
+            return {status: len(job_ids)
+                    for status, job_ids in self.status_index.items()
+                    if job_ids}
+
+    def retrieve_job_id_by_backend_job_id(self, backend_job_id):
+        """Retrieve the id of an unfinished job from its backend job id.
+
+        :param backend_job_id: String which represents the ID of the job in
+            the computing backend.
+        :returns: UUID of the job or None if there is no such unfinished job.
+        """
+        with self.lock:
+            return self.backend_job_id_index.get(str(backend_job_id))
+
+    def unfinished_jobs(self):
+        """Get the unfinished jobs by their backend job ID.
+
+        :returns: List of ``(backend_job_id, job_id)`` tuples.
+        """
+        with self.lock:
+            return list(self.backend_job_id_index.items())
+
+    def evict(self, now=None):
+        """Evict finished jobs exceeding the TTL or the maximum number.
+
+        :param now: Current time, defaults to :func:`time.time`.
+        :returns: Number of evicted jobs.
+        """
+        now = now or time.time()
+        evicted = 0
+        with self.lock:
+            while self.finished_jobs:
+                job_id, last_access = next(iter(self.finished_jobs.items()))
+                if len(self.finished_jobs) <= self.max_finished_jobs and \
+                        now - last_access < self.finished_job_ttl:
+                    break
+                self._remove(job_id)
+                evicted += 1
+        return evicted
+
+    def _remove(self, job_id):
+        job = self.jobs[job_id]
+        self._unindex(job_id, job)
+        self.finished_jobs.pop(job_id, None)
+        del self.jobs[job_id]
+        discard_seq(self.seqs, job.seq)
+        del self.job_ids_by_seq[job.seq]
+        self._notify_status_waiters(job_id)
+
+    def _notify_status_waiters(self, job_id):
+        for status_changed in self.status_waiters.pop(job_id, []):
+            status_changed.set()
 
-JOB_DB = {}
+    def _index(self, job_id, job):
+        bisect.insort(self.status_index.setdefault(job.status, []), job.seq)
+        if job.workflow_uuid is not None:
+            bisect.insort(
+                self.workflow_index.setdefault(job.workflow_uuid, []),
+                job.seq)
+        if job.status not in self.FINAL_STATUSES and \
+                job.backend_job_id is not None:
+            self.backend_job_id_index[str(job.backend_job_id)] = job_id
+        if job.deleted and job_id not in self.finished_jobs:
+            self.finished_jobs[job_id] = time.time()
+
+    def _unindex(self, job_id, job):
+        discard_seq(self.status_index.get(job.status, []), job.seq)
+        workflow_seqs = self.workflow_index.get(job.workflow_uuid)
+        if workflow_seqs is not None:
+            discard_seq(workflow_seqs, job.seq)
+            if not workflow_seqs:
+                del self.workflow_index[job.workflow_uuid]
+        if job.backend_job_id is not None and \
+                self.backend_job_id_index.get(
+                    str(job.backend_job_id)) == job_id:
+            del self.backend_job_id_index[str(job.backend_job_id)]
+        if not job.deleted:
+            self.finished_jobs.pop(job_id, None)
+
+
+JOB_DB = JobStore()
+"""Jobs of the job controller."""
+
+
+def mark_job_deleted_in_db(job_id):
+    """Mark a job whose backend resources are cleaned up as deleted in DB.
+
+    Deleted jobs are not rehydrated by :func:`rehydrate_job_db`.
+
+    :param job_id: UUID which identifies the job.
+    """
+    try:
+        Session.query(Job).filter_by(id_=job_id).update(dict(deleted=True))
+        Session.commit()
+    except Exception as e:
+        Session.rollback()
+        logging.debug('Could not mark job {0} as deleted in DB.'.format(
+            job_id))
+        logging.debug('Exception: {}'.format(str(e)))
+
+
+def rehydrate_job_db(job_db, page_size=None, max_age=None, max_jobs=None):
+    """Load the unfinished jobs from the DB into the job store.
+
+    Used on startup so jobs submitted before a restart of the job controller
+    are followed by the watchers again. Jobs are loaded page by page, only
+    with the columns the job store needs.
+
+    :param job_db: :class:`JobStore` to add the jobs to.
+    :param page_size: Number of jobs loaded per query.
+    :param max_age: Seconds after their creation jobs are not loaded.
+    :param max_jobs: Maximum number of jobs loaded.
+    :returns: Number of loaded jobs.
+    """
+    page_size = page_size or config.JOB_DB_REHYDRATION_PAGE_SIZE
+    max_age = max_age or config.JOB_DB_REHYDRATION_MAX_AGE
+    max_jobs = max_jobs or config.JOB_DB_REHYDRATION_MAX_JOBS
+    created_after = datetime.utcnow() - timedelta(seconds=max_age)
+    unfinished_statuses = [JobStatus.created, JobStatus.queued,
+                           JobStatus.running]
+    columns = (Job.id_, Job.name, Job.workflow_uuid, Job.backend,
+               Job.backend_job_id, Job.docker_img, Job.cmd, Job.cvmfs_mounts,
+               Job.restart_count, Job.max_restart_count)
+    loaded_jobs = 0
+    last_id = None
+    try:
+        while True:
+            query = Session.query(*columns).filter(
+                Job.status.in_(unfinished_statuses),
+                Job.deleted.isnot(True),
+                Job.backend.in_(config.JOB_BACKENDS),
+                Job.backend_job_id.isnot(None),
+                Job.created >= created_after)
+            if last_id is not None:
+                query = query.filter(Job.id_ > last_id)
+            page = query.order_by(Job.id_).limit(page_size).all()
+            for job in page:
+                job_id = str(job.id_)
+                if job_id in job_db:
+                    continue
+                if loaded_jobs >= max_jobs:
+                    logging.warning('Only the first {0} unfinished jobs were '
+                                    'loaded from the DB.'.format(max_jobs))
+                    return loaded_jobs
+                try:
+                    cmd = json.loads(job.cmd)
+                except (TypeError, ValueError):
+                    cmd = job.cmd
+                job_db.add(job_id,
+                           job_name=job.name,
+                           workflow_uuid=str(job.workflow_uuid),
+                           backend=job.backend,
+                           backend_job_id=job.backend_job_id,
+                           docker_img=job.docker_img,
+                           cmd=cmd,
+                           cvmfs_mounts=job.cvmfs_mounts,
+                           experiment='',
+                           status='started',
+                           restart_count=job.restart_count or 0,
+                           max_restart_count=job.max_restart_count or 0,
+                           deleted=False)
+                loaded_jobs += 1
+            if len(page) < page_size:
+                break
+            last_id = page[-1].id_
+    finally:
+        Session.remove()
+    return loaded_jobs
 
 
 def retrieve_job(job_id):
@@ -36,71 +469,139 @@ def retrieve_job(job_id):
     }
 
 
-def retrieve_k8s_job(job_id):
-    """Retrieve the Kubernetes job.
+def retrieve_backend_job_id(job_id):
+    """Retrieve backend job id.
 
     :param job_id: String which represents the ID of the job.
-    :returns: The :class:`kubernetes.client.models.v1_job.V1Job` object.
+    :returns: job_id in a specific backend.
     """
-    return JOB_DB[job_id]['obj']
+    return JOB_DB[job_id].backend_job_id
 
-def retrieve_condor_job(job_id):
-    """Retrieve the Condor job.
 
-    :param job_id: String which represents the ID of the job.
-    :returns: The string of the HTCondor job assigned to the job_id.
+JOB_FIELDS = ('cmd', 'cvmfs_mounts', 'docker_img', 'experiment', 'job_id',
+              'max_restart_count', 'restart_count', 'status')
+"""Fields of the jobs returned by the API."""
+
+
+def retrieve_all_jobs(status=None, workflow_uuid=None, after=None,
+                      limit=None, fields=None):
+    """Retrieve all jobs in the DB.
+
+    :param status: Only retrieve the jobs with this status.
+    :param workflow_uuid: Only retrieve the jobs of this workflow.
+    :param after: Cursor returned with the previous page of jobs.
+    :param limit: Maximum number of jobs to retrieve.
+    :param fields: Fields of the jobs to retrieve, defaults to all of
+        ``JOB_FIELDS``.
+    :return: Tuple with a list with the current job objects and the cursor of
+        the next page of jobs, None if there are no more jobs.
     """
-    return JOB_DB[job_id]['obj']
+    jobs, next_after = JOB_DB.page(status=status,
+                                   workflow_uuid=workflow_uuid,
+                                   after=after, limit=limit)
+    fields = fields or JOB_FIELDS
+    job_list = []
+    for job in jobs:
+        job_dict = {}
+        for field in fields:
+            if field in ('cmd', 'cvmfs_mounts'):
+                job_dict[field] = job[field] or \
+                    ('' if field == 'cmd' else [])
+            else:
+                job_dict[field] = job[field]
+        job_list.append({job.job_id: job_dict})
+    return job_list, next_after
 
-def retrieve_backend_job_id(job_id):
-    """Retrieve backend job id.
 
-    :param job_id: String which represents the ID of the job.
-    :returns: job_id in a specific backend.
+def retrieve_jobs_summary():
+    """Retrieve the number of jobs in the DB per status.
+
+    :return: Dictionary with the number of jobs of each status.
     """
-    return JOB_DB[job_id]['backend_job_id']
+    return JOB_DB.count_by_status()
 
 
-def retrieve_all_jobs():
-    """Retrieve all jobs in the DB.
+class JobInputHashCache(object):
+    """Input hashes of the most recently looked up jobs.
 
-    :return: A list with all current job objects.
+    Hashes are computed by :func:`reana_commons.utils.calculate_job_input_hash`
+    and memoized by digest of the workflow specification and job
+    specification.
     """
-    job_list = []
-    for job_id in JOB_DB:
-        job = JOB_DB[job_id]
-        job_list.append({
-            job_id: {
-                "cmd": job['cmd']
-                if job.get('cmd') else '',
-                "cvmfs_mounts": job['cvmfs_mounts']
-                if job.get('cvmfs_mounts') else [],
-                "docker_img": job['docker_img'],
-                "experiment": job['experiment'],
-                "job_id": job['job_id'],
-                "max_restart_count": job['max_restart_count'],
-                "restart_count": job['restart_count'],
-                "status": job['status']
-            }
-        })
-    return job_list
 
+    def __init__(self, size=None):
+        """Instantiate empty cache.
 
-def job_is_cached(job_spec, workflow_json, workflow_workspace):
-    """Check if job result exists in the cache."""
-    input_hash = calculate_job_input_hash(job_spec, workflow_json)
-    workspace_hash = calculate_hash_of_dir(workflow_workspace)
+        :param size: Maximum number of input hashes kept.
+        """
+        self.size = size or config.JOB_INPUT_HASH_CACHE_SIZE
+        self.lock = threading.Lock()
+        self.input_hashes = OrderedDict()
+
+    def calculate_hashes(self, job_specs, workflow_json):
+        """Calculate the input hashes of several jobs of the same workflow.
+
+        :param job_specs: List of job specifications.
+        :param workflow_json: Specification of the workflow.
+        :returns: List with the input hash of each job.
+        """
+        workflow_digest = md5(json.dumps(
+            workflow_json, sort_keys=True).encode('utf-8')).hexdigest()
+        input_hashes = []
+        for job_spec in job_specs:
+            key = (workflow_digest, json.dumps(job_spec, sort_keys=True))
+            with self.lock:
+                input_hash = self.input_hashes.get(key)
+                if input_hash is not None:
+                    self.input_hashes.move_to_end(key)
+            if input_hash is None:
+                # The job specification is modified by reana-commons.
+                input_hash = calculate_job_input_hash(dict(job_spec),
+                                                      workflow_json)
+                with self.lock:
+                    self.input_hashes[key] = input_hash
+                    while len(self.input_hashes) > self.size:
+                        self.input_hashes.popitem(last=False)
+            input_hashes.append(input_hash)
+        return input_hashes
+
+
+JOB_INPUT_HASH_CACHE = JobInputHashCache()
+"""Input hashes of the jobs looked up in the job cache."""
+
+
+def jobs_are_cached(job_specs, workflow_json, workflow_workspace):
+    """Check if the results of several jobs of a workflow exist in the cache.
+
+    The workspace is hashed once and all jobs are looked up with one query.
+
+    :param job_specs: List of job specifications.
+    :param workflow_json: Specification of the workflow.
+    :param workflow_workspace: Path of the workspace of the workflow.
+    :returns: List with, for each job, its cache entry or None.
+    """
+    # Running jobs and uploads modify the workspace without any job status
+    # change, so it is always checked for changes, only changed files are
+    # read again.
+    workspace_hash = WORKSPACE_HASH_CACHE.calculate_hash(workflow_workspace)
     if workspace_hash == -1:
-        return None
+        return [None] * len(job_specs)
+
+    input_hashes = JOB_INPUT_HASH_CACHE.calculate_hashes(job_specs,
+                                                         workflow_json)
+    cached_jobs = {}
+    for cached_job in Session.query(JobCache).filter(
+            JobCache.parameters.in_(set(input_hashes)),
+            JobCache.workspace_hash == workspace_hash):
+        cached_jobs.setdefault(cached_job.parameters, {
+            'result_path': cached_job.result_path,
+            'job_id': cached_job.job_id})
+    return [cached_jobs.get(input_hash) for input_hash in input_hashes]
 
-    cached_job = Session.query(JobCache).filter_by(
-        parameters=input_hash,
-        workspace_hash=workspace_hash).first()
-    if cached_job:
-        return {'result_path': cached_job.result_path,
-                'job_id': cached_job.job_id}
-    else:
-        return None
+
+def job_is_cached(job_spec, workflow_json, workflow_workspace):
+    """Check if job result exists in the cache."""
+    return jobs_are_cached([job_spec], workflow_json, workflow_workspace)[0]
 
 
 def job_exists(job_id):
@@ -113,9 +614,16 @@ def job_exists(job_id):
 
 
 def retrieve_job_logs(job_id):
-    """Retrieve job's logs.
+    """Retrieve job's logs kept in memory.
+
+    Stored logs are not read here, they are streamed by
+    :func:`reana_job_controller.job_logs.stream_job_logs`.
 
     :param job_id: UUID which identifies the job.
-    :returns: Job's logs.
+    :returns: Job's logs, or None if they are stored or not available yet.
     """
-    return JOB_DB[job_id].get('log')
+    job = JOB_DB[job_id]
+    log_path = job.get('log_path')
+    if log_path and os.path.exists(log_path):
+        return None
+    return job.get('log')
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of REANA.
+# Copyright (C) 2019 CERN.
+#
+# REANA is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""REANA-Job-Controller job status events."""
+
+import itertools
+import json
+import threading
+import uuid
+from collections import deque
+
+from reana_job_controller import config
+
+
+class JobEventBuffer(object):
+    """Bounded buffer of the latest job status transitions.
+
+    Events get consecutive IDs, so clients can resume from the last event
+    they received as long as it is still in the buffer. The IDs sent to the
+    clients are prefixed with an epoch which changes at every start, so the
+    IDs sent before a restart are not mistaken for the ones after it.
+    """
+
+    def __init__(self, size=None):
+        """Instantiate empty buffer.
+
+        :param size: Maximum number of events kept for replay.
+        """
+        self.events = deque(maxlen=size or config.JOB_EVENTS_REPLAY_SIZE)
+        self.last_event_id = 0
+        self.epoch = uuid.uuid4().hex[:12]
+        self.condition = threading.Condition()
+
+    def format_event_id(self, event_id):
+        """Build the ID of an event sent to the clients.
+
+        :param event_id: ID of the event in the buffer.
+        :returns: ID prefixed with the epoch of the buffer, e.g.
+            ``3f2c9a1b7e4d-42``.
+        """
+        return '{0}-{1}'.format(self.epoch, event_id)
+
+    def parse_event_id(self, sent_event_id):
+        """Get the ID in the buffer of an event sent to a client.
+
+        :param sent_event_id: ID of the event as sent to the client.
+        :returns: ID of the event, or 0 if it was sent before a restart,
+            so that the client receives all the buffered events.
+        :raises ValueError: If the ID is malformed.
+        """
+        epoch, _, event_id = sent_event_id.rpartition('-')
+        event_id = int(event_id)
+        return event_id if epoch == self.epoch else 0
+
+    def publish(self, job_id, workflow_uuid, status):
+        """Add the status transition of a job and wake up the consumers.
+
+        :param job_id: UUID which identifies the job.
+        :param workflow_uuid: UUID of the workflow of the job.
+        :param status: New status of the job.
+        """
+        with self.condition:
+            self.last_event_id += 1
+            self.events.append({'id': self.last_event_id,
+                                'job_id': job_id,
+                                'workflow_uuid': workflow_uuid,
+                                'status': status})
+            self.condition.notify_all()
+
+    def events_after(self, event_id, timeout=None):
+        """Get the events following a given one, waiting for them if needed.
+
+        :param event_id: ID of the last event already received.
+        :param timeout: Maximum number of seconds to wait for new events.
+        :returns: List of events, oldest first. Events already dropped from
+            the buffer are skipped. If the event is newer than the last one,
+            all the buffered events are returned.
+        """
+        with self.condition:
+            if event_id > self.last_event_id:
+                event_id = 0
+            self.condition.wait_for(
+                lambda: self.last_event_id > event_id, timeout)
+            if not self.events:
+                return []
+            start = max(event_id + 1 - self.events[0]['id'], 0)
+            return list(itertools.islice(self.events, start, None))
+
+
+def stream_job_events(job_events, workflow_uuid=None, last_event_id=None):
+    """Stream job status events in the Server-Sent Events format.
+
+    :param job_events: :class:`JobEventBuffer` to read the events from.
+    :param workflow_uuid: Only stream the events of this workflow.
+    :param last_event_id: ID of the last event received by the client, only
+        newer events are streamed. If not set, only new events are streamed.
+    :returns: Generator of strings.
+    """
+    if last_event_id is None:
+        last_event_id = job_events.last_event_id
+    while True:
+        events = job_events.events_after(
+            last_event_id, timeout=config.JOB_EVENTS_KEEPALIVE_INTERVAL)
+        if not events:
+            # Comment lines keep the connection open through proxies.
+            yield ': keepalive\n\n'
+            continue
+        for event in events:
+            last_event_id = event['id']
+            if workflow_uuid and event['workflow_uuid'] != workflow_uuid:
+                continue
+            yield 'id: {0}\nevent: status\ndata: {1}\n\n'.format(
+                job_events.format_event_id(event['id']), json.dumps(event))
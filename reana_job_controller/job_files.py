@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of REANA.
+# Copyright (C) 2019 CERN.
+#
+# REANA is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""REANA-Job-Controller distribution of the files needed by the jobs.
+
+The job wrapper and its helper binaries are published on the shared volume
+under the SHA-256 of their content, ``<directory>/<sha256>/<name>``, so a
+published file never changes and can be cached on the worker nodes.
+
+The input manifest of a job lists the files of its workspace, one line per
+file with its SHA-256, size and relative path separated by tabs. The job
+wrapper only transfers the files listed whose content is not already cached
+on its node, and stages back the ones which changed.
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import traceback
+from concurrent import futures
+from urllib.request import urlopen
+
+from reana_job_controller import config
+from reana_job_controller.workspace_hash import WORKSPACE_HASH_CACHE
+
+
+def calculate_file_sha256(file_path):
+    """Calculate the SHA-256 of a file.
+
+    :param file_path: Path of the file.
+    :returns: Hex digest of the file.
+    """
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as file_object:
+        for chunk in iter(lambda: file_object.read(1024 * 1024), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+class JobFilePublisher(object):
+    """Publish files for the jobs once, under their content hash."""
+
+    DOWNLOAD_RETRY_INTERVAL = 600
+    """Seconds to wait before trying again a download which failed."""
+
+    DOWNLOAD_TIMEOUT = 60
+    """Seconds to wait for the download source to answer."""
+
+    DOWNLOAD_MAX_DURATION = 600
+    """Seconds after which a download is abandoned."""
+
+    def __init__(self, directory=None):
+        """Instantiate publisher.
+
+        :param directory: Directory on the shared volume where files are
+            published.
+        """
+        self.directory = directory or config.JOB_FILES_PATH
+        self.lock = threading.Lock()
+        self.published = {}
+        self.downloads = {}
+        self.failed_downloads = {}
+
+    def publish(self, source, name=None):
+        """Publish a local file.
+
+        :param source: Path of the file to publish.
+        :param name: Name of the published file, the one of `source` by
+            default.
+        :returns: Tuple with the path and the SHA-256 of the published file.
+        """
+        key = (source, name)
+        with self.lock:
+            if key not in self.published:
+                self.published[key] = self._publish(
+                    source, name or os.path.basename(source))
+            return self.published[key]
+
+    def publish_url(self, url, name):
+        """Download a file in background and publish it.
+
+        :param url: URL of the file.
+        :param name: Name of the published file.
+        :returns: Tuple with the path and the SHA-256 of the published file,
+            or None while the file is downloaded or if it could not be
+            downloaded.
+        """
+        key = (url, name)
+        with self.lock:
+            if key in self.published:
+                return self.published[key]
+            if key in self.downloads or \
+                    time.time() - self.failed_downloads.get(key, 0) < \
+                    self.DOWNLOAD_RETRY_INTERVAL:
+                return None
+            thread = threading.Thread(target=self._download,
+                                      args=(url, name))
+            thread.daemon = True
+            self.downloads[key] = thread
+        thread.start()
+        return None
+
+    def _download(self, url, name):
+        key = (url, name)
+        download_path = None
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            deadline = time.time() + self.DOWNLOAD_MAX_DURATION
+            with tempfile.NamedTemporaryFile(
+                    dir=self.directory, delete=False) as download:
+                download_path = download.name
+                response = urlopen(url, timeout=self.DOWNLOAD_TIMEOUT)
+                for chunk in iter(lambda: response.read(1024 * 1024), b''):
+                    if time.time() > deadline:
+                        raise TimeoutError('Download took more than {0} '
+                                           'seconds.'.format(
+                                               self.DOWNLOAD_MAX_DURATION))
+                    download.write(chunk)
+            published = self._publish(download_path, name)
+            with self.lock:
+                self.published[key] = published
+        except Exception as e:
+            logging.error(traceback.format_exc())
+            logging.error('Could not download {0}: {1}'.format(url, e))
+            with self.lock:
+                self.failed_downloads[key] = time.time()
+        finally:
+            with self.lock:
+                self.downloads.pop(key, None)
+            if download_path and os.path.exists(download_path):
+                os.remove(download_path)
+
+    def publish_content(self, content, name):
+        """Publish a file generated by the job controller.
+
+        :param content: Byte string with the content of the file.
+        :param name: Name of the published file.
+        :returns: Tuple with the path and the SHA-256 of the published file.
+        """
+        sha256 = hashlib.sha256(content).hexdigest()
+        path = os.path.join(self.directory, sha256, name)
+        if os.path.exists(path):
+            # The age of the file tells when it was last used.
+            os.utime(path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with tempfile.NamedTemporaryFile(
+                    dir=os.path.dirname(path), delete=False) as copy:
+                copy.write(content)
+            os.chmod(copy.name, 0o644)
+            os.rename(copy.name, path)
+        return path, sha256
+
+    def _publish(self, source, name):
+        sha256 = calculate_file_sha256(source)
+        path = os.path.join(self.directory, sha256, name)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Other controllers may publish the same file at the same time,
+            # the file is only visible once it is complete.
+            with tempfile.NamedTemporaryFile(
+                    dir=os.path.dirname(path), delete=False) as copy:
+                with open(source, 'rb') as source_file:
+                    shutil.copyfileobj(source_file, copy)
+            os.chmod(copy.name, 0o755)
+            os.rename(copy.name, path)
+        return path, sha256
+
+
+JOB_FILES = JobFilePublisher()
+"""Files published for the jobs of this job controller."""
+
+
+class WorkspaceManifestCache(object):
+    """Input manifests of the workspaces, built in background.
+
+    The files of a workspace are listed by its index in
+    ``WORKSPACE_HASH_CACHE``, which the job cache also uses, so unchanged
+    files are not read again. Submissions wait for the manifest at most
+    ``INPUT_MANIFEST_BUILD_TIMEOUT`` seconds, the manifest of a workspace is
+    only built once at a time for a given version of the workspace.
+    """
+
+    MANIFEST_NAME = 'reana_input_manifest.tsv'
+    """Name of the manifest transferred with the jobs."""
+
+    CLEANUP_INTERVAL = 3600
+    """Seconds between two removals of the old manifests."""
+
+    def __init__(self, hash_cache=None, workers=None, timeout=None,
+                 publisher=None):
+        """Instantiate cache.
+
+        :param hash_cache: :class:`WorkspaceHashCache` listing the files,
+            ``WORKSPACE_HASH_CACHE`` by default.
+        :param workers: Number of threads building manifests.
+        :param timeout: Seconds to wait for a manifest.
+        :param publisher: :class:`JobFilePublisher` publishing the manifests,
+            ``JOB_FILES`` by default.
+        """
+        self.hash_cache = hash_cache or WORKSPACE_HASH_CACHE
+        self.timeout = timeout if timeout is not None \
+            else config.INPUT_MANIFEST_BUILD_TIMEOUT
+        self.publisher = publisher or JOB_FILES
+        self.executor = futures.ThreadPoolExecutor(
+            max_workers=workers or config.INPUT_MANIFEST_BUILD_WORKERS)
+        self.lock = threading.Lock()
+        self.builds = {}
+        self.last_cleanup = 0
+
+    @staticmethod
+    def build_manifest(files):
+        """Build an input manifest.
+
+        :param files: List of ``(relative path, size, sha256)`` tuples.
+        :returns: Byte string with the manifest.
+        """
+        lines = []
+        for relative_path, size, sha256 in sorted(files):
+            if '\t' in relative_path or '\n' in relative_path:
+                logging.warning('File {0} can not be listed in the input '
+                                'manifest.'.format(relative_path))
+                continue
+            lines.append('{0}\t{1}\t{2}\n'.format(sha256, size,
+                                                  relative_path))
+        return ''.join(lines).encode('utf-8', 'surrogateescape')
+
+    def publish_manifest(self, workspace, version=None):
+        """Build and publish the input manifest of a workspace.
+
+        :param workspace: Path of the workspace.
+        :param version: Value which changes whenever the workspace may have
+            been modified, see :class:`WorkspaceHashCache`.
+        :returns: Path of the published manifest, or None if the workspace
+            can not be scanned.
+        """
+        files = self.hash_cache.list_files(workspace, version)
+        if files is None:
+            return None
+        path, _ = self.publisher.publish_content(
+            self.build_manifest(files), self.MANIFEST_NAME)
+        if time.time() - self.last_cleanup > self.CLEANUP_INTERVAL:
+            self.last_cleanup = time.time()
+            self.remove_old_manifests()
+        return path
+
+    def get(self, workspace, version=None):
+        """Get the input manifest of a workspace.
+
+        :param workspace: Path of the workspace.
+        :param version: Value which changes whenever the workspace may have
+            been modified, see :class:`WorkspaceHashCache`.
+        :returns: Path of the published manifest, or None if it is not ready
+            in time or can not be built.
+        """
+        key = (workspace, version)
+        with self.lock:
+            future = self.builds.get(key)
+            started = future is None
+            if started:
+                future = self.executor.submit(self.publish_manifest,
+                                              workspace, version)
+                self.builds[key] = future
+        if started:
+            future.add_done_callback(
+                lambda _: self._forget_build(key, future))
+        try:
+            return future.result(timeout=self.timeout)
+        except futures.TimeoutError:
+            logging.info('Input manifest of {0} not ready, the whole '
+                         'workspace is transferred.'.format(workspace))
+            return None
+
+    def _forget_build(self, key, future):
+        with self.lock:
+            if self.builds.get(key) is future:
+                del self.builds[key]
+
+    def remove_old_manifests(self, max_age=None):
+        """Remove the manifests no job was submitted with for a while.
+
+        :param max_age: Seconds since the last use of the manifests to
+            remove, ``INPUT_MANIFEST_MAX_AGE`` by default.
+        """
+        max_age = max_age or config.INPUT_MANIFEST_MAX_AGE
+        try:
+            entries = list(os.scandir(self.publisher.directory))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            path = os.path.join(entry.path, self.MANIFEST_NAME)
+            try:
+                if time.time() - os.path.getmtime(path) < max_age:
+                    continue
+                os.remove(path)
+                os.rmdir(entry.path)
+            except OSError:
+                # Not a manifest, or removed by another job controller.
+                pass
+
+
+INPUT_MANIFESTS = WorkspaceManifestCache()
+"""Input manifests of the workspaces of the submitted jobs."""
@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of REANA.
+# Copyright (C) 2019 CERN.
+#
+# REANA is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""REANA-Job-Controller job logs streaming."""
+
+import os
+import time
+from collections import deque
+
+from reana_commons.config import K8S_DEFAULT_NAMESPACE
+from reana_commons.k8s.api_client import current_k8s_corev1_api_client
+
+from reana_job_controller import config
+from reana_job_controller.htcondor_job_manager import (get_output_paths,
+                                                       parse_condor_job_id)
+from reana_job_controller.job_db import JOB_DB
+from reana_job_controller.log_storage import open_job_log
+
+
+def find_tail_offset(log_file, lines):
+    """Find the offset where the last lines of a file start.
+
+    The file is read backwards, chunk by chunk, so only the end of it is
+    read.
+
+    :param log_file: File object opened in binary mode.
+    :param lines: Number of lines.
+    :returns: Offset of the first of the last `lines` lines.
+    """
+    log_file.seek(0, os.SEEK_END)
+    position = log_file.tell()
+    if not lines:
+        return position
+    # A trailing newline terminates the last line, it does not start one.
+    log_file.seek(max(position - 1, 0))
+    newlines = -1 if log_file.read(1) == b'\n' else 0
+    while position > 0:
+        read_size = min(config.JOB_LOGS_CHUNK_SIZE, position)
+        position -= read_size
+        log_file.seek(position)
+        chunk = log_file.read(read_size)
+        index = len(chunk)
+        while True:
+            index = chunk.rfind(b'\n', 0, index)
+            if index == -1:
+                break
+            newlines += 1
+            if newlines == lines:
+                return position + index + 1
+    return 0
+
+
+def stream_file(path, offset=0, limit=None, tail=None, is_finished=None):
+    """Stream a log file chunk by chunk.
+
+    :param path: Path of the log file.
+    :param offset: Number of bytes to skip.
+    :param limit: Maximum number of bytes to stream.
+    :param tail: Only stream the last `tail` lines, ignoring `offset`.
+    :param is_finished: Callable telling whether the file is complete. If
+        given, new content is waited for until it returns True.
+    """
+    while not os.path.exists(path):
+        if not is_finished or is_finished():
+            return
+        time.sleep(config.JOB_LOGS_FOLLOW_INTERVAL)
+    with open(path, 'rb') as log_file:
+        if tail is not None:
+            offset = find_tail_offset(log_file, tail)
+        log_file.seek(offset)
+        remaining = limit
+        while remaining is None or remaining > 0:
+            read_size = config.JOB_LOGS_CHUNK_SIZE
+            if remaining is not None:
+                read_size = min(read_size, remaining)
+            # Check before reading, so output written right before the end of
+            # the job is still streamed.
+            finished = not is_finished or is_finished()
+            chunk = log_file.read(read_size)
+            if chunk:
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+            elif finished:
+                return
+            else:
+                time.sleep(config.JOB_LOGS_FOLLOW_INTERVAL)
+
+
+def stream_text(text, offset=0, limit=None, tail=None):
+    """Stream a log kept in memory with the same options as a log file.
+
+    :param text: Log content.
+    :param offset: Number of bytes to skip.
+    :param limit: Maximum number of bytes to stream.
+    :param tail: Only stream the last `tail` lines, ignoring `offset`.
+    """
+    content = (text or '').encode('utf-8')
+    if tail is not None:
+        content = b''.join(content.splitlines(True)[-tail:]) if tail else b''
+        offset = 0
+    end = len(content) if limit is None else offset + limit
+    for start in range(offset, min(end, len(content)),
+                       config.JOB_LOGS_CHUNK_SIZE):
+        yield content[start:min(start + config.JOB_LOGS_CHUNK_SIZE, end)]
+
+
+def stream_stored_log(log_path, offset=0, limit=None, tail=None):
+    """Stream a stored job log without uncompressing it all in memory.
+
+    :param log_path: Path of the stored log.
+    :param offset: Number of bytes to skip.
+    :param limit: Maximum number of bytes to stream.
+    :param tail: Only stream the last `tail` lines, ignoring `offset`.
+    """
+    with open_job_log(log_path) as log_file:
+        if tail is not None:
+            lines = deque(log_file, maxlen=tail) if tail else []
+            chunks = iter(lines)
+            offset = 0
+        else:
+            chunks = iter(
+                lambda: log_file.read(config.JOB_LOGS_CHUNK_SIZE), b'')
+        for chunk in limit_stream(chunks, offset, limit):
+            yield chunk
+
+
+def limit_stream(chunks, offset=0, limit=None):
+    """Skip the first bytes of a stream and cap its size.
+
+    :param chunks: Iterable of byte strings.
+    :param offset: Number of bytes to skip.
+    :param limit: Maximum number of bytes to stream.
+    """
+    for chunk in chunks:
+        if offset:
+            skipped = min(offset, len(chunk))
+            chunk = chunk[skipped:]
+            offset -= skipped
+        if limit is not None:
+            chunk = chunk[:limit]
+            limit -= len(chunk)
+        if chunk:
+            yield chunk
+        if limit == 0:
+            return
+
+
+def tail_stream(chunks, lines):
+    """Keep only the last lines of a stream.
+
+    :param chunks: Iterable of byte strings.
+    :param lines: Number of lines.
+    :returns: Iterator of the last `lines` lines.
+    """
+    last_lines = deque(maxlen=lines)
+    line = b''
+    for chunk in chunks:
+        line += chunk
+        *complete_lines, line = line.split(b'\n')
+        last_lines.extend(complete_line + b'\n'
+                          for complete_line in complete_lines)
+    if line:
+        last_lines.append(line)
+    return iter(last_lines)
+
+
+def stream_file_tail(path, max_size):
+    """Stream the end of a file without reading what comes before.
+
+    :param path: Path of the file.
+    :param max_size: Maximum number of bytes to stream.
+    :returns: Generator of byte strings, starting with a marker if the start
+        of the file was skipped. Nothing is streamed if the file is missing.
+    """
+    try:
+        log_file = open(path, 'rb')
+    except FileNotFoundError:
+        return
+    with log_file:
+        size = log_file.seek(0, os.SEEK_END)
+        offset = max(size - max_size, 0)
+        if offset:
+            yield '[... {0} bytes omitted ...]\n'.format(offset).encode()
+        log_file.seek(offset)
+        # Output appended meanwhile is ignored, so the cap holds.
+        chunks = iter(lambda: log_file.read(config.JOB_LOGS_CHUNK_SIZE), b'')
+        for chunk in limit_stream(chunks, limit=size - offset):
+            yield chunk
+
+
+def stream_condor_job_output(backend_job_id, max_size=None, tail=None,
+                             is_finished=None):
+    """Stream the stdout of an HTCondor job followed by its stderr.
+
+    This is the view of the logs of HTCondor jobs in all modes, the stderr
+    follows a ``[stderr]`` line.
+
+    :param backend_job_id: HTCondor job ID, ``cluster`` or ``cluster.proc``.
+    :param max_size: Maximum number of bytes streamed from the end of each of
+        stdout and stderr, ``HTCONDOR_JOB_LOGS_MAX_SIZE`` by default.
+    :param tail: Start at the last `tail` lines of stdout, only used with
+        `is_finished`.
+    :param is_finished: Callable telling whether the job is finished. If
+        given, stdout is followed until it returns True, and the stderr is
+        streamed after.
+    """
+    max_size = max_size or config.HTCONDOR_JOB_LOGS_MAX_SIZE
+    output_path, error_path = get_output_paths(
+        *parse_condor_job_id(backend_job_id))
+    if is_finished:
+        output_chunks = stream_file(output_path, tail=tail,
+                                    is_finished=is_finished)
+    else:
+        output_chunks = stream_file_tail(output_path, max_size)
+    last_chunk = b'\n'
+    for chunk in output_chunks:
+        last_chunk = chunk
+        yield chunk
+    if os.path.exists(error_path) and os.path.getsize(error_path):
+        yield b'[stderr]\n' if last_chunk.endswith(b'\n') \
+            else b'\n[stderr]\n'
+        for chunk in stream_file_tail(error_path, max_size):
+            yield chunk
+
+
+def stream_k8s_job_logs(backend_job_id, offset=0, limit=None, tail=None,
+                        follow=False):
+    """Stream the logs of the last pod of a Kubernetes job.
+
+    :param backend_job_id: Name of the Kubernetes job, or
+        ``job_name.index`` for an item of a job array.
+    :param offset: Number of bytes to skip.
+    :param limit: Maximum number of bytes to stream.
+    :param tail: Only stream the last `tail` lines, ignoring `offset`.
+    :param follow: Whether to keep streaming until the pod finishes.
+    """
+    kubernetes_job_id, _, index = backend_job_id.partition('.')
+    pods = current_k8s_corev1_api_client.list_namespaced_pod(
+        namespace=K8S_DEFAULT_NAMESPACE,
+        label_selector='job-name={job_name}'.format(
+            job_name=kubernetes_job_id)).items
+    if index:
+        pods = [pod for pod in pods if (pod.metadata.annotations or {}).get(
+            config.K8S_JOB_COMPLETION_INDEX_ANNOTATION) == index]
+    if not pods:
+        return
+    kwargs = {'follow': follow, '_preload_content': False}
+    if tail is not None:
+        kwargs['tail_lines'] = tail
+        offset = 0
+    if limit is not None:
+        kwargs['limit_bytes'] = offset + limit
+    response = current_k8s_corev1_api_client.read_namespaced_pod_log(
+        name=pods[-1].metadata.name,
+        namespace=pods[-1].metadata.namespace,
+        **kwargs)
+    try:
+        for chunk in limit_stream(
+                response.stream(config.JOB_LOGS_CHUNK_SIZE), offset, limit):
+            yield chunk
+    finally:
+        response.release_conn()
+
+
+def stream_job_logs(job_id, offset=0, limit=None, tail=None, follow=False):
+    """Stream the logs of a job from where they are kept.
+
+    :param job_id: UUID which identifies the job.
+    :param offset: Number of bytes to skip.
+    :param limit: Maximum number of bytes to stream.
+    :param tail: Only stream the last `tail` lines, ignoring `offset`.
+    :param follow: Whether to keep streaming until the job finishes.
+    :returns: Generator of byte strings.
+    """
+    job = JOB_DB[job_id]
+    if job.get('log_path') and os.path.exists(job['log_path']):
+        return stream_stored_log(job['log_path'], offset=offset, limit=limit,
+                                 tail=tail)
+    if job.get('log') is not None:
+        return stream_text(job['log'], offset=offset, limit=limit, tail=tail)
+    if job.get('backend', 'HTCondor') == 'Kubernetes':
+        return stream_k8s_job_logs(job['backend_job_id'], offset=offset,
+                                   limit=limit, tail=tail, follow=follow)
+
+    def is_finished():
+        # The record is updated in place, also if evicted meanwhile.
+        return job.deleted
+
+    if follow:
+        chunks = stream_condor_job_output(job['backend_job_id'], tail=tail,
+                                          is_finished=is_finished)
+    else:
+        chunks = stream_condor_job_output(job['backend_job_id'])
+        if tail is not None:
+            chunks = tail_stream(chunks, tail)
+            offset = 0
+    return limit_stream(chunks, offset, limit)
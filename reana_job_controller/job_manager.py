@@ -8,15 +8,23 @@
 
 """Job Manager."""
 
+import copy
 import json
+import logging
+import queue
 import shlex
+import threading
+import time
+import traceback
 
-from reana_commons.utils import calculate_file_access_time
 from reana_db.database import Session
 from reana_db.models import Job as JobTable
-from reana_db.models import JobCache, JobStatus, Workflow
+from reana_db.models import JobStatus
 
+from reana_job_controller import config
 from reana_job_controller.config import MAX_JOB_RESTARTS
+from reana_job_controller.errors import JobDBCreationError
+from reana_job_controller.job_cache import JOB_CACHE_WORKER
 
 
 class JobManager():
@@ -47,15 +55,82 @@ class JobManager():
         self.workflow_uuid = workflow_uuid
 
     def execution_hook(fn):
-        """Add before execution hooks and DB operations."""
+        """Add before execution hooks and DB operations.
+
+        If the submitted job can not be created in DB, it is removed from
+        the backend and a :class:`JobDBCreationError` is raised.
+        """
         def wrapper(inst, *args, **kwargs):
             inst.before_execution()
             backend_job_id = fn(inst, *args, **kwargs)
-            inst.create_job_in_db(backend_job_id)
+            try:
+                inst.create_job_in_db(backend_job_id)
+            except Exception as e:
+                logging.error(traceback.format_exc())
+                raise inst.remove_unregistered_job(backend_job_id, e)
             inst.cache_job()
             return backend_job_id
         return wrapper
 
+    def batch_execution_hook(fn):
+        """Add before execution hooks and batched DB operations.
+
+        The decorated class method receives a list of job managers of the
+        same backend and returns, for each of them, either its backend job
+        id or the exception which prevented its submission. If the submitted
+        jobs can not be created in DB, they are removed from the backend and
+        reported with a :class:`JobDBCreationError`.
+        """
+        def wrapper(cls, job_managers, *args, **kwargs):
+            for job_manager in job_managers:
+                job_manager.before_execution()
+            backend_job_ids = fn(cls, job_managers, *args, **kwargs)
+            try:
+                cls.create_jobs_in_db(
+                    [(job_manager, backend_job_id) for job_manager,
+                     backend_job_id in zip(job_managers, backend_job_ids)
+                     if not isinstance(backend_job_id, Exception)])
+            except Exception as e:
+                logging.error(traceback.format_exc())
+                backend_job_ids = [
+                    backend_job_id if isinstance(backend_job_id, Exception)
+                    else cls.remove_unregistered_job(backend_job_id, e)
+                    for backend_job_id in backend_job_ids]
+            return backend_job_ids
+        return wrapper
+
+    def array_execution_hook(fn):
+        """Add before execution hooks and batched DB operations of arrays.
+
+        The decorated method receives the job managers of the items of the
+        array and returns the backend job ID of each of them.
+        """
+        def wrapper(inst, item_managers, *args, **kwargs):
+            inst.before_execution()
+            backend_job_ids = fn(inst, item_managers, *args, **kwargs)
+            inst.create_jobs_in_db(list(zip(item_managers, backend_job_ids)))
+            return backend_job_ids
+        return wrapper
+
+    @classmethod
+    def remove_unregistered_job(cls, backend_job_id, error):
+        """Remove a submitted job which could not be created in DB.
+
+        :param backend_job_id: Job ID in the computing backend.
+        :param error: Exception raised when creating the job in DB.
+        :returns: :class:`JobDBCreationError` to report for the job.
+        """
+        try:
+            cls.stop(backend_job_id)
+        except Exception:
+            logging.error(traceback.format_exc())
+            return JobDBCreationError(
+                'Job {0} could not be created in DB nor removed from the '
+                'computing backend: {1}'.format(backend_job_id, error))
+        return JobDBCreationError(
+            'Job could not be created in DB and was removed from the '
+            'computing backend: {0}'.format(error))
+
     def before_execution(self):
         """Before job submission hook."""
         pass
@@ -73,6 +148,46 @@ class JobManager():
         """
         raise NotImplementedError
 
+    @classmethod
+    def execute_batch(cls, job_managers):
+        """Execute several jobs of the same backend at once.
+
+        :param job_managers: List of job managers to submit.
+        :returns: List with, for each job manager, its backend job ID or
+            the exception which prevented its submission.
+        :rtype: list
+        """
+        raise NotImplementedError
+
+    def execute_array(self, item_managers):
+        """Execute the items of a job array as a single backend job.
+
+        :param item_managers: List of job managers of the items, built with
+            :meth:`build_array_item`.
+        :returns: List with the backend job ID of each item.
+        :rtype: list
+        """
+        raise NotImplementedError
+
+    def build_array_item(self, env_vars=None, args=''):
+        """Build the job manager of an item of a job array.
+
+        :param env_vars: Environment variables of the item, overriding the
+            ones of the job.
+        :type env_vars: dict
+        :param args: Arguments appended to the command of the job.
+        :type args: str
+        :returns: Copy of this job manager with the item substitutions.
+        """
+        item_manager = copy.copy(self)
+        item_manager.job_id = None
+        item_manager.env_vars = dict(self.env_vars, **(env_vars or {}))
+        if args and isinstance(self.cmd, str):
+            item_manager.cmd = '{0} {1}'.format(self.cmd, args).strip()
+        elif args:
+            item_manager.cmd = self.cmd + shlex.split(args)
+        return item_manager
+
     def get_status(self):
         """Get job status.
 
@@ -89,13 +204,23 @@ class JobManager():
         """
         raise NotImplementedError
 
-    def stop(self):
-        """Stop a job."""
+    @staticmethod
+    def stop(backend_job_id, asynchronous=True):
+        """Stop a job.
+
+        :param backend_job_id: Job ID in the computing backend.
+        :param asynchronous: Whether the function waits for the action to be
+            performed or does it asynchronously.
+        """
         raise NotImplementedError
 
-    def create_job_in_db(self, backend_job_id):
-        """Create job in db."""
-        job_db_entry = JobTable(
+    def build_job_db_entry(self, backend_job_id):
+        """Build job DB entry.
+
+        :param backend_job_id: Job ID in the computing backend.
+        :returns: :class:`reana_db.models.Job` ready to be added to the DB.
+        """
+        return JobTable(
             backend_job_id=backend_job_id,
             workflow_uuid=self.workflow_uuid,
             status=JobStatus.created.name,
@@ -110,21 +235,176 @@ class JobManager():
             deleted=False,
             name=self.job_id,
             prettified_cmd=json.dumps(self.cmd))
+
+    def create_job_in_db(self, backend_job_id):
+        """Create job in db."""
+        job_db_entry = self.build_job_db_entry(backend_job_id)
+        if config.JOB_DB_GROUP_COMMIT_INTERVAL:
+            self.job_id = JOB_DB_GROUP_COMMITTER.create(job_db_entry)
+            return
         Session.add(job_db_entry)
-        Session.commit()
+        # Reading the ID after the commit would open a new transaction.
+        Session.flush()
         self.job_id = str(job_db_entry.id_)
+        Session.commit()
 
     def cache_job(self):
-        """Cache a job."""
-        workflow = Session.query(Workflow).filter_by(
-            id_=self.workflow_uuid).one_or_none()
-        access_times = calculate_file_access_time(workflow.get_workspace())
-        prepared_job_cache = JobCache()
-        prepared_job_cache.job_id = self.job_id
-        prepared_job_cache.access_times = access_times
-        Session.add(prepared_job_cache)
-        Session.commit()
+        """Cache a job.
+
+        The cache entry is created in background, so the submission does not
+        wait for the workspace to be scanned.
+        """
+        JOB_CACHE_WORKER.submit(self.job_id, self.workflow_uuid)
+
+    @staticmethod
+    def create_jobs_in_db(submitted_jobs):
+        """Create jobs in DB in one transaction and queue their caching.
+
+        :param submitted_jobs: List of tuples (job manager, backend job id).
+        """
+        if not submitted_jobs:
+            return
+        job_db_entries = []
+        for job_manager, backend_job_id in submitted_jobs:
+            job_db_entry = job_manager.build_job_db_entry(backend_job_id)
+            Session.add(job_db_entry)
+            job_db_entries.append(job_db_entry)
+        try:
+            Session.flush()
+            for (job_manager, _), job_db_entry in zip(submitted_jobs,
+                                                      job_db_entries):
+                job_manager.job_id = str(job_db_entry.id_)
+            Session.commit()
+        except Exception:
+            Session.rollback()
+            raise
+        for job_manager, _ in submitted_jobs:
+            job_manager.cache_job()
 
     def update_job_status(self):
         """Update job status in DB."""
         pass
+
+
+class JobDBGroupCommitter(object):
+    """Create the DB rows of concurrently submitted jobs in one transaction.
+
+    Submitting threads hand their row over and wait, a single thread commits
+    all rows handed over during ``JOB_DB_GROUP_COMMIT_INTERVAL`` together, up
+    to ``JOB_DB_GROUP_COMMIT_MAX_SIZE`` rows. If a group can not be committed,
+    its rows are committed again one by one, so a single bad row only fails
+    its own submission.
+    """
+
+    def __init__(self, interval=None, max_size=None, timeout=None):
+        """Instantiate committer.
+
+        :param interval: Seconds during which rows are grouped.
+        :param max_size: Maximum number of rows committed together.
+        :param timeout: Seconds a submission waits for its row to be
+            committed.
+        """
+        self.interval = interval or config.JOB_DB_GROUP_COMMIT_INTERVAL
+        self.max_size = max_size or config.JOB_DB_GROUP_COMMIT_MAX_SIZE
+        self.timeout = timeout or config.JOB_DB_GROUP_COMMIT_TIMEOUT
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        """Start the committing thread if it is not running."""
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.work)
+                self.thread.daemon = True
+                self.thread.start()
+
+    def create(self, job_db_entry):
+        """Create a job row, waiting for the commit of its group.
+
+        A row which is still waiting for its group when the timeout expires
+        is not committed anymore.
+
+        :param job_db_entry: :class:`reana_db.models.Job` to create.
+        :returns: ID of the created job.
+        """
+        self.start()
+        pending = {'entry': job_db_entry, 'committed': threading.Event(),
+                   'taken': False, 'cancelled': False}
+        self.queue.put(pending)
+        if not pending['committed'].wait(self.timeout):
+            with self.lock:
+                if not pending['taken']:
+                    pending['cancelled'] = True
+            if pending['cancelled']:
+                raise TimeoutError('Job was not created in DB within {0} '
+                                   'seconds.'.format(self.timeout))
+            # The row is being committed, the DB bounds the wait.
+            pending['committed'].wait()
+        if 'error' in pending:
+            raise pending['error']
+        return pending['job_id']
+
+    def work(self):
+        """Commit the handed over rows group by group."""
+        while True:
+            group = [self.queue.get()]
+            deadline = time.time() + self.interval
+            while len(group) < self.max_size:
+                try:
+                    group.append(self.queue.get(
+                        timeout=max(deadline - time.time(), 0)))
+                except queue.Empty:
+                    break
+            self.commit(group)
+
+    def commit(self, group):
+        """Create the rows of a group, one by one if the group fails.
+
+        :param group: List of pending creations.
+        """
+        with self.lock:
+            group = [pending for pending in group if not pending['cancelled']]
+            for pending in group:
+                pending['taken'] = True
+        try:
+            try:
+                self.commit_rows(group)
+            except Exception as e:
+                if len(group) == 1:
+                    group[0]['error'] = e
+                    return
+                logging.warning('Could not create {0} jobs in DB together, '
+                                'creating them one by one: {1}'.format(
+                                    len(group), e))
+                for pending in group:
+                    try:
+                        self.commit_rows([pending])
+                    except Exception as e:
+                        pending['error'] = e
+        finally:
+            Session.remove()
+            for pending in group:
+                pending['committed'].set()
+
+    @staticmethod
+    def commit_rows(group):
+        """Create the rows of a group in one transaction.
+
+        :param group: List of pending creations.
+        """
+        if not group:
+            return
+        try:
+            Session.add_all([pending['entry'] for pending in group])
+            Session.flush()
+            for pending in group:
+                pending['job_id'] = str(pending['entry'].id_)
+            Session.commit()
+        except Exception:
+            Session.rollback()
+            raise
+
+
+JOB_DB_GROUP_COMMITTER = JobDBGroupCommitter()
+"""Committer grouping the job rows of concurrent submissions."""
@@ -9,111 +9,406 @@
 """Kubernetes wrapper."""
 
 import logging
+import queue
+import random
 import threading
+import time
 import traceback
 
 from flask import current_app as app
 from kubernetes import client, watch
 from kubernetes.client.models.v1_delete_options import V1DeleteOptions
 from kubernetes.client.rest import ApiException
+from reana_commons.config import K8S_DEFAULT_NAMESPACE
 from reana_commons.k8s.api_client import (current_k8s_batchv1_api_client,
                                           current_k8s_corev1_api_client)
-from reana_db.database import Session
-from reana_db.models import Job
 
 from reana_job_controller import config
+from reana_job_controller.job_db import mark_job_deleted_in_db
 from reana_job_controller.kubernetes_job_manager import KubernetesJobManager
+from reana_job_controller.log_storage import save_job_logs
 
 
-def k8s_watch_jobs(job_db):
+def process_k8s_job(job_db, job, finalization_pool):
+    """Update the job DB according to the state of a Kubernetes job.
+
+    :param job_db: :class:`JobStore` which contains all current jobs.
+    :param job: The :class:`kubernetes.client.models.v1_job.V1Job` object.
+    :param finalization_pool: :class:`K8sJobFinalizationPool` finished jobs
+        are handed to.
+    """
+    job_id = job_db.retrieve_job_id_by_backend_job_id(job.metadata.name)
+    if not job_db.get(job_id):
+        # The API server sets the completions of every job, only the
+        # Indexed Jobs are job arrays.
+        if job.spec and \
+                getattr(job.spec, 'completion_mode', None) == 'Indexed':
+            process_k8s_job_array(job_db, job, finalization_pool)
+        # Ignore jobs not created by this specific instance
+        # or already deleted jobs.
+        return
+    kubernetes_job_id = job.metadata.name
+    if job.status.succeeded:
+        logging.info(
+            'Job job_id: {}, kubernetes_job_id: {}'
+            ' succeeded.'.format(job_id, kubernetes_job_id)
+        )
+        job_db.update(job_id, status='succeeded')
+    elif (job.status.failed and
+          job.status.failed >= config.MAX_JOB_RESTARTS):
+        logging.info(
+            'Job job_id: {}, kubernetes_job_id: {} failed.'.format(
+                job_id,
+                kubernetes_job_id)
+        )
+        job_db.update(job_id, status='failed')
+    else:
+        return
+    # The job is not followed anymore, finalization happens in background.
+    finalization_pool.submit(job_id, kubernetes_job_id,
+                             job.metadata.namespace)
+
+
+K8S_JOB_ARRAY_SUCCEEDED_INDEXES = {}
+"""Indexes of the succeeded items of the followed job arrays, by job name."""
+
+
+def parse_completed_indexes(completed_indexes):
+    """Parse the completed indexes of a Kubernetes Indexed Job.
+
+    :param completed_indexes: Intervals of indexes, e.g. ``1,3-5``.
+    :returns: Set of indexes.
+    """
+    indexes = set()
+    for interval in (completed_indexes or '').split(','):
+        if interval:
+            first, _, last = interval.partition('-')
+            indexes.update(range(int(first), int(last or first) + 1))
+    return indexes
+
+
+def process_k8s_job_array(job_db, job, finalization_pool):
+    """Update the job DB according to the state of a Kubernetes job array.
+
+    The items of the array are the indexes of an Indexed Job, their backend
+    job IDs are ``job_name.index``. The succeeded items are read from the
+    ``completedIndexes`` of the job or, with older Kubernetes versions, from
+    its pods, which are only listed when more items succeeded since the last
+    event. The remaining items fail when the whole job fails.
+
+    :param job_db: :class:`JobStore` which contains all current jobs.
+    :param job: The :class:`kubernetes.client.models.v1_job.V1Job` object.
+    :param finalization_pool: :class:`K8sJobFinalizationPool` finished items
+        are handed to.
+    """
+    kubernetes_job_id = job.metadata.name
+    items = {}
+    for index in range(job.spec.completions):
+        job_id = job_db.retrieve_job_id_by_backend_job_id(
+            '{0}.{1}'.format(kubernetes_job_id, index))
+        if job_id:
+            items[index] = job_id
+    if not items:
+        K8S_JOB_ARRAY_SUCCEEDED_INDEXES.pop(kubernetes_job_id, None)
+        return
+    succeeded_indexes = K8S_JOB_ARRAY_SUCCEEDED_INDEXES.setdefault(
+        kubernetes_job_id, set())
+    completed_indexes = getattr(job.status, 'completed_indexes', None)
+    if completed_indexes:
+        succeeded_indexes.update(parse_completed_indexes(completed_indexes))
+    elif (job.status.succeeded or 0) > len(succeeded_indexes):
+        pods = current_k8s_corev1_api_client.list_namespaced_pod(
+            namespace=job.metadata.namespace,
+            label_selector='job-name={0}'.format(kubernetes_job_id),
+            field_selector='status.phase=Succeeded').items
+        for pod in pods:
+            index = (pod.metadata.annotations or {}).get(
+                config.K8S_JOB_COMPLETION_INDEX_ANNOTATION)
+            if index is not None:
+                succeeded_indexes.add(int(index))
+    job_failed = job.status.failed and \
+        job.status.failed >= config.MAX_JOB_RESTARTS
+    for index, job_id in sorted(items.items()):
+        if index in succeeded_indexes:
+            job_db.update(job_id, status='succeeded')
+        elif job_failed:
+            logging.info('Item {0} of job array kubernetes_job_id: {1} '
+                         'failed.'.format(index, kubernetes_job_id))
+            job_db.update(job_id, status='failed')
+        else:
+            continue
+        del items[index]
+        finalization_pool.submit(job_id, kubernetes_job_id,
+                                 job.metadata.namespace, index)
+    if not items:
+        K8S_JOB_ARRAY_SUCCEEDED_INDEXES.pop(kubernetes_job_id, None)
+
+
+def finalize_k8s_job(job_db, job_id, kubernetes_job_id, namespace,
+                     index=None):
+    """Collect the logs of a finished Kubernetes job and clean it up.
+
+    :param job_db: :class:`JobStore` which contains all current jobs.
+    :param job_id: ID of the job.
+    :param kubernetes_job_id: Name of the Kubernetes job.
+    :param namespace: Namespace of the Kubernetes job.
+    :param index: Index of the item if the job is an item of a job array.
+        Job arrays are deleted by Kubernetes once all items are finished.
+    """
+    if index is not None:
+        pods = current_k8s_corev1_api_client.list_namespaced_pod(
+            namespace=namespace,
+            label_selector='job-name={0}'.format(kubernetes_job_id)).items
+        pods = [pod for pod in pods if (pod.metadata.annotations or {}).get(
+            config.K8S_JOB_COMPLETION_INDEX_ANNOTATION) == str(index)]
+        if pods:
+            store_k8s_job_logs(job_db, job_id, pods[-1])
+        job_db.update(job_id, deleted=True)
+        mark_job_deleted_in_db(job_id)
+        return
+    # Grab logs when job either succeeds or fails.
+    logging.info('Getting last spawned pod for kubernetes'
+                 ' job {}'.format(kubernetes_job_id))
+    pods = current_k8s_corev1_api_client.list_namespaced_pod(
+        namespace=namespace,
+        label_selector='job-name={job_name}'.format(
+            job_name=kubernetes_job_id)).items
+    if pods:
+        logging.info('Grabbing pod {} logs...'.format(
+            pods[-1].metadata.name))
+        store_k8s_job_logs(job_db, job_id, pods[-1])
+    else:
+        logging.warning('No pod left for kubernetes job {}, its logs are '
+                        'lost.'.format(kubernetes_job_id))
+
+    logging.info('Cleaning Kubernetes job {} ...'.format(
+        kubernetes_job_id))
+    KubernetesJobManager.stop(kubernetes_job_id)
+    job_db.update(job_id, deleted=True)
+    mark_job_deleted_in_db(job_id)
+
+
+def store_k8s_job_logs(job_db, job_id, pod):
+    """Store the logs of the pod of a finished Kubernetes job.
+
+    :param job_db: :class:`JobStore` which contains all current jobs.
+    :param job_id: ID of the job.
+    :param pod: The :class:`kubernetes.client.models.v1_pod.V1Pod` object.
+    """
+    response = current_k8s_corev1_api_client.read_namespaced_pod_log(
+        namespace=pod.metadata.namespace,
+        name=pod.metadata.name,
+        _preload_content=False)
+    try:
+        save_job_logs(job_db, job_id,
+                      response.stream(config.JOB_LOGS_CHUNK_SIZE))
+    finally:
+        response.release_conn()
+
+
+class K8sJobFinalizationPool(object):
+    """Bounded pool of threads finalizing finished Kubernetes jobs.
+
+    Keeps slow log retrievals from delaying the processing of the events of
+    the other jobs by the watch thread. A finalization which fails is queued
+    again after a growing delay, up to ``K8S_FINALIZATION_MAX_ATTEMPTS``
+    times, since the watch thread does not find the job anymore.
+    """
+
+    def __init__(self, job_db, workers=None, queue_size=None):
+        """Instantiate pool.
+
+        :param job_db: :class:`JobStore` which contains all current jobs.
+        :param workers: Number of finalization threads.
+        :param queue_size: Maximum number of jobs waiting to be finalized,
+            the watch thread blocks when it is reached.
+        """
+        self.job_db = job_db
+        self.workers = workers or config.K8S_FINALIZATION_WORKERS
+        self.queue = queue.Queue(
+            maxsize=queue_size or config.K8S_FINALIZATION_QUEUE_SIZE)
+        self.lock = threading.Lock()
+        self.finalized_jobs = 0
+        self.failed_jobs = 0
+        self.retried_jobs = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def start(self):
+        """Start finalization threads."""
+        for _ in range(self.workers):
+            worker = threading.Thread(target=self.work)
+            worker.daemon = True
+            worker.start()
+
+    def submit(self, job_id, kubernetes_job_id, namespace, index=None):
+        """Queue a finished Kubernetes job for finalization.
+
+        :param job_id: ID of the job.
+        :param kubernetes_job_id: Name of the Kubernetes job.
+        :param namespace: Namespace of the Kubernetes job.
+        :param index: Index of the item if the job is an item of a job array.
+        """
+        self.queue.put((job_id, kubernetes_job_id, namespace, index,
+                        time.time(), 1))
+
+    def work(self):
+        """Finalize queued jobs forever."""
+        while True:
+            item = self.queue.get()
+            job_id, kubernetes_job_id, namespace, index, queued_at, \
+                attempt = item
+            try:
+                finalize_k8s_job(self.job_db, job_id, kubernetes_job_id,
+                                 namespace, index)
+            except Exception as e:
+                logging.error(traceback.format_exc())
+                logging.debug("Unexpected error: {}".format(e))
+                self.retry(item)
+            else:
+                latency = time.time() - queued_at
+                with self.lock:
+                    self.finalized_jobs += 1
+                    self.total_latency += latency
+                    self.max_latency = max(self.max_latency, latency)
+                logging.info('Finalized Kubernetes job {0} in {1:.2f}s, {2} '
+                             'jobs waiting for finalization.'.format(
+                                 kubernetes_job_id, latency,
+                                 self.queue.qsize()))
+            finally:
+                self.queue.task_done()
+
+    def retry(self, item):
+        """Queue again a job whose finalization failed, after a delay.
+
+        :param item: Queued finalization which failed.
+        """
+        job_id, kubernetes_job_id, namespace, index, queued_at, attempt = item
+        if attempt >= config.K8S_FINALIZATION_MAX_ATTEMPTS:
+            logging.error('Giving up the finalization of Kubernetes job {0} '
+                          'after {1} attempts.'.format(kubernetes_job_id,
+                                                       attempt))
+            with self.lock:
+                self.failed_jobs += 1
+            return
+        with self.lock:
+            self.retried_jobs += 1
+        delay = config.K8S_FINALIZATION_RETRY_DELAY * 2 ** (attempt - 1)
+        # The worker does not wait, and does not block on a full queue.
+        timer = threading.Timer(delay, self.queue.put, args=(
+            (job_id, kubernetes_job_id, namespace, index, queued_at,
+             attempt + 1),))
+        timer.daemon = True
+        timer.start()
+
+    def get_stats(self):
+        """Get finalization queue depth and latency statistics.
+
+        :returns: Dictionary with the statistics.
+        """
+        with self.lock:
+            return {
+                'queue_depth': self.queue.qsize(),
+                'finalized_jobs': self.finalized_jobs,
+                'failed_jobs': self.failed_jobs,
+                'retried_jobs': self.retried_jobs,
+                'average_latency': (self.total_latency / self.finalized_jobs
+                                    if self.finalized_jobs else 0.0),
+                'max_latency': self.max_latency,
+            }
+
+
+def get_watch_backoff(failures):
+    """Compute how long to wait before watching again after failures.
+
+    :param failures: Number of failed list or watch requests in a row.
+    :returns: Seconds to wait, with jitter so that controllers restarted
+        together do not reconnect together.
+    """
+    delay = min(config.K8S_WATCH_BACKOFF_MAX,
+                config.K8S_WATCH_BACKOFF_BASE * 2 ** (failures - 1))
+    return delay * random.uniform(0.5, 1)
+
+
+def k8s_watch_jobs(job_db, finalization_pool):
     """Open stream connection to k8s apiserver to watch all jobs status.
 
-    :param job_db: Dictionary which contains all current jobs.
-    :param config: configuration to connect to k8s apiserver.
+    Only the jobs of this controller, in its namespace, are watched. The
+    watch resumes from the last seen ``resourceVersion`` after disconnects
+    and only lists all jobs again when that version is too old. Failed
+    requests are retried with a capped exponential backoff.
+
+    :param job_db: :class:`JobStore` which contains all current jobs.
+    :param finalization_pool: :class:`K8sJobFinalizationPool` finished jobs
+        are handed to.
     """
+    label_selector = '{0}={1}'.format(config.K8S_JOB_CONTROLLER_LABEL,
+                                      config.K8S_JOB_CONTROLLER_NAME)
+    resource_version = None
+    failures = 0
     while True:
-        logging.debug('Starting a new stream request to watch Jobs')
+        failed = False
         try:
+            if resource_version is None:
+                logging.debug('Listing Jobs to start watching them')
+                job_list = current_k8s_batchv1_api_client.list_namespaced_job(
+                    namespace=K8S_DEFAULT_NAMESPACE,
+                    label_selector=label_selector)
+                for job in job_list.items:
+                    process_k8s_job(job_db, job, finalization_pool)
+                resource_version = job_list.metadata.resource_version
+            logging.debug('Starting a new stream request to watch Jobs')
             w = watch.Watch()
             for event in w.stream(
-                    current_k8s_batchv1_api_client.list_job_for_all_namespaces
-            ):
+                    current_k8s_batchv1_api_client.list_namespaced_job,
+                    namespace=K8S_DEFAULT_NAMESPACE,
+                    label_selector=label_selector,
+                    resource_version=resource_version):
+                if event['type'] == 'ERROR':
+                    if event['raw_object'].get('code') == 410:
+                        logging.info('Resource version {0} is too old, Jobs '
+                                     'will be listed again.'.format(
+                                         resource_version))
+                        resource_version = None
+                    else:
+                        logging.debug('Error event received while watching '
+                                      'Jobs: {0}'.format(event['raw_object']))
+                    failed = True
+                    break
                 logging.info(
                     'New Job event received: {0}'.format(event['type']))
+                failures = 0
                 job = event['object']
-
-                # Taking note of the remaining jobs since deletion might not
-                # happen straight away.
-                remaining_jobs = dict()
-                for job_id, job_dict in job_db.items():
-                    if not job_db[job_id]['deleted']:
-                        remaining_jobs[job_dict['backend_job_id']] = job_id
-                if (not job_db.get(remaining_jobs.get(job.metadata.name)) or
-                        job.metadata.name not in remaining_jobs):
-                    # Ignore jobs not created by this specific instance
-                    # or already deleted jobs.
-                    continue
-                job_id = remaining_jobs[job.metadata.name]
-                kubernetes_job_id = job.metadata.name
-                if job.status.succeeded:
-                    logging.info(
-                        'Job job_id: {}, kubernetes_job_id: {}'
-                        ' succeeded.'.format(job_id, kubernetes_job_id)
-                    )
-                    job_db[job_id]['status'] = 'succeeded'
-                elif (job.status.failed and
-                      job.status.failed >= config.MAX_JOB_RESTARTS):
-                    logging.info(
-                        'Job job_id: {}, kubernetes_job_id: {} failed.'.format(
-                            job_id,
-                            kubernetes_job_id)
-                    )
-                    job_db[job_id]['status'] = 'failed'
-                else:
-                    continue
-                # Grab logs when job either succeeds or fails.
-                logging.info('Getting last spawned pod for kubernetes'
-                             ' job {}'.format(kubernetes_job_id))
-                last_spawned_pod = \
-                    current_k8s_corev1_api_client.list_namespaced_pod(
-                        namespace=job.metadata.namespace,
-                        label_selector='job-name={job_name}'.format(
-                            job_name=kubernetes_job_id)).items[-1]
-                logging.info('Grabbing pod {} logs...'.format(
-                    last_spawned_pod.metadata.name))
-                job_db[job_id]['log'] = \
-                    current_k8s_corev1_api_client.read_namespaced_pod_log(
-                        namespace=last_spawned_pod.metadata.namespace,
-                        name=last_spawned_pod.metadata.name)
-                # Store job logs
-                try:
-                    logging.info('Storing job logs: {}'.
-                                 format(job_db[job_id]['log']))
-                    Session.query(Job).filter_by(id_=job_id). \
-                        update(dict(logs=job_db[job_id]['log']))
-                    Session.commit()
-
-                except Exception as e:
-                    logging.debug('Could not retrieve'
-                                  ' logs for object: {}'.
-                                  format(last_spawned_pod))
-                    logging.debug('Exception: {}'.format(str(e)))
-
-                logging.info('Cleaning Kubernetes job {} ...'.format(
-                    kubernetes_job_id))
-                KubernetesJobManager.stop(kubernetes_job_id)
-                job_db[job_id]['deleted'] = True
+                resource_version = job.metadata.resource_version
+                process_k8s_job(job_db, job, finalization_pool)
         except client.rest.ApiException as e:
+            if e.status == 410:
+                resource_version = None
             logging.debug(
                 "Error while connecting to Kubernetes API: {}".format(e))
+            failed = True
         except Exception as e:
             logging.error(traceback.format_exc())
             logging.debug("Unexpected error: {}".format(e))
+            failed = True
+        if failed:
+            failures += 1
+            time.sleep(get_watch_backoff(failures))
+        else:
+            failures = 0
+
+
+K8S_FINALIZATION_POOL = None
+"""Finalization pool of the Kubernetes watcher, once it is started."""
 
 
 def start_watch_jobs_thread(JOB_DB):
     """Watch changes on job objects on kubernetes."""
+    global K8S_FINALIZATION_POOL
+    K8S_FINALIZATION_POOL = K8sJobFinalizationPool(JOB_DB)
+    K8S_FINALIZATION_POOL.start()
     job_event_reader_thread = threading.Thread(target=k8s_watch_jobs,
-                                               args=(JOB_DB,))
+                                               args=(JOB_DB,
+                                                     K8S_FINALIZATION_POOL))
     job_event_reader_thread.daemon = True
     job_event_reader_thread.start()
@@ -10,16 +10,25 @@
 
 import ast
 import logging
+import shlex
 import traceback
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 
 from kubernetes.client.models.v1_delete_options import V1DeleteOptions
 from kubernetes.client.rest import ApiException
 from reana_commons.config import CVMFS_REPOSITORIES, K8S_DEFAULT_NAMESPACE
-from reana_commons.k8s.api_client import current_k8s_batchv1_api_client
+from reana_commons.k8s.api_client import (current_k8s_batchv1_api_client,
+                                          current_k8s_corev1_api_client)
 from reana_commons.k8s.volumes import get_k8s_cvmfs_volume, get_shared_volume
 
-from reana_job_controller.config import (MAX_JOB_RESTARTS,
+from reana_job_controller.config import (BATCH_SUBMISSION_WORKERS,
+                                         K8S_JOB_ARRAY_ITEMS_PATH,
+                                         K8S_JOB_ARRAY_MAX_PARALLELISM,
+                                         K8S_JOB_ARRAY_TTL,
+                                         K8S_JOB_CONTROLLER_LABEL,
+                                         K8S_JOB_CONTROLLER_NAME,
+                                         MAX_JOB_RESTARTS,
                                          SHARED_VOLUME_PATH_ROOT)
 from reana_job_controller.errors import ComputingBackendSubmissionError
 from reana_job_controller.job_manager import JobManager
@@ -63,12 +72,168 @@ class KubernetesJobManager(JobManager):
     def execute(self):
         """Execute a job in Kubernetes."""
         backend_job_id = str(uuid.uuid4())
+        job = self.build_job_spec(backend_job_id)
+
+        # add better handling
+        try:
+            api_response = \
+                current_k8s_batchv1_api_client.create_namespaced_job(
+                    namespace=K8S_DEFAULT_NAMESPACE, body=job)
+            return backend_job_id
+        except ApiException as e:
+            logging.debug("Error while connecting to Kubernetes"
+                          " API: {}".format(e))
+        except Exception as e:
+            logging.error(traceback.format_exc())
+            logging.debug("Unexpected error: {}".format(e))
+
+    @classmethod
+    @JobManager.batch_execution_hook
+    def execute_batch(cls, job_managers):
+        """Execute several jobs in Kubernetes concurrently.
+
+        :param job_managers: List of Kubernetes job managers to submit.
+        :returns: List with, for each job manager, its Kubernetes job ID or
+            the exception which prevented its creation.
+        """
+        def create_job(job_manager):
+            backend_job_id = str(uuid.uuid4())
+            try:
+                current_k8s_batchv1_api_client.create_namespaced_job(
+                    namespace=K8S_DEFAULT_NAMESPACE,
+                    body=job_manager.build_job_spec(backend_job_id))
+                return backend_job_id
+            except ApiException as e:
+                logging.debug("Error while connecting to Kubernetes"
+                              " API: {}".format(e))
+                return ComputingBackendSubmissionError(e.reason)
+            except Exception as e:
+                logging.error(traceback.format_exc())
+                logging.debug("Unexpected error: {}".format(e))
+                return ComputingBackendSubmissionError(str(e))
+
+        with ThreadPoolExecutor(max_workers=BATCH_SUBMISSION_WORKERS) \
+                as executor:
+            return list(executor.map(create_job, job_managers))
+
+    @JobManager.array_execution_hook
+    def execute_array(self, item_managers):
+        """Execute a job array in Kubernetes as a single Indexed Job.
+
+        The scripts of the items are mounted from a ConfigMap owned by the
+        job, each pod runs the one of its completion index.
+
+        :param item_managers: List of job managers of the items, built with
+            :meth:`build_array_item`.
+        :returns: List with the backend job ID of each item,
+            ``job_name.index``.
+        """
+        backend_job_id = str(uuid.uuid4())
+        job = self.build_job_spec(backend_job_id)
+        job['spec'].update({
+            'completionMode': 'Indexed',
+            'completions': len(item_managers),
+            'parallelism': min(len(item_managers),
+                               K8S_JOB_ARRAY_MAX_PARALLELISM),
+            # The items are followed one by one, the job itself only needs
+            # to be cleaned up.
+            'ttlSecondsAfterFinished': K8S_JOB_ARRAY_TTL,
+        })
+        pod_spec = job['spec']['template']['spec']
+        pod_spec['containers'][0]['command'] = [
+            '/bin/sh', '-c',
+            'exec /bin/sh "{0}/$JOB_COMPLETION_INDEX"'.format(
+                K8S_JOB_ARRAY_ITEMS_PATH)]
+        pod_spec['containers'][0]['volumeMounts'].append(
+            {'name': 'reana-job-array-items',
+             'mountPath': K8S_JOB_ARRAY_ITEMS_PATH,
+             'readOnly': True})
+        pod_spec['volumes'].append(
+            {'name': 'reana-job-array-items',
+             'configMap': {'name': backend_job_id}})
+        try:
+            created_job = \
+                current_k8s_batchv1_api_client.create_namespaced_job(
+                    namespace=K8S_DEFAULT_NAMESPACE, body=job)
+        except ApiException as e:
+            logging.debug("Error while connecting to Kubernetes"
+                          " API: {}".format(e))
+            raise ComputingBackendSubmissionError(e.reason)
+        try:
+            # The pods wait for the ConfigMap, which is deleted with the
+            # job.
+            current_k8s_corev1_api_client.create_namespaced_config_map(
+                namespace=K8S_DEFAULT_NAMESPACE,
+                body=self.build_array_config_map(
+                    backend_job_id, created_job.metadata.uid,
+                    item_managers))
+        except ApiException as e:
+            logging.debug("Error while connecting to Kubernetes"
+                          " API: {}".format(e))
+            self.stop(backend_job_id)
+            raise ComputingBackendSubmissionError(e.reason)
+        return ['{0}.{1}'.format(backend_job_id, index)
+                for index in range(len(item_managers))]
+
+    @staticmethod
+    def build_array_item_script(item_manager):
+        """Build the shell script running an item of a job array.
+
+        :param item_manager: Job manager of the item.
+        :returns: Script exporting the environment of the item and running
+            its command.
+        """
+        exports = ''.join(
+            'export {0}={1}\n'.format(name, shlex.quote(str(value)))
+            for name, value in sorted(item_manager.env_vars.items()))
+        return '{0}exec {1}\n'.format(
+            exports, ' '.join(shlex.quote(arg) for arg in item_manager.cmd))
+
+    @classmethod
+    def build_array_config_map(cls, backend_job_id, job_uid, item_managers):
+        """Build the ConfigMap with the scripts of the items of a job array.
+
+        :param backend_job_id: Name of the Kubernetes job of the array.
+        :param job_uid: UID of the Kubernetes job, which owns the ConfigMap.
+        :param item_managers: List of job managers of the items.
+        :returns: Kubernetes ConfigMap as a dictionary, with one script per
+            completion index.
+        """
+        return {
+            'kind': 'ConfigMap',
+            'apiVersion': 'v1',
+            'metadata': {
+                'name': backend_job_id,
+                'namespace': K8S_DEFAULT_NAMESPACE,
+                'labels': {
+                    K8S_JOB_CONTROLLER_LABEL: K8S_JOB_CONTROLLER_NAME
+                },
+                'ownerReferences': [{
+                    'apiVersion': 'batch/v1',
+                    'kind': 'Job',
+                    'name': backend_job_id,
+                    'uid': job_uid,
+                }],
+            },
+            'data': {str(index): cls.build_array_item_script(item_manager)
+                     for index, item_manager in enumerate(item_managers)},
+        }
+
+    def build_job_spec(self, backend_job_id):
+        """Build the Kubernetes job specification.
+
+        :param backend_job_id: Name of the Kubernetes job.
+        :returns: Kubernetes job spec as a dictionary.
+        """
         job = {
             'kind': 'Job',
             'apiVersion': 'batch/v1',
             'metadata': {
                 'name': backend_job_id,
-                'namespace': K8S_DEFAULT_NAMESPACE
+                'namespace': K8S_DEFAULT_NAMESPACE,
+                'labels': {
+                    K8S_JOB_CONTROLLER_LABEL: K8S_JOB_CONTROLLER_NAME
+                }
             },
             'spec': {
                 'backoffLimit': MAX_JOB_RESTARTS,
@@ -121,19 +286,9 @@ class KubernetesJobManager(JobManager):
                 ))
                 job['spec']['template']['spec']['volumes'].append(volume)
 
-        # add better handling
-        try:
-            api_response = \
-                current_k8s_batchv1_api_client.create_namespaced_job(
-                    namespace=K8S_DEFAULT_NAMESPACE, body=job)
-            return backend_job_id
-        except ApiException as e:
-            logging.debug("Error while connecting to Kubernetes"
-                          " API: {}".format(e))
-        except Exception as e:
-            logging.error(traceback.format_exc())
-            logging.debug("Unexpected error: {}".format(e))
+        return job
 
+    @staticmethod
     def stop(backend_job_id, asynchronous=True):
         """Stop Kubernetes job execution.
 
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of REANA.
+# Copyright (C) 2019 CERN.
+#
+# REANA is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""REANA-Job-Controller job logs storage.
+
+Full logs of finished jobs are written compressed to the shared volume,
+only a bounded excerpt of them is kept in memory and in the DB.
+"""
+
+import gzip
+import logging
+import os
+
+from reana_db.database import Session
+from reana_db.models import Job
+
+from reana_job_controller import config
+
+
+class LogExcerpt(object):
+    """Bounded head and tail of a log written chunk by chunk."""
+
+    def __init__(self, head_size=None, tail_size=None):
+        """Instantiate empty excerpt.
+
+        :param head_size: Number of bytes kept from the start of the log.
+        :param tail_size: Number of bytes kept from the end of the log.
+        """
+        self.head_size = head_size or config.JOB_LOGS_EXCERPT_HEAD_SIZE
+        self.tail_size = tail_size or config.JOB_LOGS_EXCERPT_TAIL_SIZE
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.size = 0
+
+    def write(self, chunk):
+        """Add a chunk of the log.
+
+        :param chunk: Byte string.
+        """
+        self.size += len(chunk)
+        missing_head = self.head_size - len(self.head)
+        if missing_head > 0:
+            self.head += chunk[:missing_head]
+            chunk = chunk[missing_head:]
+        self.tail += chunk
+        if len(self.tail) > self.tail_size:
+            del self.tail[:len(self.tail) - self.tail_size]
+
+    @property
+    def omitted_size(self):
+        """Number of bytes of the log not kept in the excerpt."""
+        return self.size - len(self.head) - len(self.tail)
+
+    def getvalue(self):
+        """Get the excerpt as text.
+
+        :returns: Head and tail of the log, with a marker in between if part
+            of the log was omitted.
+        """
+        excerpt = bytes(self.head)
+        if self.omitted_size:
+            excerpt += '\n[... {0} bytes omitted ...]\n'.format(
+                self.omitted_size).encode()
+        excerpt += bytes(self.tail)
+        return excerpt.decode('utf-8', 'replace')
+
+
+def get_job_log_path(job_id):
+    """Get the path where the full log of a job is stored.
+
+    :param job_id: UUID which identifies the job.
+    """
+    return os.path.join(config.JOB_LOGS_STORAGE_PATH, str(job_id)[:2],
+                        '{0}.log.gz'.format(job_id))
+
+
+def store_job_log(job_id, chunks):
+    """Store the full log of a job compressed, chunk by chunk.
+
+    :param job_id: UUID which identifies the job.
+    :param chunks: Iterable of byte (or text) strings with the log.
+    :returns: Tuple with the :class:`LogExcerpt` of the log and the path
+        where it was stored.
+    """
+    log_path = get_job_log_path(job_id)
+    if not os.path.isdir(os.path.dirname(log_path)):
+        os.makedirs(os.path.dirname(log_path), exist_ok=True)
+    excerpt = LogExcerpt()
+    tmp_log_path = '{0}.tmp'.format(log_path)
+    with gzip.open(tmp_log_path, 'wb') as log_file:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            log_file.write(chunk)
+            excerpt.write(chunk)
+    os.rename(tmp_log_path, log_path)
+    return excerpt, log_path
+
+
+def open_job_log(log_path):
+    """Open a stored job log for reading.
+
+    :param log_path: Path returned by :func:`store_job_log`.
+    :returns: Binary file object with the uncompressed log.
+    """
+    return gzip.open(log_path, 'rb')
+
+
+def build_db_log(excerpt, log_path):
+    """Build the value stored in the ``logs`` column of a job.
+
+    :param excerpt: :class:`LogExcerpt` of the log.
+    :param log_path: Path where the full log is stored.
+    :returns: Log excerpt followed by a pointer to the full log.
+    """
+    return '{0}\n[Full log ({1} bytes): {2}]\n'.format(
+        excerpt.getvalue(), excerpt.size, log_path)
+
+
+def save_job_logs(job_db, job_id, chunks):
+    """Store the logs of a finished job and reference them from its entries.
+
+    :param job_db: :class:`JobStore` which contains all current jobs.
+    :param job_id: UUID which identifies the job.
+    :param chunks: Iterable of byte (or text) strings with the log.
+    :returns: :class:`LogExcerpt` of the log.
+    """
+    excerpt, log_path = store_job_log(job_id, chunks)
+    job_db.update(job_id, log=excerpt.getvalue(), log_path=log_path)
+    logging.info('Stored {0} bytes of logs of job {1} in {2}'.format(
+        excerpt.size, job_id, log_path))
+    try:
+        Session.query(Job).filter_by(id_=job_id). \
+            update(dict(logs=build_db_log(excerpt, log_path)))
+        Session.commit()
+    except Exception as e:
+        Session.rollback()
+        logging.debug('Could not store logs of job {0} in DB.'.format(
+            job_id))
+        logging.debug('Exception: {}'.format(str(e)))
+    return excerpt
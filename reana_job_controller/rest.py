@@ -8,25 +8,95 @@
 
 """Rest API endpoint for job management."""
 
-import copy
+import hashlib
 import json
+from collections import OrderedDict
 
-from flask import Blueprint, current_app, jsonify, request
+from flask import (Blueprint, Response, current_app, jsonify, request,
+                   stream_with_context)
 
-from reana_job_controller.errors import ComputingBackendSubmissionError
-from reana_job_controller.job_db import (JOB_DB, job_exists, job_is_cached,
+from reana_job_controller import config, k8s
+from reana_job_controller.errors import (ComputingBackendSubmissionError,
+                                         JobDBCreationError)
+from reana_job_controller.job_db import (JOB_DB, JOB_FIELDS, job_exists,
+                                         job_is_cached, jobs_are_cached,
                                          retrieve_all_jobs,
                                          retrieve_backend_job_id, retrieve_job,
-                                         retrieve_job_logs)
+                                         retrieve_job_logs,
+                                         retrieve_jobs_summary)
+from reana_job_controller.job_events import stream_job_events
+from reana_job_controller.job_logs import stream_job_logs
 from reana_job_controller.kubernetes_job_manager import KubernetesJobManager
 from reana_job_controller.htcondor_job_manager import HTCondorJobManager
-from reana_job_controller.schemas import Job, JobRequest
+from reana_job_controller.schemas import (Job, JobArrayRequest,
+                                          JobCacheBatchRequest, JobRequest)
 
 blueprint = Blueprint('jobs', __name__)
 
 job_request_schema = JobRequest()
+job_array_request_schema = JobArrayRequest()
+job_cache_batch_request_schema = JobCacheBatchRequest()
 job_schema = Job()
 
+JOB_MANAGERS = {
+    'Kubernetes': KubernetesJobManager,
+    'HTCondor': HTCondorJobManager,
+}
+"""Job manager class of each supported computing backend."""
+
+
+def build_job_manager(job_request):
+    """Instantiate the job manager corresponding to a job request.
+
+    :param job_request: Deserialized :class:`JobRequest`.
+    :returns: Job manager of the requested backend.
+    """
+    job_manager_cls = JOB_MANAGERS[job_request.get('backend', 'HTCondor')]
+    return job_manager_cls(
+        docker_img=job_request['docker_img'],
+        cmd=job_request['cmd'],
+        env_vars=job_request['env_vars'],
+        workflow_uuid=job_request['workflow_uuid'],
+        workflow_workspace=str(job_request['workflow_workspace']),
+        cvmfs_mounts=job_request['cvmfs_mounts'],
+        shared_file_system=job_request['shared_file_system']
+    )
+
+
+def register_job(job_request, job_obj, backend_job_id):
+    """Add a submitted job to the job DB.
+
+    :param job_request: Deserialized :class:`JobRequest`.
+    :param job_obj: Job manager which submitted the job.
+    :param backend_job_id: Job ID in the computing backend.
+    :returns: ID of the registered job.
+    """
+    job_id = str(job_obj.job_id)
+    JOB_DB.add(job_id,
+               job_name=job_request['job_name'],
+               workflow_uuid=job_request['workflow_uuid'],
+               backend=job_request.get('backend', 'HTCondor'),
+               backend_job_id=backend_job_id,
+               docker_img=job_request['docker_img'],
+               cmd=job_request['cmd'],
+               cvmfs_mounts=job_request['cvmfs_mounts'],
+               experiment=job_request['experiment'],
+               status='started',
+               restart_count=0,
+               max_restart_count=3,
+               deleted=False)
+    return job_obj.job_id
+
+
+def build_job_etag(jobdict):
+    """Build the ETag of the details of a job.
+
+    :param jobdict: Job details as returned by :func:`retrieve_job`.
+    :returns: String which changes whenever the job details change.
+    """
+    return hashlib.md5(json.dumps(
+        jobdict, sort_keys=True, default=str).encode()).hexdigest()
+
 
 @blueprint.route('/job_cache', methods=['GET'])
 def check_if_cached():
@@ -90,6 +160,93 @@ def check_if_cached():
                         "result_path": None}), 200
 
 
+@blueprint.route('/job_cache/batch', methods=['POST'])
+def check_if_cached_batch():  # noqa
+    r"""Check if several jobs of a workflow are cached.
+
+    ---
+    post:
+      summary: Returns, for each job, whether it is in cache.
+      description: >-
+        This resource takes the specifications of several jobs of the same
+        workflow, the workflow json and the workflow workspace, and checks
+        for each job if it already exists in the cache. The workspace is
+        hashed only once.
+      operationId: check_if_cached_batch
+      consumes:
+       - application/json
+      produces:
+       - application/json
+      parameters:
+       - name: lookup
+         in: body
+         description: Required. Jobs to look up in the cache.
+         required: true
+         schema:
+           type: object
+           properties:
+             job_specs:
+               type: array
+               items:
+                 type: object
+             workflow_json:
+               type: object
+             workflow_workspace:
+               type: string
+      responses:
+        200:
+          description: >-
+            Request succeeded. Returns, in the same order as the job
+            specifications, whether each job is in cache.
+          schema:
+            type: object
+            properties:
+              jobs:
+                type: array
+                items:
+                  type: object
+                  properties:
+                    cached:
+                      type: boolean
+                    result_path:
+                      type: string
+                    job_id:
+                      type: string
+          examples:
+            application/json:
+              {
+                "jobs": [
+                  {"cached": true,
+                   "result_path": "/reana/default/0000/1111/archive/2222",
+                   "job_id": "cdcf48b1-c2f3-4693-8230-b066e088c6ac"},
+                  {"cached": false,
+                   "result_path": null}
+                ]
+              }
+        400:
+          description: >-
+            Request failed. The incoming data specification seems malformed.
+    """
+    json_data = request.get_json()
+    if not json_data:
+        return jsonify({'message': 'Empty request'}), 400
+    lookup, errors = job_cache_batch_request_schema.load(json_data)
+    if errors:
+        return jsonify(errors), 400
+    results = []
+    for result in jobs_are_cached(lookup['job_specs'],
+                                  lookup['workflow_json'],
+                                  lookup['workflow_workspace']):
+        if result:
+            results.append({"cached": True,
+                            "result_path": result['result_path'],
+                            "job_id": result['job_id']})
+        else:
+            results.append({"cached": False,
+                            "result_path": None})
+    return jsonify({"jobs": results}), 200
+
+
 @blueprint.route('/jobs', methods=['GET'])
 def get_jobs():  # noqa
     r"""Get all active jobs.
@@ -98,11 +255,42 @@ def get_jobs():  # noqa
     get:
       summary: Returns list of all active jobs.
       description: >-
-        This resource is not expecting parameters and it will return a list
-        representing all active jobs in JSON format.
+        This resource will return a list representing all active jobs in
+        JSON format, optionally filtered and paginated.
       operationId: get_jobs
       produces:
        - application/json
+      parameters:
+       - name: status
+         in: query
+         description: Optional. Only return the jobs with this status.
+         required: false
+         type: string
+       - name: workflow_uuid
+         in: query
+         description: Optional. Only return the jobs of this workflow.
+         required: false
+         type: string
+       - name: limit
+         in: query
+         description: >-
+           Optional. Maximum number of jobs to return. The response then
+           contains the `next_after` cursor of the next page.
+         required: false
+         type: integer
+       - name: after
+         in: query
+         description: >-
+           Optional. Cursor of the page to return, as returned in
+           `next_after`.
+         required: false
+         type: integer
+       - name: fields
+         in: query
+         description: >-
+           Optional. Comma separated list of the job fields to return.
+         required: false
+         type: string
       responses:
         200:
           description: >-
@@ -138,8 +326,142 @@ def get_jobs():  # noqa
                   }
                 }
               }
+        400:
+          description: >-
+            Request failed. The pagination or projection parameters are
+            malformed.
     """
-    return jsonify({"jobs": retrieve_all_jobs()}), 200
+    page_args = {}
+    for arg, minimum in (('limit', 1), ('after', 0)):
+        if arg in request.args:
+            value = request.args.get(arg, type=int)
+            if value is None or value < minimum:
+                return jsonify({'message': '{} must be an integer greater '
+                                           'than or equal to {}.'.format(
+                                               arg, minimum)}), 400
+            page_args[arg] = value
+    fields = None
+    if request.args.get('fields'):
+        fields = request.args['fields'].split(',')
+        unknown_fields = set(fields) - set(JOB_FIELDS)
+        if unknown_fields:
+            return jsonify({'message': 'Unknown job fields: {}.'.format(
+                ', '.join(sorted(unknown_fields)))}), 400
+    jobs, next_after = retrieve_all_jobs(
+        status=request.args.get('status'),
+        workflow_uuid=request.args.get('workflow_uuid'),
+        fields=fields, **page_args)
+    response = {"jobs": jobs}
+    if 'limit' in page_args:
+        response['next_after'] = next_after
+    return jsonify(response), 200
+
+
+@blueprint.route('/jobs/summary', methods=['GET'])
+def get_jobs_summary():  # noqa
+    r"""Get the number of active jobs per status.
+
+    ---
+    get:
+      summary: Returns the number of active jobs per status.
+      description: >-
+        This resource is not expecting parameters and it will return the
+        number of active jobs of each status in JSON format. While the
+        Kubernetes watcher runs, the state of the finalization of the
+        finished Kubernetes jobs is returned as well.
+      operationId: get_jobs_summary
+      produces:
+       - application/json
+      responses:
+        200:
+          description: >-
+            Request succeeded. The response contains the number of active
+            jobs per status.
+          examples:
+            application/json:
+              {
+                "jobs": {
+                  "started": 12,
+                  "succeeded": 30,
+                  "failed": 1
+                },
+                "total": 43,
+                "finalization": {
+                  "queue_depth": 2,
+                  "finalized_jobs": 28,
+                  "failed_jobs": 0,
+                  "retried_jobs": 1,
+                  "average_latency": 1.5,
+                  "max_latency": 4.2
+                }
+              }
+    """
+    summary = retrieve_jobs_summary()
+    response = {"jobs": summary, "total": sum(summary.values())}
+    if k8s.K8S_FINALIZATION_POOL:
+        response["finalization"] = k8s.K8S_FINALIZATION_POOL.get_stats()
+    return jsonify(response), 200
+
+
+@blueprint.route('/jobs/events', methods=['GET'])
+def get_jobs_events():  # noqa
+    r"""Stream the status transitions of the jobs.
+
+    ---
+    get:
+      summary: Streams the status transitions of the jobs.
+      description: >-
+        This resource streams an event, in the Server-Sent Events format,
+        each time the status of a job changes. Clients resuming a stream
+        receive the events they missed as long as they are still buffered.
+      operationId: get_jobs_events
+      produces:
+       - text/event-stream
+      parameters:
+       - name: workflow_uuid
+         in: query
+         description: Optional. Only stream the events of this workflow.
+         required: false
+         type: string
+       - name: Last-Event-ID
+         in: header
+         description: >-
+           Optional. ID of the last event received, the stream starts after
+           it. If it was received before the controller restarted, all the
+           buffered events are streamed.
+         required: false
+         type: string
+      responses:
+        200:
+          description: >-
+            Request succeeded. The response is a stream of job status
+            events.
+          examples:
+            text/event-stream: >-
+              id: 3f2c9a1b7e4d-42
+
+              event: status
+
+              data: {"id": 42,
+                     "job_id": "cdcf48b1-c2f3-4693-8230-b066e088c6ac",
+                     "workflow_uuid": "5b9b6d7f-5c4b-4c4b-8b2a-5a3b6f0c1a2d",
+                     "status": "succeeded"}
+        400:
+          description: Request failed. The Last-Event-ID header is malformed.
+    """
+    last_event_id = request.headers.get('Last-Event-ID')
+    if last_event_id is not None:
+        try:
+            last_event_id = JOB_DB.events.parse_event_id(last_event_id)
+        except ValueError:
+            return jsonify({'message': 'Last-Event-ID must be an event '
+                                       'ID.'}), 400
+    return Response(
+        stream_job_events(JOB_DB.events,
+                          workflow_uuid=request.args.get('workflow_uuid'),
+                          last_event_id=last_event_id),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 @blueprint.route('/jobs', methods=['POST'])
@@ -193,45 +515,230 @@ def create_job():  # noqa
     job_request, errors = job_request_schema.load(json_data)
     if errors:
         return jsonify(errors), 400
-    backend = job_request.get('backend', 'HTCondor')
-    if backend == 'Kubernetes':
-        job_obj = KubernetesJobManager(
-            docker_img=job_request['docker_img'],
-            cmd=job_request['cmd'],
-            env_vars=job_request['env_vars'],
-            workflow_uuid=job_request['workflow_uuid'],
-            workflow_workspace=str(job_request['workflow_workspace']),
-            cvmfs_mounts=job_request['cvmfs_mounts'],
-            shared_file_system=job_request['shared_file_system']
-        )
-    elif backend =='HTCondor':
-        job_obj = HTCondorJobManager(
-            docker_img=job_request['docker_img'],
-            cmd=job_request['cmd'],
-            env_vars=job_request['env_vars'],
-            workflow_uuid=job_request['workflow_uuid'],
-            workflow_workspace=str(job_request['workflow_workspace']),
-            cvmfs_mounts=job_request['cvmfs_mounts'],
-            shared_file_system=job_request['shared_file_system']
-        )
-
-    backend_jod_id = job_obj.execute()
+    if job_request.get('backend', 'HTCondor') not in JOB_MANAGERS:
+        return jsonify({'message': 'Unknown backend {}'
+                        .format(job_request['backend'])}), 400
+    job_obj = build_job_manager(job_request)
+    try:
+        backend_jod_id = job_obj.execute()
+    except JobDBCreationError as e:
+        return jsonify({'message': str(e)}), 500
     if job_obj:
-        job = copy.deepcopy(job_request)
-        job['status'] = 'started'
-        job['restart_count'] = 0
-        job['max_restart_count'] = 3
-        job['deleted'] = False
-        job['obj'] = job_obj
-        job['job_id'] = job_obj.job_id
-        job['backend_job_id'] = backend_jod_id
-        JOB_DB[str(job['job_id'])] = job
-
-        return jsonify({'job_id': job['job_id']}), 201
+        job_id = register_job(job_request, job_obj, backend_jod_id)
+        return jsonify({'job_id': job_id}), 201
     else:
         return jsonify({'job': 'Could not be allocated'}), 500
 
 
+@blueprint.route('/jobs/batch', methods=['POST'])
+def create_jobs_batch():  # noqa
+    r"""Create several jobs at once.
+
+    ---
+    post:
+      summary: Creates several jobs at once.
+      description: >-
+        This resource is expecting JSON data with a list of job requests. The
+        jobs are validated together and submitted grouped by computing
+        backend, the result of each one is reported in the same order as in
+        the request.
+      operationId: create_jobs_batch
+      consumes:
+       - application/json
+      produces:
+       - application/json
+      parameters:
+       - name: jobs
+         in: body
+         description: Information needed to instantiate each of the jobs.
+         required: true
+         schema:
+           type: object
+           properties:
+             jobs:
+               type: array
+               items:
+                 $ref: '#/definitions/JobRequest'
+      responses:
+        201:
+          description: >-
+            Request succeeded. The response contains, for each requested job,
+            either its job ID or the reason why it could not be created.
+          schema:
+            type: object
+            properties:
+              jobs:
+                type: array
+                items:
+                  type: object
+                  properties:
+                    job_id:
+                      type: string
+                    error:
+                      type: object
+          examples:
+            application/json:
+              {
+                "jobs": [
+                  {"job_id": "cdcf48b1-c2f3-4693-8230-b066e088c6ac"},
+                  {"error": {"docker_img": ["Missing data."]}}
+                ]
+              }
+        400:
+          description: >-
+            Request failed. The incoming data specification seems malformed,
+            or none of the jobs could be created, in which case the response
+            contains the reason for each of them.
+    """
+    json_data = request.get_json()
+    if not json_data or not isinstance(json_data.get('jobs'), list) or \
+            not json_data['jobs']:
+        return jsonify({'message': 'Empty request'}), 400
+
+    # Validate and deserialize all inputs together
+    job_requests, errors = job_request_schema.load(json_data['jobs'],
+                                                   many=True)
+    results = [None] * len(job_requests)
+    jobs_by_backend = OrderedDict()
+    for index, job_request in enumerate(job_requests):
+        if index in errors:
+            results[index] = {'error': errors[index]}
+            continue
+        backend = job_request.get('backend', 'HTCondor')
+        if backend not in JOB_MANAGERS:
+            results[index] = {'error': {'backend': [
+                'Unknown backend {}.'.format(backend)]}}
+            continue
+        try:
+            job_obj = build_job_manager(job_request)
+        except Exception as e:
+            results[index] = {'error': {'backend': [str(e)]}}
+            continue
+        jobs_by_backend.setdefault(backend, []).append(
+            (index, job_request, job_obj))
+
+    for backend, jobs in jobs_by_backend.items():
+        job_objs = [job_obj for _, _, job_obj in jobs]
+        try:
+            backend_job_ids = JOB_MANAGERS[backend].execute_batch(job_objs)
+        except Exception as e:
+            backend_job_ids = [e] * len(jobs)
+        for (index, job_request, job_obj), backend_job_id in \
+                zip(jobs, backend_job_ids):
+            if isinstance(backend_job_id, JobDBCreationError):
+                results[index] = {'error': {'job_db': [str(backend_job_id)]}}
+            elif isinstance(backend_job_id, Exception):
+                results[index] = {'error': {'backend': [str(backend_job_id)]}}
+            else:
+                results[index] = {'job_id': register_job(
+                    job_request, job_obj, backend_job_id)}
+
+    if not any('job_id' in result for result in results):
+        return jsonify({'jobs': results}), 400
+    return jsonify({'jobs': results}), 201
+
+
+@blueprint.route('/jobs/array', methods=['POST'])
+def create_job_array():  # noqa
+    r"""Create a job array.
+
+    ---
+    post:
+      summary: Creates a job array.
+      description: >-
+        This resource is expecting JSON data with a job request used as
+        template and a list of items, each one with the environment variables
+        and the command arguments it adds to the template. The array is
+        submitted as a single backend job, one HTCondor cluster or one
+        Kubernetes Indexed Job, and each item gets its own job ID.
+      operationId: create_job_array
+      consumes:
+       - application/json
+      produces:
+       - application/json
+      parameters:
+       - name: job_array
+         in: body
+         description: Information needed to instantiate the job array.
+         required: true
+         schema:
+           type: object
+           properties:
+             job:
+               $ref: '#/definitions/JobRequest'
+             items:
+               type: array
+               items:
+                 type: object
+                 properties:
+                   env_vars:
+                     type: object
+                   args:
+                     type: string
+      responses:
+        201:
+          description: >-
+            Request succeeded. The job array has been launched, the job IDs
+            of the items are in the same order as in the request.
+          schema:
+            type: object
+            properties:
+              job_ids:
+                type: array
+                items:
+                  type: string
+          examples:
+            application/json:
+              {
+                "job_ids": ["cdcf48b1-c2f3-4693-8230-b066e088c6ac",
+                            "a8a6e4c5-6fbc-4f8a-90b3-b2c9d4e5f6a7"]
+              }
+        400:
+          description: >-
+            Request failed. The incoming data specification seems malformed.
+        502:
+          description: >-
+            Request failed. Something went wrong while calling the computing
+            backend.
+          examples:
+            application/json:
+              "message": >-
+                Connection to computing backend failed:
+                [reason]
+    """
+    json_data = request.get_json()
+    if not json_data:
+        return jsonify({'message': 'Empty request'}), 400
+
+    # Validate and deserialize input
+    job_array_request, errors = job_array_request_schema.load(json_data)
+    if errors:
+        return jsonify(errors), 400
+    job_request = job_array_request['job']
+    if job_request.get('backend', 'HTCondor') not in JOB_MANAGERS:
+        return jsonify({'message': 'Unknown backend {}'
+                        .format(job_request['backend'])}), 400
+    job_obj = build_job_manager(job_request)
+    item_managers = [job_obj.build_array_item(item['env_vars'], item['args'])
+                     for item in job_array_request['items']]
+    try:
+        backend_job_ids = job_obj.execute_array(item_managers)
+    except ComputingBackendSubmissionError as e:
+        return jsonify(
+            {'message': 'Connection to computing backend failed:\n{}'
+                .format(e)}), 502
+    job_ids = []
+    for item, item_manager, backend_job_id in zip(
+            job_array_request['items'], item_managers, backend_job_ids):
+        item_request = dict(
+            job_request, env_vars=item_manager.env_vars,
+            cmd=' '.join(arg for arg in (job_request['cmd'], item['args'])
+                         if arg))
+        job_ids.append(register_job(item_request, item_manager,
+                                    backend_job_id))
+    return jsonify({'job_ids': job_ids}), 201
+
+
 @blueprint.route('/jobs/<job_id>', methods=['GET'])
 def get_job(job_id):  # noqa
     r"""Get a job.
@@ -241,7 +748,9 @@ def get_job(job_id):  # noqa
       summary: Returns details about a given job.
       description: >-
         This resource is expecting the job's UUID as a path parameter. Its
-        information will be served in JSON format.
+        information will be served in JSON format. The request can wait for
+        the status of the job to change, and supports conditional requests
+        with the returned ETag.
       operationId: get_job
       produces:
        - application/json
@@ -251,6 +760,24 @@ def get_job(job_id):  # noqa
          description: Required. ID of the job.
          required: true
          type: string
+       - name: wait
+         in: query
+         description: >-
+           Optional. Maximum number of seconds to wait for the status of the
+           job to be different from `since_status`, or from its current
+           status if `If-None-Match` matches the current ETag.
+         required: false
+         type: integer
+       - name: since_status
+         in: query
+         description: Optional. Status the job is expected to leave.
+         required: false
+         type: string
+       - name: If-None-Match
+         in: header
+         description: Optional. ETag of the job details known by the client.
+         required: false
+         type: string
       responses:
         200:
           description: >-
@@ -270,6 +797,12 @@ def get_job(job_id):  # noqa
                 "restart_count": 0,
                 "status": "started"
               }
+        304:
+          description: >-
+            Request succeeded. The job details did not change since the
+            given ETag.
+        400:
+          description: Request failed. The wait parameter is malformed.
         404:
           description: Request failed. The given job ID does not seem to exist.
           examples:
@@ -279,7 +812,26 @@ def get_job(job_id):  # noqa
     """
     if job_exists(job_id):
         jobdict = retrieve_job(job_id)
-        return jsonify(jobdict), 200
+        if 'wait' in request.args:
+            wait = request.args.get('wait', type=int)
+            if wait is None or wait < 0:
+                return jsonify({'message': 'wait must be a non-negative '
+                                           'integer.'}), 400
+            since_status = request.args.get('since_status')
+            if since_status is None and \
+                    request.if_none_match.contains(build_job_etag(jobdict)):
+                since_status = jobdict['status']
+            if since_status is not None:
+                JOB_DB.wait_for_status_change(
+                    job_id, since_status,
+                    min(wait, config.JOB_STATUS_MAX_WAIT))
+                if not job_exists(job_id):
+                    return jsonify({'message': 'The job {} doesn\'t exist'
+                                               .format(job_id)}), 404
+                jobdict = retrieve_job(job_id)
+        response = jsonify(jobdict)
+        response.set_etag(build_job_etag(jobdict))
+        return response.make_conditional(request)
     else:
         return jsonify({'message': 'The job {} doesn\'t exist'
                                    .format(job_id)}), 400
@@ -294,16 +846,43 @@ def get_logs(job_id):  # noqa
       summary: Returns the logs for a given job.
       description: >-
         This resource is expecting the job's UUID as a path parameter. Its
-        information will be served in JSON format.
+        information will be served in JSON format. When any of `follow`,
+        `tail`, `offset` or `limit` is given, while the job is running or
+        once its full log is stored, the logs are instead streamed as plain
+        text, straight from where they are kept. In every case, the logs of
+        HTCondor jobs are their stdout followed by a `[stderr]` line and
+        their stderr.
       operationId: get_logs
       produces:
        - application/json
+       - text/plain
       parameters:
        - name: job_id
          in: path
          description: Required. ID of the job.
          required: true
          type: string
+       - name: follow
+         in: query
+         description: >-
+           Optional. Keep streaming new output until the job finishes.
+         required: false
+         type: boolean
+       - name: tail
+         in: query
+         description: Optional. Only return the last given number of lines.
+         required: false
+         type: integer
+       - name: offset
+         in: query
+         description: Optional. Number of bytes to skip.
+         required: false
+         type: integer
+       - name: limit
+         in: query
+         description: Optional. Maximum number of bytes to return.
+         required: false
+         type: integer
       responses:
         200:
           description: >-
@@ -312,6 +891,9 @@ def get_logs(job_id):  # noqa
           examples:
             application/json:
               "log": "Tue May 16 13:52:00 CEST 2017\n"
+        400:
+          description: >-
+            Request failed. The log range parameters are malformed.
         404:
           description: Request failed. The given job ID does not seem to exist.
           examples:
@@ -319,11 +901,28 @@ def get_logs(job_id):  # noqa
               "message": >-
                 The job cdcf48b1-c2f3-4693-8230-b066e088444c doesn't exist
     """
-    if job_exists(job_id):
-        return retrieve_job_logs(job_id)
-    else:
+    if not job_exists(job_id):
         return jsonify({'message': 'The job {} doesn\'t exist'
                         .format(job_id)}), 404
+    follow = request.args.get('follow', 'false').lower() == 'true'
+    range_args = {}
+    for arg in ('tail', 'offset', 'limit'):
+        if arg in request.args:
+            value = request.args.get(arg, type=int)
+            if value is None or value < 0:
+                return jsonify({'message': '{} must be a non-negative '
+                                           'integer.'.format(arg)}), 400
+            range_args[arg] = value
+    if 'tail' in range_args and 'offset' in range_args:
+        return jsonify({'message': 'tail and offset can not be used '
+                                   'together.'}), 400
+    if not follow and not range_args:
+        logs = retrieve_job_logs(job_id)
+        if logs is not None:
+            return logs
+    return Response(stream_with_context(
+        stream_job_logs(job_id, follow=follow, **range_args)),
+        mimetype='text/plain')
 
 
 @blueprint.route('/jobs/<job_id>/', methods=['DELETE'])
@@ -370,8 +969,8 @@ def delete_job(job_id):  # noqa
     if job_exists(job_id):
         try:
             backend_job_id = retrieve_backend_job_id(job_id)
-            #KubernetesJobManager.stop(backend_job_id)
-            HTCondorJobManager.stop(backend_job_id)
+            backend = JOB_DB[job_id].get('backend') or 'HTCondor'
+            JOB_MANAGERS[backend].stop(backend_job_id)
             return jsonify(), 204
         except ComputingBackendSubmissionError as e:
             return jsonify(
@@ -9,9 +9,11 @@
 
 """REANA Job Controller models."""
 
+import re
 import uuid
 
-from marshmallow import Schema, fields, pre_load
+from marshmallow import (Schema, ValidationError, fields, pre_load, validate,
+                         validates)
 
 
 class Job(Schema):
@@ -27,6 +29,14 @@ class Job(Schema):
     cvmfs_mounts = fields.String(missing='')
 
 
+class JobCacheBatchRequest(Schema):
+    """Job cache batch lookup request model."""
+
+    job_specs = fields.List(fields.Dict(), required=True)
+    workflow_json = fields.Dict(required=True)
+    workflow_workspace = fields.Str(required=True)
+
+
 class JobRequest(Schema):
     """Job request model."""
 
@@ -48,3 +58,26 @@ class JobRequest(Schema):
         """Generate UUID for new Jobs."""
         data['job_id'] = uuid.uuid4()
         return data
+
+
+class JobArrayItem(Schema):
+    """Job array item model."""
+
+    env_vars = fields.Dict(missing={})
+    args = fields.Str(missing='')
+
+    @validates('env_vars')
+    def validate_env_vars(self, env_vars):
+        """Check that environment variables can be set by a shell."""
+        for name in env_vars:
+            if not re.match(r'^[A-Za-z_][A-Za-z0-9_]*$', name):
+                raise ValidationError(
+                    'Invalid environment variable name {0}.'.format(name))
+
+
+class JobArrayRequest(Schema):
+    """Job array request model."""
+
+    job = fields.Nested(JobRequest, required=True)
+    items = fields.Nested(JobArrayItem, many=True, required=True,
+                          validate=validate.Length(min=1))
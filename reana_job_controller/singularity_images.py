@@ -0,0 +1,343 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of REANA.
+# Copyright (C) 2019 CERN.
+#
+# REANA is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""REANA-Job-Controller cache of the Singularity images of the jobs.
+
+Docker images are resolved to the digest of their manifest and converted
+once to a SIF file on the shared volume, ``<directory>/<digest>.sif``. A
+conversion in progress, in this or in another job controller, is marked by
+a ``<digest>.sif.lock`` file, so the image is not converted twice.
+
+Image tags are resolved in background, so the jobs submitted before their
+tag is resolved pull the image themselves. The SIF files are removed once
+unused for ``SINGULARITY_IMAGE_CACHE_MAX_AGE`` seconds, or, least recently
+used first, once they take more than ``SINGULARITY_IMAGE_CACHE_MAX_SIZE``.
+"""
+
+import json
+import logging
+import os
+import re
+import subprocess
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from shutil import which
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+from reana_job_controller import config
+
+DOCKER_HUB_REGISTRY = 'registry-1.docker.io'
+"""Registry of the images which do not name one."""
+
+MANIFEST_MEDIA_TYPES = ', '.join([
+    'application/vnd.docker.distribution.manifest.list.v2+json',
+    'application/vnd.oci.image.index.v1+json',
+    'application/vnd.docker.distribution.manifest.v2+json',
+    'application/vnd.oci.image.manifest.v1+json',
+])
+"""Manifests accepted when resolving the digest of an image."""
+
+
+def parse_image_reference(docker_img):
+    """Split a Docker image reference.
+
+    :param docker_img: Image reference, e.g. ``python:3.7`` or
+        ``gitlab-registry.cern.ch/group/image@sha256:...``.
+    :returns: Tuple with the registry, the repository and the tag or digest.
+    """
+    name, digest = (docker_img.split('@', 1) + [None])[:2]
+    tag = None
+    if ':' in name.rsplit('/', 1)[-1]:
+        name, tag = name.rsplit(':', 1)
+    parts = name.split('/', 1)
+    if len(parts) == 2 and ('.' in parts[0] or ':' in parts[0] or
+                            parts[0] == 'localhost'):
+        registry, repository = parts
+    else:
+        registry, repository = DOCKER_HUB_REGISTRY, name
+    if registry == DOCKER_HUB_REGISTRY and '/' not in repository:
+        repository = 'library/' + repository
+    return registry, repository, digest or tag or 'latest'
+
+
+def pin_image_reference(docker_img, digest):
+    """Replace the tag of an image reference with a digest.
+
+    :param docker_img: Image reference.
+    :param digest: Digest of the image.
+    :returns: Image reference with the digest.
+    """
+    if '@' in docker_img:
+        return docker_img
+    name = docker_img
+    if ':' in name.rsplit('/', 1)[-1]:
+        name = name.rsplit(':', 1)[0]
+    return '{0}@{1}'.format(name, digest)
+
+
+def request_registry(url, timeout):
+    """Send a HEAD request to a registry, authenticating if it is required.
+
+    Only anonymous tokens are requested, so only public images are resolved.
+
+    :param url: URL of the registry resource.
+    :param timeout: Seconds to wait for the registry to answer.
+    :returns: HTTP response.
+    """
+    headers = {'Accept': MANIFEST_MEDIA_TYPES}
+    try:
+        return urlopen(Request(url, headers=headers, method='HEAD'),
+                       timeout=timeout)
+    except HTTPError as e:
+        challenge = e.headers.get('WWW-Authenticate', '')
+        if e.code != 401 or not challenge.lower().startswith('bearer '):
+            raise
+    params = dict(re.findall(r'(\w+)="([^"]*)"', challenge))
+    realm = params.pop('realm')
+    token_response = urlopen('{0}?{1}'.format(realm, urlencode(params)),
+                             timeout=timeout)
+    token_data = json.loads(token_response.read().decode('utf-8'))
+    headers['Authorization'] = 'Bearer {0}'.format(
+        token_data.get('token') or token_data.get('access_token'))
+    return urlopen(Request(url, headers=headers, method='HEAD'),
+                   timeout=timeout)
+
+
+def resolve_image_digest(docker_img, timeout=10):
+    """Resolve a Docker image to the digest of its manifest.
+
+    :param docker_img: Image reference.
+    :param timeout: Seconds to wait for the registry to answer.
+    :returns: Digest of the image, e.g. ``sha256:...``.
+    """
+    registry, repository, reference = parse_image_reference(docker_img)
+    if reference.startswith('sha256:'):
+        return reference
+    response = request_registry('https://{0}/v2/{1}/manifests/{2}'.format(
+        registry, repository, reference), timeout)
+    digest = response.headers.get('Docker-Content-Digest')
+    if not digest:
+        raise ValueError('Registry {0} did not return the digest of '
+                         '{1}.'.format(registry, docker_img))
+    return digest
+
+
+class SingularityImageCache(object):
+    """SIF files of the job images, converted once and shared by the jobs."""
+
+    DIGEST_RETRY_INTERVAL = 60
+    """Seconds to wait before resolving again an image which failed."""
+
+    CLEANUP_INTERVAL = 3600
+    """Seconds between two removals of the unused images."""
+
+    def __init__(self, directory=None, build_command=None, workers=None):
+        """Instantiate cache.
+
+        :param directory: Directory on the shared volume where the images
+            are kept.
+        :param build_command: Singularity executable converting the images.
+        :param workers: Maximum number of images converted at the same time.
+        """
+        self.directory = directory if directory is not None \
+            else config.SINGULARITY_IMAGE_CACHE_PATH
+        self.build_command = build_command or \
+            config.SINGULARITY_BUILD_COMMAND
+        self.lock = threading.Lock()
+        self.digests = {}
+        self.resolving = set()
+        self.converting = set()
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers or config.SINGULARITY_IMAGE_BUILD_WORKERS)
+        self.resolver = ThreadPoolExecutor(
+            max_workers=config.SINGULARITY_IMAGE_RESOLVE_WORKERS)
+        self.last_cleanup = 0
+
+    def is_enabled(self):
+        """Check whether images can be converted by this job controller."""
+        return bool(self.build_command and which(self.build_command))
+
+    def get_digest(self, docker_img):
+        """Get the digest of an image, resolving its tag in background.
+
+        A tag is resolved at most once per TTL and by one thread at a time.
+        The digest it resolved to before is returned meanwhile.
+
+        :param docker_img: Image reference.
+        :returns: Digest of the image, or None until it is resolved.
+        """
+        reference = parse_image_reference(docker_img)[2]
+        if reference.startswith('sha256:'):
+            return reference
+        with self.lock:
+            digest, expiry = self.digests.get(docker_img, (None, 0))
+            if time.time() >= expiry and docker_img not in self.resolving:
+                self.resolving.add(docker_img)
+                self.resolver.submit(self._resolve, docker_img)
+        return digest
+
+    def _resolve(self, docker_img):
+        try:
+            digest = resolve_image_digest(docker_img)
+            ttl = config.SINGULARITY_IMAGE_DIGEST_TTL
+        except Exception as e:
+            logging.warning('Could not resolve the digest of image {0}: '
+                            '{1}'.format(docker_img, e))
+            digest, ttl = None, self.DIGEST_RETRY_INTERVAL
+        with self.lock:
+            digest = digest or self.digests.get(docker_img, (None, 0))[0]
+            self.digests[docker_img] = (digest, time.time() + ttl)
+            self.resolving.discard(docker_img)
+
+    def get_image_path(self, digest):
+        """Get the path of the SIF file of an image.
+
+        :param digest: Digest of the image.
+        """
+        return os.path.join(self.directory,
+                            '{0}.sif'.format(digest.replace(':', '-')))
+
+    def get(self, docker_img):
+        """Get the SIF file of an image, converting it if needed.
+
+        :param docker_img: Image reference.
+        :returns: Tuple with the digest of the image and the path of its SIF
+            file, which is None until the conversion is over. None if the
+            digest could not be resolved or the cache is disabled.
+        """
+        if not self.directory:
+            return None
+        with self.lock:
+            if time.time() - self.last_cleanup > self.CLEANUP_INTERVAL:
+                self.last_cleanup = time.time()
+                self.resolver.submit(self.remove_unused_images)
+        digest = self.get_digest(docker_img)
+        if not digest:
+            return None
+        image_path = self.get_image_path(digest)
+        try:
+            # The last use of an image is kept as the time of its file.
+            os.utime(image_path)
+            return digest, image_path
+        except FileNotFoundError:
+            pass
+        if self.is_enabled():
+            with self.lock:
+                if digest not in self.converting:
+                    self.converting.add(digest)
+                    self.executor.submit(self._convert, docker_img, digest)
+        return digest, None
+
+    def _convert(self, docker_img, digest):
+        image_path = self.get_image_path(digest)
+        lock_path = image_path + '.lock'
+        build_path = '{0}.{1}.tmp'.format(image_path, os.getpid())
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            if not self._acquire(lock_path):
+                return
+            try:
+                if os.path.exists(image_path):
+                    return
+                subprocess.check_call(
+                    [self.build_command, 'build', build_path,
+                     'docker://' + pin_image_reference(docker_img, digest)],
+                    stdout=subprocess.DEVNULL,
+                    timeout=config.SINGULARITY_IMAGE_BUILD_TIMEOUT)
+                os.rename(build_path, image_path)
+                logging.info('Converted image {0} to {1}.'.format(
+                    docker_img, image_path))
+            finally:
+                if os.path.exists(build_path):
+                    os.remove(build_path)
+                os.remove(lock_path)
+        except Exception as e:
+            logging.error(traceback.format_exc())
+            logging.error('Could not convert image {0}: {1}'.format(
+                docker_img, e))
+        finally:
+            with self.lock:
+                self.converting.discard(digest)
+
+    def remove_unused_images(self, max_age=None, max_size=None):
+        """Remove the images no job was submitted with for a while.
+
+        Jobs whose image is removed after their submission pull it
+        themselves.
+
+        :param max_age: Seconds since the last use of the images to remove,
+            ``SINGULARITY_IMAGE_CACHE_MAX_AGE`` by default.
+        :param max_size: Number of bytes of images kept,
+            ``SINGULARITY_IMAGE_CACHE_MAX_SIZE`` by default.
+        """
+        max_age = max_age or config.SINGULARITY_IMAGE_CACHE_MAX_AGE
+        if max_size is None:
+            max_size = config.SINGULARITY_IMAGE_CACHE_MAX_SIZE
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return
+        images = []
+        for entry in entries:
+            try:
+                if entry.name.endswith('.sif'):
+                    stat = entry.stat()
+                    images.append((stat.st_mtime, stat.st_size, entry.path))
+            except FileNotFoundError:
+                # Removed by another job controller.
+                pass
+        images.sort(reverse=True)
+        total_size = 0
+        for mtime, size, path in images:
+            total_size += size
+            if time.time() - mtime < max_age and \
+                    (not max_size or total_size <= max_size):
+                continue
+            try:
+                os.remove(path)
+                logging.info('Removed unused image {0}.'.format(path))
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def _acquire(lock_path):
+        """Mark an image as being converted by this job controller.
+
+        :param lock_path: Path of the lock file of the image.
+        :returns: False if another job controller is converting the image.
+        """
+        try:
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL))
+            return True
+        except FileExistsError:
+            pass
+        # The lock of a conversion which can not be running anymore is taken
+        # over.
+        try:
+            age = time.time() - os.path.getmtime(lock_path)
+        except FileNotFoundError:
+            age = None
+        if age is None or age > config.SINGULARITY_IMAGE_BUILD_TIMEOUT * 2:
+            try:
+                os.remove(lock_path)
+            except FileNotFoundError:
+                pass
+            try:
+                os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL))
+                return True
+            except FileExistsError:
+                pass
+        return False
+
+
+SINGULARITY_IMAGES = SingularityImageCache()
+"""Singularity images of the jobs of this job controller."""
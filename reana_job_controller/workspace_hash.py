@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of REANA.
+# Copyright (C) 2019 CERN.
+#
+# REANA is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""REANA-Job-Controller incremental workspace hashing.
+
+The workspace hash is the one of
+:func:`reana_commons.utils.calculate_hash_of_dir`: the MD5 of the hex MD5
+digests of every 4 KiB chunk of every file, in ``os.walk`` order. The chunk
+digests of every file are kept, keyed by the inode, size and modification
+time of the file, so only the files which changed are read again. The
+SHA-256 of every file is computed in the same read, for the input manifests
+of the HTCondor jobs.
+
+Checking which files changed still stats every file of the workspace. When
+the caller passes a version which changes whenever the workspace may have
+been modified by a job, e.g. the last job event ID, a scan done less than
+``WORKSPACE_HASH_RESCAN_INTERVAL`` seconds ago for the same version is
+reused without scanning the workspace again. The workspace may still have
+changed meanwhile, so the job cache lookups, which must not match stale
+results, do not pass a version.
+"""
+
+import binascii
+import os
+import threading
+import time
+from collections import OrderedDict
+from hashlib import md5, sha256
+
+from reana_job_controller import config
+
+HASH_CHUNK_SIZE = 4096
+"""Size of the file chunks hashed by ``calculate_hash_of_dir``."""
+
+
+def hash_file_chunks(file_path):
+    """Hash a file chunk by chunk.
+
+    :param file_path: Path of the file.
+    :returns: Tuple with the byte string of the concatenated binary MD5
+        digests of the chunks of the file and the SHA-256 of the file.
+    """
+    digests = []
+    file_sha256 = sha256()
+    with open(file_path, 'rb') as file_object:
+        while True:
+            buf = file_object.read(HASH_CHUNK_SIZE)
+            if not buf:
+                break
+            digests.append(md5(buf).digest())
+            file_sha256.update(buf)
+    return b''.join(digests), file_sha256.hexdigest()
+
+
+class WorkspaceHashIndex(object):
+    """Chunk, file and directory tree digests of a workspace."""
+
+    def __init__(self, workspace):
+        """Instantiate empty index.
+
+        :param workspace: Path of the workspace.
+        """
+        self.workspace = os.path.normpath(workspace)
+        self.lock = threading.Lock()
+        self.files = {}
+        self.has_files = False
+        self.tree_digest = None
+        self.workspace_hash = None
+        self.digest_size = 0
+        self.scanned = (None, 0)
+
+    def calculate_hash(self, version=None):
+        """Calculate the hash of the workspace, reading only changed files.
+
+        :param version: Value which changes whenever the workspace may have
+            been modified. If None, the workspace is always scanned.
+        :returns: Hash of the workspace, or -1 if it can not be calculated.
+        """
+        with self.lock:
+            return self._scan(version)
+
+    def list_files(self, version=None):
+        """List the files of the workspace, reading only changed files.
+
+        :param version: Value which changes whenever the workspace may have
+            been modified. If None, the workspace is always scanned.
+        :returns: List of ``(relative path, size, sha256)`` tuples, or None if
+            the workspace can not be scanned.
+        """
+        with self.lock:
+            if self._scan(version, need_files=True) == -1:
+                return None
+            return [(os.path.relpath(file_path, self.workspace), size,
+                     file_sha256)
+                    for file_path, (_, _, file_sha256, size)
+                    in self.files.items()]
+
+    def drop_digests(self):
+        """Forget the file digests, the next scan reads all files again."""
+        with self.lock:
+            self.files = {}
+            self.has_files = False
+            self.tree_digest = None
+            self.digest_size = 0
+
+    def _scan(self, version, need_files=False):
+        scanned_version, scanned_at = self.scanned
+        if version is not None and version == scanned_version and \
+                time.time() - scanned_at < \
+                config.WORKSPACE_HASH_RESCAN_INTERVAL and \
+                (self.has_files or not need_files):
+            return self.workspace_hash
+        try:
+            workspace_hash = self._calculate_hash()
+        except Exception:
+            workspace_hash = -1
+        self.scanned = (version, time.time()) \
+            if workspace_hash != -1 else (None, 0)
+        return workspace_hash
+
+    def _calculate_hash(self):
+        if not os.path.exists(self.workspace):
+            return -1
+        # Files modified since the scan started may be modified again within
+        # the mtime granularity, their digests are not reused in next scans.
+        scan_start_ns = int(time.time() * 1e9) - 1000000000
+        files = {}
+        ordered_paths = []
+        tree = []
+        for subdir, dirs, file_names in os.walk(self.workspace):
+            node = [subdir, md5()]
+            for file_name in file_names:
+                file_path = os.path.join(subdir, file_name)
+                stat = os.stat(file_path)
+                key = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+                cached = self.files.get(file_path)
+                if cached and cached[0] == key:
+                    digests, file_sha256 = cached[1:3]
+                else:
+                    digests, file_sha256 = hash_file_chunks(file_path)
+                if stat.st_mtime_ns >= scan_start_ns:
+                    key = None
+                files[file_path] = (key, digests, file_sha256, stat.st_size)
+                ordered_paths.append(file_path)
+                node[1].update(
+                    '{0}\0{1}\0'.format(file_name, key).encode())
+            tree.append(node)
+        self.files = files
+        self.has_files = True
+        self.digest_size = sum(len(entry[1]) + 32 for entry in files.values())
+        tree_digest = self._roll_up(tree)
+        if tree_digest != self.tree_digest or self.workspace_hash is None \
+                or any(files[path][0] is None for path in ordered_paths):
+            md5_hash = md5()
+            for file_path in ordered_paths:
+                md5_hash.update(binascii.hexlify(files[file_path][1]))
+            self.workspace_hash = md5_hash.hexdigest()
+            self.tree_digest = tree_digest
+        return self.workspace_hash
+
+    @staticmethod
+    def _roll_up(tree):
+        """Compute the digest of every directory from its entries.
+
+        :param tree: List of ``[directory, md5 of its files]`` in ``os.walk``
+            top-down order, updated in place.
+        :returns: Digest of the root directory.
+        """
+        # Children come after their parent in top-down order, visiting the
+        # directories backwards rolls the digests up to the root.
+        node_hashes = dict(tree)
+        digest = None
+        for directory, node_hash in reversed(tree):
+            digest = node_hash.hexdigest()
+            parent_hash = node_hashes.get(os.path.dirname(directory))
+            if parent_hash and directory != tree[0][0]:
+                parent_hash.update('{0}\0{1}\0'.format(
+                    os.path.basename(directory), digest).encode())
+        return digest
+
+
+class WorkspaceHashCache(object):
+    """Hash indexes of the most recently used workspaces.
+
+    The cache is bounded by the number of workspaces and by the total size
+    of the file digests it keeps, about 16 bytes per 4 KiB of files and 32
+    bytes per file.
+    """
+
+    def __init__(self, size=None, max_digest_size=None):
+        """Instantiate empty cache.
+
+        :param size: Maximum number of workspaces indexed.
+        :param max_digest_size: Maximum number of bytes of file digests kept
+            for all the workspaces.
+        """
+        self.size = size or config.WORKSPACE_HASH_CACHE_SIZE
+        self.max_digest_size = max_digest_size or \
+            config.WORKSPACE_HASH_CACHE_MAX_DIGEST_SIZE
+        self.lock = threading.Lock()
+        self.indexes = OrderedDict()
+
+    def calculate_hash(self, workspace, version=None):
+        """Calculate the hash of a workspace.
+
+        :param workspace: Path of the workspace.
+        :param version: Value which changes whenever the workspace may have
+            been modified. If None, the workspace is always scanned.
+        :returns: Same value as
+            :func:`reana_commons.utils.calculate_hash_of_dir`.
+        """
+        index = self._get_index(workspace)
+        workspace_hash = index.calculate_hash(version)
+        self._evict(index)
+        return workspace_hash
+
+    def list_files(self, workspace, version=None):
+        """List the files of a workspace with their size and SHA-256.
+
+        :param workspace: Path of the workspace.
+        :param version: Value which changes whenever the workspace may have
+            been modified. If None, the workspace is always scanned.
+        :returns: List of ``(relative path, size, sha256)`` tuples, or None if
+            the workspace can not be scanned.
+        """
+        index = self._get_index(workspace)
+        files = index.list_files(version)
+        self._evict(index)
+        return files
+
+    def _get_index(self, workspace):
+        with self.lock:
+            index = self.indexes.pop(workspace, None) or \
+                WorkspaceHashIndex(workspace)
+            self.indexes[workspace] = index
+            while len(self.indexes) > self.size:
+                self.indexes.popitem(last=False)
+        return index
+
+    def _evict(self, index):
+        with self.lock:
+            digest_size = sum(other.digest_size
+                              for other in self.indexes.values())
+            while digest_size > self.max_digest_size and \
+                    len(self.indexes) > 1:
+                _, evicted = self.indexes.popitem(last=False)
+                digest_size -= evicted.digest_size
+        if index.digest_size > self.max_digest_size:
+            # Too large to be kept, the hash is still reused while valid.
+            index.drop_digests()
+
+
+WORKSPACE_HASH_CACHE = WorkspaceHashCache()
+"""Hash indexes of the workspaces checked by the job cache and listed in
+the input manifests of the HTCondor jobs."""
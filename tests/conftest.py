@@ -13,7 +13,6 @@ from __future__ import absolute_import, print_function
 import uuid
 
 import pytest
-from mock import MagicMock
 
 from reana_job_controller.factory import create_app
 from reana_job_controller.job_db import JOB_DB
@@ -23,7 +22,10 @@ from reana_job_controller.job_db import JOB_DB
 def mocked_job():
     """Mock existing job."""
     job_id = str(uuid.uuid4())
-    JOB_DB[job_id] = MagicMock()
+    JOB_DB.add(job_id, backend='Kubernetes', backend_job_id=job_id,
+               docker_img='busybox', cmd='ls', experiment='default',
+               status='started', restart_count=0, max_restart_count=3,
+               deleted=False)
     return job_id
 
 
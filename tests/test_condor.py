@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of REANA.
+# Copyright (C) 2019 CERN.
+#
+# REANA is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""REANA-Job-Controller HTCondor watcher tests."""
+
+import htcondor
+from mock import MagicMock, patch
+
+from reana_job_controller.condor import (CondorJobEventLogReader,
+                                         CondorPollScheduler,
+                                         build_clusters_constraint,
+                                         build_jobs_constraint,
+                                         condorJobStatus, process_condor_event,
+                                         process_condor_event_log,
+                                         query_condor_jobs,
+                                         store_condor_job_logs)
+from reana_job_controller.htcondor_job_manager import (HTCondorJobManager,
+                                                       ScheddCache)
+from reana_job_controller.job_db import JobStore
+
+
+def test_build_clusters_constraint():
+    """Test constraint matching several clusters."""
+    assert build_clusters_constraint([12, 3]) == 'member(ClusterId, {3, 12})'
+
+
+def test_query_condor_jobs():
+    """Test status of many jobs is retrieved with two schedd queries."""
+    schedd = MagicMock()
+    schedd.xquery.return_value = iter([
+        {'ClusterId': 1, 'JobStatus': condorJobStatus['Running']}])
+    schedd.history.return_value = iter([
+        {'ClusterId': 2, 'JobStatus': condorJobStatus['Completed'],
+         'ExitCode': 0}])
+    condor_jobs = query_condor_jobs(schedd, [(1, 0), (2, 0), (3, 0)])
+    assert schedd.xquery.call_count == 1
+    assert schedd.history.call_count == 1
+    assert schedd.history.call_args[0][0] == \
+        '(member(ClusterId, {2, 3}) && ProcId == 0)'
+    assert schedd.history.call_args[0][2] == 2
+    assert set(condor_jobs) == {(1, 0), (2, 0)}
+    assert condor_jobs[(2, 0)]['ExitCode'] == 0
+
+
+def test_build_jobs_constraint():
+    """Test constraint matching exactly the procs of several clusters."""
+    assert build_jobs_constraint([(1, 0), (5, 2), (5, 0), (3, 0)]) == \
+        '(member(ClusterId, {1, 3}) && ProcId == 0) || ' \
+        '(ClusterId == 5 && member(ProcId, {0, 2}))'
+
+
+def test_process_condor_event_job_array():
+    """Test events of the items of job arrays are matched by proc."""
+    job_db = JobStore()
+    for proc_id in range(2):
+        job_db.add('item-{0}'.format(proc_id), deleted=False,
+                   status='started', restart_count=0, max_restart_count=3,
+                   backend_job_id='123.{0}'.format(proc_id))
+    event = MagicMock(cluster=123, proc=1,
+                      type=htcondor.JobEventType.JOB_HELD)
+    with patch('reana_job_controller.condor.mark_job_deleted_in_db'), \
+            patch('reana_job_controller.condor.SCHEDD_CACHE') as schedd_cache:
+        process_condor_event(job_db, event)
+    schedd_cache.act.assert_called_once_with(
+        htcondor.JobAction.Remove, 'ClusterId==123 && ProcId==1')
+    assert job_db['item-1'].status == 'failed'
+    assert job_db['item-0'].status == 'started'
+
+
+def test_condor_job_event_log_reader(tmpdir):
+    """Test job event log is read incrementally and resumed."""
+    event_log = tmpdir.join('job_event.log')
+    event_log.write(
+        '000 (123.000.000) 10/16 10:00:00 Job submitted from host: '
+        '<127.0.0.1:9618>\n...\n'
+        '005 (123.000.000) 10/16 10:01:00 Job terminated.\n'
+        '\t(1) Normal termination (return value 0)\n'
+        '\t\tUsr 0 00:00:00, Sys 0 00:00:00  -  Run Remote Usage\n'
+        '\t\tUsr 0 00:00:00, Sys 0 00:00:00  -  Run Local Usage\n'
+        '\t\tUsr 0 00:00:00, Sys 0 00:00:00  -  Total Remote Usage\n'
+        '\t\tUsr 0 00:00:00, Sys 0 00:00:00  -  Total Local Usage\n'
+        '\t0  -  Run Bytes Sent By Job\n'
+        '\t0  -  Run Bytes Received By Job\n'
+        '\t0  -  Total Bytes Sent By Job\n'
+        '\t0  -  Total Bytes Received By Job\n...\n'
+        '012 (124.000.000) 10/16 10:02:00 Job was held.\n')
+    reader = CondorJobEventLogReader(str(event_log))
+    events = reader.read_events()
+    assert [event.type for event in events] == [
+        htcondor.JobEventType.SUBMIT, htcondor.JobEventType.JOB_TERMINATED]
+    reader.save_offset()
+    event_log.write('\tVia condor_hold (by user reana)\n'
+                    '\tCode 1 Subcode 0\n...\n', mode='a')
+    reader = CondorJobEventLogReader(str(event_log))
+    events = reader.read_events()
+    assert len(events) == 1
+    assert events[0].type == htcondor.JobEventType.JOB_HELD
+    assert events[0].cluster == 124
+
+
+def test_process_condor_event_log_retries_failed_event(tmpdir):
+    """Test events are consumed only once they have been processed."""
+    event_log = tmpdir.join('job_event.log')
+    event_log.write('000 (1.000.000) Job submitted.\n...\n'
+                    '005 (2.000.000) Job terminated.\n...\n')
+    reader = CondorJobEventLogReader(str(event_log))
+    events = [MagicMock(cluster=1), MagicMock(cluster=2)]
+    with patch('reana_job_controller.condor.htcondor.JobEventLog') as \
+            job_event_log, \
+            patch('reana_job_controller.condor.process_condor_event',
+                  side_effect=[None, Exception('Schedd unreachable.'),
+                               None]) as process_event:
+        job_event_log.return_value.events.return_value = events
+        process_condor_event_log({}, reader)
+        assert reader.offset == 0
+        assert not tmpdir.join('job_event.log.offset').exists()
+        process_condor_event_log({}, reader)
+    assert [c[0][1] for c in process_event.call_args_list] == \
+        [events[0], events[1], events[1]]
+    assert reader.offset == event_log.size()
+    assert tmpdir.join('job_event.log.offset').read() == \
+        str(event_log.size())
+
+
+def test_process_condor_event():
+    """Test job DB is updated according to HTCondor events."""
+    job_db = JobStore()
+    job_db.add('job', backend_job_id=123, deleted=False, status='started',
+               restart_count=0, max_restart_count=3)
+    event = MagicMock(cluster=123, type=htcondor.JobEventType.JOB_TERMINATED)
+    event.get.side_effect = {'TerminatedNormally': True,
+                             'ReturnValue': 1}.get
+    with patch('reana_job_controller.condor.mark_job_deleted_in_db') as \
+            mark_job_deleted_in_db:
+        process_condor_event(job_db, event)
+    mark_job_deleted_in_db.assert_called_once_with('job')
+    assert job_db['job']['status'] == 'failed'
+    assert job_db['job']['deleted']
+    assert not job_db.retrieve_job_id_by_backend_job_id('123')
+
+
+def test_condor_poll_scheduler():
+    """Test jobs are polled less often as they get older."""
+    scheduler = CondorPollScheduler()
+    scheduler.add(1, 'job-1', now=0)
+    scheduler.add(2, 'job-2', now=0)
+    assert scheduler.pop_due(now=5) == []
+    assert sorted(scheduler.pop_due(now=10)) == [1, 2]
+    # Young jobs are checked again after the minimum interval.
+    scheduler.schedule(1, now=10, job_status=condorJobStatus['Running'])
+    scheduler.remove(2)
+    assert scheduler.next_deadline() == 20
+    assert scheduler.pop_due(now=20) == [1]
+    # Old jobs are checked at most every maximum interval.
+    scheduler.schedule(1, now=10000, job_status=condorJobStatus['Running'])
+    assert scheduler.next_deadline() == 10120
+    assert len(scheduler) == 1
+
+
+def test_condor_poll_scheduler_missing_job():
+    """Test missing jobs are checked again with an exponential backoff."""
+    scheduler = CondorPollScheduler()
+    scheduler.add(1, 'job-1', now=0)
+    assert scheduler.schedule_missing(1, now=10) == 1
+    assert scheduler.next_deadline() == 30
+    assert scheduler.schedule_missing(1, now=30) == 2
+    assert scheduler.next_deadline() == 70
+    for now in (70, 150, 270):
+        scheduler.schedule_missing(1, now=now)
+    # The backoff is capped at the maximum interval.
+    assert scheduler.next_deadline() == 390
+    # Finding the job again resets the backoff.
+    scheduler.schedule(1, now=390, job_status=condorJobStatus['Idle'])
+    assert scheduler.schedule_missing(1, now=400) == 1
+
+
+def test_schedd_cache():
+    """Test that schedd connections are reused and checked when idle."""
+    connect = MagicMock(side_effect=lambda address: MagicMock())
+    schedd_cache = ScheddCache(health_check_interval=60, connect=connect)
+    with patch('time.time', return_value=0):
+        schedd = schedd_cache.get('schedd-1')
+        assert schedd_cache.get('schedd-1') is schedd
+        assert schedd_cache.get('schedd-2') is not schedd
+    assert connect.call_count == 2
+    assert not schedd.query.called
+    # Idle connections are checked before being used again.
+    with patch('time.time', return_value=100):
+        assert schedd_cache.get('schedd-1') is schedd
+    assert schedd.query.call_count == 1
+    schedd.query.side_effect = Exception('Connection lost')
+    with patch('time.time', return_value=200):
+        assert schedd_cache.get('schedd-1') is not schedd
+    assert connect.call_count == 3
+
+
+def test_schedd_cache_checks_outside_lock():
+    """Test that schedds are checked and connected without the lock."""
+    schedd = MagicMock()
+
+    def check_unlocked(*args):
+        assert not schedd_cache.lock.locked()
+        return schedd
+
+    schedd_cache = ScheddCache(health_check_interval=60,
+                               connect=check_unlocked)
+    schedd.query.side_effect = check_unlocked
+    with patch('time.time', return_value=0):
+        assert schedd_cache.get('schedd-1') is schedd
+    with patch('time.time', return_value=100):
+        assert schedd_cache.get('schedd-1') is schedd
+    assert schedd.query.call_count == 1
+
+
+def test_schedd_cache_act_reconnects():
+    """Test that failed actions are retried with a new connection."""
+    broken_schedd, schedd = MagicMock(), MagicMock()
+    broken_schedd.act.side_effect = Exception('Connection lost')
+    connect = MagicMock(side_effect=[broken_schedd, schedd])
+    schedd_cache = ScheddCache(connect=connect)
+    schedd_cache.act(htcondor.JobAction.Remove, 'ClusterId==1', 'schedd-1')
+    schedd.act.assert_called_once_with(htcondor.JobAction.Remove,
+                                       'ClusterId==1')
+    assert schedd_cache.get('schedd-1') is schedd
+
+
+def test_build_submit_description_transfers_parrot():
+    """Test that the published parrot is transferred with the job."""
+    with patch('reana_job_controller.htcondor_job_manager.get_job_files',
+               return_value=('/var/reana/job-files/1/job_wrapper.sh',
+                             ('/var/reana/job-files/2/parrot_static_run',
+                              '2'))):
+        job_manager = HTCondorJobManager(docker_img='busybox', cmd='ls',
+                                         workflow_workspace='/var/reana/w')
+    sub = job_manager.build_submit_description()
+    assert sub['executable'] == '/var/reana/job-files/1/job_wrapper.sh'
+    assert sub['transfer_input_files'] == \
+        '/var/reana/job-files/2/parrot_static_run'
+    assert 'reana_parrot_sha256=2' in sub['environment']
+
+
+def test_build_submit_description_transfers_input_manifest(tmpdir):
+    """Test that the input manifest of the workspace is transferred."""
+    with patch('reana_job_controller.htcondor_job_manager.get_job_files',
+               return_value=('/var/reana/job-files/1/job_wrapper.sh',
+                             ('/var/reana/job-files/2/parrot_static_run',
+                              '2'))):
+        job_manager = HTCondorJobManager(docker_img='busybox', cmd='ls',
+                                         workflow_workspace=str(tmpdir))
+    with patch('reana_job_controller.htcondor_job_manager.INPUT_MANIFESTS.'
+               'get',
+               return_value='/var/reana/job-files/3/'
+                            'reana_input_manifest.tsv') as get_manifest:
+        sub = job_manager.build_submit_description()
+    assert get_manifest.call_args[0] == (str(tmpdir), )
+    assert sub['transfer_input_files'] == \
+        '/var/reana/job-files/2/parrot_static_run,' \
+        '/var/reana/job-files/3/reana_input_manifest.tsv'
+
+
+def test_build_submit_description_uses_cached_image():
+    """Test that the job gets the converted image and the pinned digest."""
+    digest = 'sha256:' + 'a' * 64
+    with patch('reana_job_controller.htcondor_job_manager.get_job_files',
+               return_value=('/var/reana/job-files/1/job_wrapper.sh', None)), \
+            patch('reana_job_controller.htcondor_job_manager.'
+                  'SINGULARITY_IMAGES.get',
+                  return_value=(digest, '/var/reana/images/a.sif')):
+        job_manager = HTCondorJobManager(docker_img='busybox:1.31', cmd='ls',
+                                         workflow_workspace='/var/reana/w')
+    sub = job_manager.build_submit_description()
+    assert 'docker://busybox@{0} ls'.format(digest) in sub['arguments']
+    assert 'reana_singularity_image=/var/reana/images/a.sif' in \
+        sub['environment']
+
+
+def test_execute_htcondor_job_array():
+    """Test job arrays are submitted as one cluster with item data."""
+    with patch('reana_job_controller.htcondor_job_manager.get_job_files',
+               return_value=('/var/reana/job-files/1/job_wrapper.sh', None)):
+        job_manager = HTCondorJobManager(docker_img='busybox', cmd='echo',
+                                         workflow_workspace='/var/reana/w')
+    item_managers = [job_manager.build_array_item({'ITEM': str(i)}, str(i))
+                     for i in range(2)]
+    with patch('reana_job_controller.htcondor_job_manager.'
+               'SUBMISSION_HELPER_POOL') as submission_helpers, \
+            patch.object(HTCondorJobManager, 'create_jobs_in_db') as \
+            create_jobs_in_db:
+        submission_helpers.submit.return_value = [42]
+        backend_job_ids = job_manager.execute_array(item_managers)
+    assert backend_job_ids == ['42.0', '42.1']
+    (description, ), (itemdata, ) = submission_helpers.submit.call_args[0]
+    assert description['arguments'] == '$(reana_arguments)'
+    assert itemdata[1]['reana_arguments'].endswith('echo 1')
+    assert 'ITEM=1' in itemdata[1]['reana_environment']
+    create_jobs_in_db.assert_called_once_with(
+        list(zip(item_managers, backend_job_ids)))
+
+
+def test_store_condor_job_logs(tmpdir):
+    """Test that the output files of a job are removed once stored."""
+    template = str(tmpdir.join('{0}-{1}.{2}'))
+    job_db = JobStore()
+    with patch('reana_job_controller.htcondor_job_manager.'
+               'HTCONDOR_OUTPUT_TEMPLATE', template), \
+            patch('reana_job_controller.condor.save_job_logs') \
+            as save_job_logs:
+        tmpdir.join('12-0.out').write_binary(b'output\n')
+        tmpdir.join('12-0.err').write_binary(b'error\n')
+        save_job_logs.side_effect = [Exception('Shared volume unavailable'),
+                                     None]
+        store_condor_job_logs(job_db, 'job', '12')
+        assert save_job_logs.call_count == 2
+        assert tmpdir.listdir() == []
+        # The files do not outlive the last attempt.
+        tmpdir.join('13-0.out').write_binary(b'output\n')
+        save_job_logs.reset_mock()
+        save_job_logs.side_effect = Exception('Shared volume unavailable')
+        store_condor_job_logs(job_db, 'job', '13')
+        assert save_job_logs.call_count == 3
+    assert tmpdir.listdir() == []
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of REANA.
+# Copyright (C) 2019 CERN.
+#
+# REANA is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""REANA-Job-Controller HTCondor submission helpers tests."""
+
+import io
+import json
+import sys
+
+import pytest
+from mock import MagicMock, patch
+
+from reana_job_controller.errors import ComputingBackendSubmissionError
+from reana_job_controller.htcondor_submitter import (
+    HTCondorSubmissionHelper, HTCondorSubmissionHelperPool, serve)
+
+FAKE_HELPER = '''
+import json, os, sys, time
+marker = sys.argv[1] if len(sys.argv) > 1 else None
+for line in sys.stdin:
+    request = json.loads(line)
+    if 'lookup' in request:
+        queued = marker and os.path.exists(marker) and \\
+            open(marker).read() == request['lookup']
+        response = {'cluster_ids': [42] if queued else None}
+        sys.stdout.write(json.dumps(response) + '\\n')
+        sys.stdout.flush()
+        continue
+    descriptions = request['descriptions']
+    if descriptions[0].get('executable') == 'exit':
+        sys.exit(1)
+    if descriptions[0].get('executable') == 'hang':
+        if marker:
+            with open(marker, 'w') as f:
+                f.write(request['submission_tag'])
+        time.sleep(60)
+    if descriptions[0].get('executable') == 'error':
+        response = {'error': 'Schedd unavailable'}
+    else:
+        response = {'cluster_ids': list(range(len(descriptions)))}
+    sys.stdout.write(json.dumps(response) + '\\n')
+    sys.stdout.flush()
+'''
+
+
+def test_serve_submits_in_one_transaction():
+    """Test that the descriptions of a request are queued together."""
+    schedd = MagicMock()
+    input_file = io.StringIO(json.dumps(
+        {'descriptions': [{'executable': 'a'}, {'executable': 'b'}]}) + '\n')
+    output_file = io.StringIO()
+    with patch('htcondor.Submit') as submit:
+        submit.return_value.queue.side_effect = [11, 12]
+        serve(input_file, output_file, lambda: schedd)
+    assert json.loads(output_file.getvalue()) == {'cluster_ids': [11, 12]}
+    assert schedd.transaction.call_count == 1
+
+
+def test_serve_reconnects_on_error():
+    """Test that failed submissions are retried with a new connection."""
+    connect = MagicMock()
+    # The schedd is unreachable, then the submission is not found.
+    connect.return_value.query.side_effect = [Exception('Lost'), []]
+    input_file = io.StringIO(json.dumps(
+        {'descriptions': [{'executable': 'a'}],
+         'submission_tag': 'tag'}) + '\n')
+    output_file = io.StringIO()
+    with patch('htcondor.Submit') as submit:
+        submit.return_value.queue.side_effect = [Exception('Lost'), 7]
+        serve(input_file, output_file, connect)
+    assert json.loads(output_file.getvalue()) == {'cluster_ids': [7]}
+    assert connect.call_count == 2
+    assert submit.call_args[0][0] == {'executable': 'a',
+                                      '+ReanaSubmissionTag': '"tag"',
+                                      '+ReanaSubmissionIndex': '0'}
+
+
+def test_serve_finds_committed_submission():
+    """Test that a submission queued before the error is not queued again."""
+    connect = MagicMock()
+    connect.return_value.query.side_effect = [
+        Exception('Lost'),
+        [{'ClusterId': 7, 'ReanaSubmissionIndex': 0}]]
+    input_file = io.StringIO(json.dumps(
+        {'descriptions': [{'executable': 'a'}],
+         'submission_tag': 'tag'}) + '\n')
+    output_file = io.StringIO()
+    with patch('htcondor.Submit') as submit:
+        submit.return_value.queue.side_effect = Exception('Lost')
+        serve(input_file, output_file, connect)
+    assert json.loads(output_file.getvalue()) == {'cluster_ids': [7]}
+    assert submit.return_value.queue.call_count == 1
+    assert connect.return_value.query.call_args[0][0] == \
+        'ReanaSubmissionTag == "tag"'
+
+
+def test_serve_does_not_retry_submission_errors():
+    """Test that submissions failing on a reachable schedd are not retried."""
+    schedd = MagicMock()
+    schedd.query.return_value = []
+    input_file = io.StringIO(json.dumps(
+        {'descriptions': [{'executable': 'a'}]}) + '\n')
+    output_file = io.StringIO()
+    with patch('htcondor.Submit') as submit:
+        submit.return_value.queue.side_effect = ValueError('Bad submit')
+        serve(input_file, output_file, lambda: schedd)
+    assert json.loads(output_file.getvalue()) == {'error': 'Bad submit'}
+    assert schedd.transaction.call_count == 1
+
+
+def test_submission_helper():
+    """Test submissions through a helper process."""
+    helper = HTCondorSubmissionHelper([sys.executable, '-c', FAKE_HELPER])
+    try:
+        assert helper.submit([{'executable': 'a'}] * 3) == [0, 1, 2]
+        process = helper.process
+        assert helper.submit([{'executable': 'a'}]) == [0]
+        assert helper.process is process
+        with pytest.raises(ComputingBackendSubmissionError):
+            helper.submit([{'executable': 'error'}])
+        with pytest.raises(ComputingBackendSubmissionError):
+            helper.submit([{'executable': 'exit'}])
+        assert helper.process is None
+        # A new helper process is started after a crash.
+        assert helper.submit([{'executable': 'a'}]) == [0]
+    finally:
+        helper.stop()
+
+
+def test_submission_helper_timeout():
+    """Test that a helper which does not answer is restarted."""
+    helper = HTCondorSubmissionHelper([sys.executable, '-c', FAKE_HELPER],
+                                      timeout=1)
+    try:
+        assert helper.submit([{'executable': 'a'}]) == [0]
+        process = helper.process
+        with pytest.raises(ComputingBackendSubmissionError):
+            helper.submit([{'executable': 'hang'}])
+        assert process.poll() is not None
+        assert helper.process is not process
+        assert helper.submit([{'executable': 'a'}]) == [0]
+    finally:
+        helper.stop()
+
+
+def test_submission_helper_timeout_finds_queued_jobs(tmpdir):
+    """Test that jobs queued by a helper which timed out are returned."""
+    helper = HTCondorSubmissionHelper(
+        [sys.executable, '-c', FAKE_HELPER, str(tmpdir.join('queued'))],
+        timeout=1)
+    try:
+        assert helper.submit([{'executable': 'hang'}]) == [42]
+    finally:
+        helper.stop()
+
+
+def test_submission_helper_pool():
+    """Test that helpers are returned to the pool after submitting."""
+    pool = HTCondorSubmissionHelperPool(
+        size=2, args=[sys.executable, '-c', FAKE_HELPER])
+    try:
+        for _ in range(3):
+            assert pool.submit([{'executable': 'a'}]) == [0]
+        with pytest.raises(ComputingBackendSubmissionError):
+            pool.submit([{'executable': 'error'}])
+        assert pool.idle_helpers.qsize() == 2
+    finally:
+        while not pool.idle_helpers.empty():
+            pool.idle_helpers.get().stop()
+
+
+def test_serve_job_array():
+    """Test that descriptions with item data are queued as one cluster."""
+    schedd = MagicMock()
+    itemdata = [{'reana_arguments': 'a'}, {'reana_arguments': 'b'}]
+    input_file = io.StringIO(json.dumps(
+        {'descriptions': [{'executable': 'a'}, {'executable': 'b'}],
+         'itemdata': [itemdata, None]}) + '\n')
+    output_file = io.StringIO()
+    with patch('htcondor.Submit') as submit:
+        submit.return_value.queue_with_itemdata.return_value.cluster.\
+            return_value = 11
+        submit.return_value.queue.return_value = 12
+        serve(input_file, output_file, lambda: schedd)
+    assert json.loads(output_file.getvalue()) == {'cluster_ids': [11, 12]}
+    args = submit.return_value.queue_with_itemdata.call_args[0]
+    assert list(args[2]) == itemdata
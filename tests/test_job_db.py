@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of REANA.
+# Copyright (C) 2019 CERN.
+#
+# REANA is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""REANA-Job-Controller job store tests."""
+
+import json
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from mock import patch
+from reana_commons.utils import calculate_job_input_hash
+from reana_db.models import Job, JobStatus
+
+from reana_job_controller.job_db import (JobInputHashCache, JobRecord,
+                                         JobStore, jobs_are_cached,
+                                         rehydrate_job_db)
+
+
+def test_job_record():
+    """Test job records are read like dictionaries."""
+    job = JobRecord(job_id='job', status='started')
+    assert job['status'] == 'started'
+    assert job.get('log', 'no logs') == 'no logs'
+    with pytest.raises(KeyError):
+        job['obj']
+    with pytest.raises(AttributeError):
+        job.obj = object()
+
+
+def test_job_store_indexes():
+    """Test status and backend job id indexes follow job updates."""
+    job_db = JobStore()
+    job_db.add('job-1', backend_job_id=1, status='started', deleted=False)
+    job_db.add('job-2', backend_job_id=2, status='started', deleted=False)
+    assert job_db.retrieve_job_id_by_backend_job_id('1') == 'job-1'
+    job_db.update('job-1', status='succeeded')
+    assert job_db.count_by_status() == {'started': 1, 'succeeded': 1}
+    assert job_db.job_ids(status='succeeded') == ['job-1']
+    assert job_db.retrieve_job_id_by_backend_job_id(1) is None
+    assert job_db.unfinished_jobs() == [('2', 'job-2')]
+    assert job_db.update('unknown', status='failed') is None
+
+
+def test_job_store_eviction():
+    """Test least recently accessed finished jobs are evicted."""
+    job_db = JobStore(max_finished_jobs=2, finished_job_ttl=3600)
+    for job_id in ('job-1', 'job-2', 'job-3'):
+        job_db.add(job_id, status='started', deleted=False)
+        job_db.update(job_id, status='succeeded', deleted=True)
+        job_db.get('job-1')
+    job_db.add('job-4', status='started', deleted=False)
+    assert sorted(job_db.job_ids()) == ['job-1', 'job-3', 'job-4']
+    assert job_db.evict(now=time.time() + 3600) == 2
+    assert job_db.job_ids() == ['job-4']
+
+
+def test_job_store_page():
+    """Test jobs are paginated in the order they were added."""
+    job_db = JobStore()
+    for i in range(5):
+        job_db.add('job-{0}'.format(i), status='started', deleted=False,
+                   workflow_uuid='workflow-{0}'.format(i % 2))
+    job_db.update('job-0', status='succeeded')
+    jobs, after = job_db.page(limit=2)
+    assert [job.job_id for job in jobs] == ['job-0', 'job-1']
+    jobs, after = job_db.page(after=after, limit=2)
+    assert [job.job_id for job in jobs] == ['job-2', 'job-3']
+    jobs, after = job_db.page(after=after, limit=2)
+    assert [job.job_id for job in jobs] == ['job-4']
+    assert after is None
+    jobs, after = job_db.page(status='started', workflow_uuid='workflow-0',
+                              limit=1)
+    assert [job.job_id for job in jobs] == ['job-2']
+    jobs, after = job_db.page(status='started', workflow_uuid='workflow-0',
+                              after=after)
+    assert [job.job_id for job in jobs] == ['job-4']
+    job_db.remove('job-2')
+    assert job_db.job_ids(status='started') == ['job-1', 'job-3', 'job-4']
+    assert [job.job_id for job in job_db.page(workflow_uuid='workflow-0')[0]] \
+        == ['job-0', 'job-4']
+
+
+def test_rehydrate_job_db(app, session, sample_serial_workflow_in_db):
+    """Test unfinished jobs are loaded from DB page by page."""
+    workflow_uuid = sample_serial_workflow_in_db.id_
+    for i, status in enumerate([JobStatus.created, JobStatus.running,
+                                JobStatus.queued, JobStatus.finished]):
+        session.add(Job(backend_job_id=str(i), workflow_uuid=workflow_uuid,
+                        status=status, backend='HTCondor',
+                        docker_img='busybox', cmd=json.dumps('ls'),
+                        restart_count=0, max_restart_count=3,
+                        deleted=False))
+    session.add(Job(backend_job_id='deleted', workflow_uuid=workflow_uuid,
+                    status=JobStatus.running, backend='Kubernetes',
+                    deleted=True))
+    # Left unfinished by a job controller which did not record its end.
+    session.add(Job(backend_job_id='old', workflow_uuid=workflow_uuid,
+                    status=JobStatus.running, backend='HTCondor',
+                    deleted=False,
+                    created=datetime.utcnow() - timedelta(days=30)))
+    session.commit()
+    assert rehydrate_job_db(JobStore(), max_jobs=2) == 2
+    job_db = JobStore()
+    assert rehydrate_job_db(job_db, page_size=2) == 3
+    assert sorted(backend_job_id for backend_job_id, _ in
+                  job_db.unfinished_jobs()) == ['0', '1', '2']
+    job = job_db[job_db.retrieve_job_id_by_backend_job_id('0')]
+    assert job.cmd == 'ls'
+    assert job.status == 'started'
+    assert rehydrate_job_db(job_db) == 0
+
+
+def test_job_store_wait_for_status_change():
+    """Test waiting for a job status change times out or returns early."""
+    job_db = JobStore()
+    job_db.add('job', status='started', deleted=False)
+    assert job_db.wait_for_status_change('job', 'started', 0.01).status == \
+        'started'
+    assert job_db.wait_for_status_change('job', 'queued', 10).status == \
+        'started'
+    assert not job_db.status_waiters
+
+
+def test_job_input_hash_cache():
+    """Test job input hashes are computed by reana-commons and memoized."""
+    job_spec = {'cmd': 'ls', 'docker_img': 'busybox',
+                'workflow_workspace': '/workspace'}
+    workflow_json = {'steps': [job_spec['cmd']]}
+    input_hash_cache = JobInputHashCache(size=1)
+    expected_hash = calculate_job_input_hash(dict(job_spec), workflow_json)
+    with patch('reana_job_controller.job_db.calculate_job_input_hash',
+               side_effect=calculate_job_input_hash) as calculate_hash:
+        assert input_hash_cache.calculate_hashes(
+            [job_spec, job_spec], workflow_json) == [expected_hash] * 2
+        assert calculate_hash.call_count == 1
+        assert 'workflow_workspace' in job_spec
+        input_hash_cache.calculate_hashes([dict(job_spec, cmd='pwd')],
+                                          workflow_json)
+        input_hash_cache.calculate_hashes([job_spec], workflow_json)
+        assert calculate_hash.call_count == 3
+
+
+def test_jobs_are_cached_checks_workspace():
+    """Test the workspace is checked for changes at every cache lookup."""
+    with patch('reana_job_controller.job_db.WORKSPACE_HASH_CACHE.'
+               'calculate_hash', return_value=-1) as calculate_hash:
+        assert jobs_are_cached([{'cmd': 'ls'}], {}, '/workspace') == [None]
+    calculate_hash.assert_called_once_with('/workspace')
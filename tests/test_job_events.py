@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of REANA.
+# Copyright (C) 2019 CERN.
+#
+# REANA is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""REANA-Job-Controller job status events tests."""
+
+import json
+
+import pytest
+from mock import patch
+
+from reana_job_controller.job_db import JobStore
+from reana_job_controller.job_events import JobEventBuffer, stream_job_events
+
+
+def test_job_event_buffer_replay():
+    """Test events are replayed from the last received one."""
+    job_events = JobEventBuffer(size=2)
+    for status in ('queued', 'running', 'succeeded'):
+        job_events.publish('job', 'workflow', status)
+    assert [event['status'] for event in job_events.events_after(2)] == \
+        ['succeeded']
+    # Events dropped from the buffer are skipped.
+    assert [event['id'] for event in job_events.events_after(0)] == [2, 3]
+    assert job_events.events_after(3, timeout=0.01) == []
+
+
+def test_job_event_buffer_resync_after_restart():
+    """Test clients resuming from a previous process get the buffer."""
+    job_events = JobEventBuffer()
+    for status in ('queued', 'running', 'succeeded'):
+        job_events.publish('job', 'workflow', status)
+    assert job_events.parse_event_id(job_events.format_event_id(2)) == 2
+    assert job_events.parse_event_id('0123456789ab-500') == 0
+    assert job_events.parse_event_id('500') == 0
+    assert [event['id'] for event in job_events.events_after(500)] == \
+        [1, 2, 3]
+    with pytest.raises(ValueError):
+        job_events.parse_event_id('not-an-id')
+
+
+def test_job_store_publishes_status_transitions():
+    """Test the job store publishes an event per status change."""
+    job_db = JobStore()
+    job_db.add('job-1', workflow_uuid='workflow-1', status='started')
+    job_db.add('job-2', workflow_uuid='workflow-2', status='started')
+    job_db.update('job-1', status='succeeded')
+    job_db.update('job-1', deleted=True)
+    job_db.update('job-2', status='failed')
+    with patch('reana_job_controller.config.JOB_EVENTS_KEEPALIVE_INTERVAL',
+               0.01):
+        stream = stream_job_events(job_db.events, workflow_uuid='workflow-2',
+                                   last_event_id=0)
+        message = next(stream)
+        assert next(stream) == ': keepalive\n\n'
+    assert message.startswith('id: {0}-2\nevent: status\ndata: '.format(
+        job_db.events.epoch))
+    assert json.loads(message.split('data: ')[1]) == {
+        'id': 2, 'job_id': 'job-2', 'workflow_uuid': 'workflow-2',
+        'status': 'failed'}
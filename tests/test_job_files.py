@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of REANA.
+# Copyright (C) 2019 CERN.
+#
+# REANA is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""REANA-Job-Controller job files distribution tests."""
+
+import hashlib
+import os
+import threading
+from http.server import HTTPServer, SimpleHTTPRequestHandler
+
+import pytest
+from mock import MagicMock, patch
+
+from reana_job_controller.job_files import (JobFilePublisher,
+                                            WorkspaceManifestCache)
+from reana_job_controller.workspace_hash import (WorkspaceHashCache,
+                                                 hash_file_chunks)
+
+
+@pytest.fixture
+def file_server(tmpdir):
+    """Serve the files of a directory over HTTP."""
+    served_dir = tmpdir.mkdir('served')
+    # The handler serves the files of the current directory.
+    cwd = os.getcwd()
+    os.chdir(str(served_dir))
+    server = HTTPServer(('127.0.0.1', 0), SimpleHTTPRequestHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield served_dir, 'http://127.0.0.1:{0}'.format(server.server_port)
+    server.shutdown()
+    server.server_close()
+    os.chdir(cwd)
+
+
+def wait_for_downloads(publisher):
+    """Wait for the background downloads of a publisher."""
+    for thread in list(publisher.downloads.values()):
+        thread.join()
+
+
+def test_publish(tmpdir):
+    """Test that files are published once under their content hash."""
+    source = tmpdir.join('job_wrapper.sh')
+    source.write('#! /bin/bash\n')
+    sha256 = hashlib.sha256(b'#! /bin/bash\n').hexdigest()
+    publisher = JobFilePublisher(str(tmpdir.join('job-files')))
+    path, published_sha256 = publisher.publish(str(source))
+    assert published_sha256 == sha256
+    assert path == str(tmpdir.join('job-files', sha256, 'job_wrapper.sh'))
+    assert open(path).read() == '#! /bin/bash\n'
+    assert os.access(path, os.X_OK)
+    # Published files are memoized.
+    with patch('reana_job_controller.job_files.calculate_file_sha256') \
+            as calculate_file_sha256:
+        assert publisher.publish(str(source)) == (path, sha256)
+        assert not calculate_file_sha256.called
+
+
+def test_publish_url(tmpdir, file_server):
+    """Test that downloaded files are published once."""
+    served_dir, url = file_server
+    served_dir.join('parrot').write_binary(b'parrot')
+    sha256 = hashlib.sha256(b'parrot').hexdigest()
+    publisher = JobFilePublisher(str(tmpdir.join('job-files')))
+    assert publisher.publish_url(url + '/parrot', 'parrot_static_run') is None
+    wait_for_downloads(publisher)
+    path, published_sha256 = publisher.publish_url(
+        url + '/parrot', 'parrot_static_run')
+    assert published_sha256 == sha256
+    assert path == str(tmpdir.join('job-files', sha256, 'parrot_static_run'))
+    assert os.listdir(str(tmpdir.join('job-files'))) == [sha256]
+    served_dir.join('parrot').remove()
+    assert publisher.publish_url(url + '/parrot', 'parrot_static_run') == \
+        (path, sha256)
+
+
+def test_publish_url_failed(tmpdir, file_server):
+    """Test that failed downloads are not retried immediately."""
+    served_dir, url = file_server
+    publisher = JobFilePublisher(str(tmpdir.join('job-files')))
+    assert publisher.publish_url(url + '/parrot', 'parrot_static_run') is None
+    wait_for_downloads(publisher)
+    served_dir.join('parrot').write_binary(b'parrot')
+    assert publisher.publish_url(url + '/parrot', 'parrot_static_run') is None
+    assert not publisher.downloads
+    publisher.failed_downloads.clear()
+    publisher.publish_url(url + '/parrot', 'parrot_static_run')
+    wait_for_downloads(publisher)
+    assert publisher.publish_url(url + '/parrot', 'parrot_static_run')
+    assert os.listdir(str(tmpdir.join('job-files'))) == [
+        hashlib.sha256(b'parrot').hexdigest()]
+
+
+def test_publish_url_outside_lock(tmpdir, file_server):
+    """Test that files are downloaded without holding the lock."""
+    served_dir, url = file_server
+    served_dir.join('parrot').write_binary(b'parrot')
+    publisher = JobFilePublisher(str(tmpdir.join('job-files')))
+    with patch.object(publisher, '_publish',
+                      side_effect=lambda *args: publisher.lock.locked()):
+        publisher.publish_url(url + '/parrot', 'parrot_static_run')
+        wait_for_downloads(publisher)
+    assert publisher.publish_url(url + '/parrot', 'parrot_static_run') is \
+        False
+
+
+def test_publish_manifest(tmpdir):
+    """Test that manifests list the files with their size and hash."""
+    workspace = tmpdir.mkdir('workspace')
+    workspace.mkdir('data').join('input.csv').write_binary(b'1,2\n')
+    workspace.join('Snakefile').write_binary(b'rule all:\n')
+    publisher = JobFilePublisher(str(tmpdir.join('job-files')))
+    manifests = WorkspaceManifestCache(WorkspaceHashCache(),
+                                       publisher=publisher)
+    path = manifests.get(str(workspace))
+    assert os.path.basename(path) == 'reana_input_manifest.tsv'
+    assert open(path).read() == (
+        '{0}\t10\tSnakefile\n{1}\t4\tdata/input.csv\n'.format(
+            hashlib.sha256(b'rule all:\n').hexdigest(),
+            hashlib.sha256(b'1,2\n').hexdigest()))
+    assert manifests.get(str(tmpdir.join('missing'))) is None
+    assert not manifests.builds
+
+
+def test_manifest_reuses_workspace_hash_index(tmpdir):
+    """Test that manifests only read the files which changed."""
+    workspace = tmpdir.mkdir('workspace')
+    workspace.join('old.txt').write_binary(b'old')
+    os.utime(str(workspace.join('old.txt')), (0, 0))
+    hash_cache = WorkspaceHashCache()
+    hash_cache.calculate_hash(str(workspace))
+    manifests = WorkspaceManifestCache(
+        hash_cache, publisher=JobFilePublisher(str(tmpdir.join('files'))))
+    workspace.join('new.txt').write_binary(b'new')
+    with patch('reana_job_controller.workspace_hash.hash_file_chunks',
+               wraps=hash_file_chunks) as hash_chunks:
+        manifests.get(str(workspace), version=1)
+        # Same version, the workspace is not scanned again.
+        manifests.get(str(workspace), version=1)
+    hash_chunks.assert_called_once_with(str(workspace.join('new.txt')))
+
+
+def test_manifest_not_ready(tmpdir):
+    """Test that submissions do not wait for slow manifests."""
+    hash_cache = MagicMock()
+    building = threading.Event()
+    hash_cache.list_files.side_effect = lambda *args: building.wait() and []
+    manifests = WorkspaceManifestCache(
+        hash_cache, timeout=0.1,
+        publisher=JobFilePublisher(str(tmpdir.join('files'))))
+    assert manifests.get('/workspace', version=1) is None
+    assert manifests.get('/workspace', version=1) is None
+    # One build at a time per workspace and version.
+    assert hash_cache.list_files.call_count == 1
+    future = manifests.builds[('/workspace', 1)]
+    building.set()
+    assert future.result()
+
+
+def test_remove_old_manifests(tmpdir):
+    """Test that manifests unused for a while are removed."""
+    publisher = JobFilePublisher(str(tmpdir.join('files')))
+    manifests = WorkspaceManifestCache(MagicMock(), publisher=publisher)
+    old_path, _ = publisher.publish_content(b'old', manifests.MANIFEST_NAME)
+    os.utime(old_path, (0, 0))
+    new_path, _ = publisher.publish_content(b'new', manifests.MANIFEST_NAME)
+    wrapper = tmpdir.join('job_wrapper.sh')
+    wrapper.write('#! /bin/bash\n')
+    wrapper_path, _ = publisher.publish(str(wrapper))
+    os.utime(wrapper_path, (0, 0))
+    manifests.remove_old_manifests(max_age=3600)
+    assert not os.path.exists(os.path.dirname(old_path))
+    assert os.path.exists(new_path)
+    assert os.path.exists(wrapper_path)
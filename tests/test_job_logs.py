@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of REANA.
+# Copyright (C) 2019 CERN.
+#
+# REANA is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""REANA-Job-Controller job logs tests."""
+
+import pytest
+from mock import MagicMock, patch
+
+from reana_job_controller.job_logs import (find_tail_offset, limit_stream,
+                                           stream_condor_job_output,
+                                           stream_file, stream_file_tail,
+                                           stream_k8s_job_logs, stream_text,
+                                           tail_stream)
+
+
+@pytest.mark.parametrize('content,lines,expected', [
+    (b'a\nb\nc\n', 2, b'b\nc\n'),
+    (b'a\nb\nc', 2, b'b\nc'),
+    (b'a\nb\nc\n', 5, b'a\nb\nc\n'),
+    (b'a\nb\nc\n', 0, b''),
+    (b'', 3, b''),
+])
+def test_find_tail_offset(tmpdir, content, lines, expected):
+    """Test finding where the last lines of a file start."""
+    log_path = tmpdir.join('job.log')
+    log_path.write_binary(content)
+    with patch('reana_job_controller.job_logs.config.JOB_LOGS_CHUNK_SIZE',
+               2), open(str(log_path), 'rb') as log_file:
+        offset = find_tail_offset(log_file, lines)
+    assert content[offset:] == expected
+
+
+def test_stream_file(tmpdir):
+    """Test streaming ranges of a log file."""
+    log_path = tmpdir.join('job.log')
+    log_path.write_binary(b'0123456789\nabcdef\n')
+    with patch('reana_job_controller.job_logs.config.JOB_LOGS_CHUNK_SIZE',
+               4):
+        assert b''.join(stream_file(str(log_path), offset=2, limit=5)) == \
+            b'23456'
+        assert b''.join(stream_file(str(log_path), tail=1)) == b'abcdef\n'
+    assert list(stream_file(str(tmpdir.join('missing.log')))) == []
+
+
+def test_stream_text():
+    """Test streaming ranges of a log kept in memory."""
+    assert b''.join(stream_text('line1\nline2\n', tail=1)) == b'line2\n'
+    assert b''.join(stream_text('line1\nline2\n', offset=3, limit=4)) == \
+        b'e1\nl'
+
+
+def test_limit_stream():
+    """Test skipping and capping a stream of chunks."""
+    assert list(limit_stream([b'abc', b'def', b'ghi'], offset=4,
+                             limit=3)) == [b'ef', b'g']
+
+
+def test_tail_stream():
+    """Test keeping the last lines of a stream of chunks."""
+    assert b''.join(tail_stream([b'a\nb', b'\nc\nd'], 2)) == b'c\nd'
+    assert b''.join(tail_stream([b'a\nb\n'], 5)) == b'a\nb\n'
+    assert list(tail_stream([b'a\nb\n'], 0)) == []
+
+
+def test_stream_file_tail(tmpdir):
+    """Test streaming only the end of a file."""
+    log_path = tmpdir.join('job.log')
+    log_path.write_binary(b'0123456789')
+    with patch('reana_job_controller.job_logs.config.JOB_LOGS_CHUNK_SIZE',
+               2):
+        assert b''.join(stream_file_tail(str(log_path), 4)) == \
+            b'[... 6 bytes omitted ...]\n6789'
+        assert b''.join(stream_file_tail(str(log_path), 20)) == \
+            b'0123456789'
+    assert list(stream_file_tail(str(tmpdir.join('missing.log')), 4)) == []
+
+
+def test_stream_condor_job_output(tmpdir):
+    """Test merging the stdout and stderr of an HTCondor job."""
+    template = str(tmpdir.join('{0}-{1}.{2}'))
+    tmpdir.join('12-3.out').write_binary(b'output')
+    tmpdir.join('12-3.err').write_binary(b'error\n')
+    with patch('reana_job_controller.htcondor_job_manager.'
+               'HTCONDOR_OUTPUT_TEMPLATE', template):
+        assert b''.join(stream_condor_job_output('12.3', max_size=4)) == \
+            b'[... 2 bytes omitted ...]\ntput\n[stderr]\n' \
+            b'[... 2 bytes omitted ...]\nror\n'
+        tmpdir.join('12-3.err').write_binary(b'')
+        assert b''.join(stream_condor_job_output('12.3')) == b'output'
+        # Followed jobs stream their stderr once finished.
+        tmpdir.join('12-3.err').write_binary(b'error\n')
+        assert b''.join(stream_condor_job_output(
+            '12.3', tail=1, is_finished=lambda: True)) == \
+            b'output\n[stderr]\nerror\n'
+
+
+def test_stream_k8s_job_array_item_logs():
+    """Test the logs of an item of a job array are read from its pod."""
+    pods = []
+    for index in ('0', '1'):
+        pod = MagicMock()
+        pod.metadata.name = 'array-{0}'.format(index)
+        pod.metadata.annotations = {
+            'batch.kubernetes.io/job-completion-index': index}
+        pods.append(pod)
+    with patch('reana_job_controller.job_logs.'
+               'current_k8s_corev1_api_client') as k8s_client:
+        k8s_client.list_namespaced_pod.return_value.items = pods
+        k8s_client.read_namespaced_pod_log.return_value.stream.\
+            return_value = [b'item 0\n']
+        assert b''.join(stream_k8s_job_logs('array.0')) == b'item 0\n'
+    assert k8s_client.list_namespaced_pod.call_args[1]['label_selector'] == \
+        'job-name=array'
+    assert k8s_client.read_namespaced_pod_log.call_args[1]['name'] == \
+        'array-0'
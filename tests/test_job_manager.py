@@ -9,13 +9,18 @@
 """REANA-Job-Controller Job Manager tests."""
 
 import json
+import threading
 import uuid
 
 import mock
 import pytest
-from reana_db.models import Job, JobStatus
+from kubernetes.client.rest import ApiException
+from reana_db.models import Job, JobCache, JobStatus
 
-from reana_job_controller.job_manager import JobManager
+from reana_job_controller.errors import (ComputingBackendSubmissionError,
+                                         JobDBCreationError)
+from reana_job_controller.job_cache import JOB_CACHE_WORKER, JobCacheWorker
+from reana_job_controller.job_manager import JobDBGroupCommitter, JobManager
 from reana_job_controller.kubernetes_job_manager import KubernetesJobManager
 
 
@@ -57,6 +62,43 @@ def test_execute_kubernetes_job(app, session, sample_serial_workflow_in_db,
         assert command == expected_command
 
 
+def test_execute_kubernetes_job_batch(app, session,
+                                      sample_serial_workflow_in_db,
+                                      sample_workflow_workspace):
+    """Test batch execution of Kubernetes jobs."""
+    workflow_uuid = sample_serial_workflow_in_db.id_
+    next(sample_workflow_workspace(
+        str(workflow_uuid)))
+    job_managers = [
+        KubernetesJobManager(docker_img="busybox", cmd=["echo", str(i)],
+                             workflow_uuid=workflow_uuid)
+        for i in range(3)]
+    with mock.patch("reana_job_controller.kubernetes_job_manager."
+                    "current_k8s_batchv1_api_client") as kubernetes_client:
+        def create_namespaced_job(namespace, body):
+            command = body['spec']['template']['spec']['containers'][0][
+                'command']
+            if command == ["echo", "1"]:
+                raise ApiException(reason="Quota exceeded.")
+
+        kubernetes_client.create_namespaced_job.side_effect = \
+            create_namespaced_job
+        backend_job_ids = KubernetesJobManager.execute_batch(job_managers)
+        assert kubernetes_client.create_namespaced_job.call_count == 3
+    JOB_CACHE_WORKER.queue.join()
+    assert isinstance(backend_job_ids[1], ComputingBackendSubmissionError)
+    for job_manager, backend_job_id in [(job_managers[0], backend_job_ids[0]),
+                                        (job_managers[2], backend_job_ids[2])]:
+        created_job = session.query(Job).filter_by(
+            backend_job_id=backend_job_id).one_or_none()
+        assert created_job
+        assert str(created_job.id_) == job_manager.job_id
+        assert session.query(JobCache).filter_by(
+            job_id=created_job.id_).one_or_none()
+    assert session.query(Job).filter_by(
+        workflow_uuid=workflow_uuid).count() == 2
+
+
 def test_stop_kubernetes_job(app, session, sample_serial_workflow_in_db,
                              sample_workflow_workspace):
     """Test stop of Kubernetes job."""
@@ -101,3 +143,233 @@ def test_execution_hooks():
     job_manager = TestJobManger("busybox", "ls", {})
     job_manager.execute()
     assert job_manager.order_list == [1, 2, 3, 4]
+
+
+def test_execution_hook_removes_unregistered_job():
+    """Test that a job which can not be created in DB is removed."""
+    class TestJobManager(JobManager):
+        stop = mock.Mock()
+
+        @JobManager.execution_hook
+        def execute(self):
+            return '1'
+
+        def create_job_in_db(self, backend_job_id):
+            raise TimeoutError('Job was not created in DB.')
+
+    with pytest.raises(JobDBCreationError):
+        TestJobManager('busybox', 'ls', {}).execute()
+    TestJobManager.stop.assert_called_once_with('1')
+
+
+def test_batch_execution_hook_removes_unregistered_jobs():
+    """Test that batch jobs which can not be created in DB are removed."""
+    error = ComputingBackendSubmissionError('Quota exceeded.')
+
+    class TestJobManager(JobManager):
+        stop = mock.Mock(side_effect=[None, Exception('Unreachable.')])
+
+        @classmethod
+        @JobManager.batch_execution_hook
+        def execute_batch(cls, job_managers):
+            return ['1', error, '2']
+
+        @staticmethod
+        def create_jobs_in_db(submitted_jobs):
+            raise Exception('DB is down.')
+
+    backend_job_ids = TestJobManager.execute_batch(
+        [TestJobManager('busybox', 'ls', {}) for _ in range(3)])
+    assert TestJobManager.stop.call_args_list == [mock.call('1'),
+                                                  mock.call('2')]
+    assert backend_job_ids[1] is error
+    assert isinstance(backend_job_ids[0], JobDBCreationError)
+    assert 'removed' in str(backend_job_ids[0])
+    assert isinstance(backend_job_ids[2], JobDBCreationError)
+    assert 'Job 2 could not be created in DB nor removed' in \
+        str(backend_job_ids[2])
+
+
+def test_job_cache_worker_groups_workspace_scans(app, session,
+                                                 sample_serial_workflow_in_db,
+                                                 sample_workflow_workspace):
+    """Test cache entries of close submissions share a workspace scan."""
+    workflow_uuid = sample_serial_workflow_in_db.id_
+    next(sample_workflow_workspace(str(workflow_uuid)))
+    job_ids = []
+    for _ in range(3):
+        job = Job(backend_job_id=str(uuid.uuid4()),
+                  workflow_uuid=workflow_uuid)
+        session.add(job)
+        session.flush()
+        job_ids.append(job.id_)
+    session.commit()
+    worker = JobCacheWorker(batch_delay=10, batch_size=3)
+    with mock.patch('reana_job_controller.job_cache.'
+                    'calculate_file_access_time',
+                    return_value={}) as calculate_file_access_time:
+        for job_id in job_ids:
+            worker.submit(job_id, workflow_uuid)
+        worker.queue.join()
+    calculate_file_access_time.assert_called_once()
+    assert session.query(JobCache).filter(
+        JobCache.job_id.in_(job_ids)).count() == 3
+
+
+def test_job_cache_worker_isolates_failures():
+    """Test a failing scan or entry only loses the cache of its own jobs."""
+    worker = JobCacheWorker()
+
+    def get_workspace(workflow_uuid):
+        if workflow_uuid == 'broken-workflow':
+            raise OSError('Workspace unreachable.')
+        return '/workspace'
+
+    def commit_entries(entries):
+        if len(entries) > 1 or entries[0][0] == 'bad-job':
+            raise Exception('Integrity error.')
+
+    with mock.patch.object(worker, 'get_workspace',
+                           side_effect=get_workspace), \
+            mock.patch('reana_job_controller.job_cache.'
+                       'calculate_file_access_time', return_value={}), \
+            mock.patch('reana_job_controller.job_cache.Session'), \
+            mock.patch.object(worker, 'commit_entries',
+                              side_effect=commit_entries) as commit:
+        worker.create_job_cache_entries([('job', 'workflow'),
+                                         ('lost-job', 'broken-workflow'),
+                                         ('bad-job', 'workflow')])
+    assert commit.call_args_list == [
+        mock.call([('job', {}), ('bad-job', {})]),
+        mock.call([('job', {})]),
+        mock.call([('bad-job', {})])]
+
+
+def test_job_db_group_committer(app, session, sample_serial_workflow_in_db):
+    """Test rows of concurrent submissions are committed together."""
+    workflow_uuid = sample_serial_workflow_in_db.id_
+    committer = JobDBGroupCommitter(interval=0.2)
+    job_ids = []
+
+    def create_job():
+        job_ids.append(committer.create(
+            Job(backend_job_id=str(uuid.uuid4()),
+                workflow_uuid=workflow_uuid)))
+
+    with mock.patch.object(committer, 'commit',
+                           wraps=committer.commit) as commit:
+        threads = [threading.Thread(target=create_job) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert commit.call_count == 1
+    assert session.query(Job).filter(Job.id_.in_(job_ids)).count() == 3
+
+
+def test_job_db_group_committer_max_size():
+    """Test groups are capped to the maximum number of rows."""
+    committer = JobDBGroupCommitter(interval=10, max_size=2)
+    for i in range(3):
+        committer.queue.put(i)
+    groups = []
+
+    def commit(group):
+        groups.append(group)
+        raise SystemExit
+
+    with mock.patch.object(committer, 'commit', side_effect=commit):
+        with pytest.raises(SystemExit):
+            committer.work()
+    assert groups == [[0, 1]]
+    assert committer.queue.qsize() == 1
+
+
+def test_job_db_group_committer_retry():
+    """Test a bad row only fails its own creation."""
+    committer = JobDBGroupCommitter(interval=0.1)
+    group = [{'entry': entry, 'committed': threading.Event(),
+              'taken': False, 'cancelled': False}
+             for entry in ('good', 'bad')]
+
+    def commit_rows(rows):
+        if any(pending['entry'] == 'bad' for pending in rows):
+            raise ValueError('bad row')
+        for pending in rows:
+            pending['job_id'] = pending['entry']
+
+    with mock.patch('reana_job_controller.job_manager.Session'):
+        with mock.patch.object(committer, 'commit_rows',
+                               side_effect=commit_rows) as commit_rows_mock:
+            committer.commit(group)
+    assert commit_rows_mock.call_count == 3
+    assert group[0]['job_id'] == 'good' and 'error' not in group[0]
+    assert isinstance(group[1]['error'], ValueError)
+    assert all(pending['committed'].is_set() for pending in group)
+
+
+def test_job_db_group_committer_timeout():
+    """Test submissions stop waiting for rows which are not committed."""
+    committer = JobDBGroupCommitter(interval=0.1, timeout=0.1)
+    with mock.patch.object(committer, 'start'):
+        with pytest.raises(TimeoutError):
+            committer.create('entry')
+    pending = committer.queue.get_nowait()
+    assert pending['cancelled']
+    with mock.patch('reana_job_controller.job_manager.Session'):
+        with mock.patch.object(committer, 'commit_rows') as commit_rows:
+            committer.commit([pending])
+    commit_rows.assert_called_once_with([])
+
+
+def test_build_array_item():
+    """Test items of job arrays extend the command and environment."""
+    job_manager = KubernetesJobManager(docker_img='busybox',
+                                       cmd='echo item', env_vars={'A': '1'})
+    item_manager = job_manager.build_array_item({'B': '2'}, '"x y"')
+    assert item_manager.cmd == ['echo', 'item', 'x y']
+    assert item_manager.env_vars == {'A': '1', 'B': '2'}
+    assert job_manager.cmd == ['echo', 'item']
+    assert job_manager.env_vars == {'A': '1'}
+
+
+def test_execute_kubernetes_job_array(app, session,
+                                      sample_serial_workflow_in_db,
+                                      sample_workflow_workspace):
+    """Test job arrays are created as a single Indexed Job."""
+    workflow_uuid = sample_serial_workflow_in_db.id_
+    next(sample_workflow_workspace(
+        str(workflow_uuid)))
+    job_manager = KubernetesJobManager(docker_img='busybox', cmd='echo',
+                                       workflow_uuid=workflow_uuid)
+    item_managers = [job_manager.build_array_item({'ITEM': str(i)}, str(i))
+                     for i in range(3)]
+    with mock.patch("reana_job_controller.kubernetes_job_manager."
+                    "current_k8s_batchv1_api_client") as kubernetes_client, \
+            mock.patch("reana_job_controller.kubernetes_job_manager."
+                       "current_k8s_corev1_api_client") as core_client:
+        kubernetes_client.create_namespaced_job.return_value.metadata.uid = \
+            'job-uid'
+        backend_job_ids = job_manager.execute_array(item_managers)
+    JOB_CACHE_WORKER.queue.join()
+    kubernetes_client.create_namespaced_job.assert_called_once()
+    body = kubernetes_client.create_namespaced_job.call_args[1]['body']
+    name = body['metadata']['name']
+    assert backend_job_ids == ['{0}.{1}'.format(name, i) for i in range(3)]
+    assert body['spec']['completionMode'] == 'Indexed'
+    assert body['spec']['completions'] == 3
+    assert body['spec']['parallelism'] == 3
+    container = body['spec']['template']['spec']['containers'][0]
+    assert '$JOB_COMPLETION_INDEX' in container['command'][2]
+    assert 'ITEM' not in json.dumps(container)
+    config_map = \
+        core_client.create_namespaced_config_map.call_args[1]['body']
+    assert config_map['metadata']['name'] == name
+    assert config_map['metadata']['ownerReferences'][0]['uid'] == 'job-uid'
+    assert config_map['data']['1'] == 'export ITEM=1\nexec echo 1\n'
+
+    for item_manager, backend_job_id in zip(item_managers, backend_job_ids):
+        created_job = session.query(Job).filter_by(
+            backend_job_id=backend_job_id).one()
+        assert str(created_job.id_) == item_manager.job_id
+        assert json.loads(created_job.cmd) == item_manager.cmd
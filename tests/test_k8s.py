@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of REANA.
+# Copyright (C) 2019 CERN.
+#
+# REANA is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""REANA-Job-Controller Kubernetes watcher tests."""
+
+import time
+
+import pytest
+from mock import MagicMock, patch
+
+from reana_job_controller.job_db import JobStore
+from reana_job_controller.k8s import (K8S_JOB_ARRAY_SUCCEEDED_INDEXES,
+                                      K8sJobFinalizationPool,
+                                      get_watch_backoff, k8s_watch_jobs,
+                                      parse_completed_indexes, process_k8s_job)
+
+
+class StopWatching(BaseException):
+    """Exception used to leave the infinite watch loop."""
+
+
+def test_k8s_watch_jobs_resume():
+    """Test watch is scoped, resumed and only re-listed on 410 Gone."""
+    job_list = MagicMock(items=[])
+    job_list.metadata.resource_version = '100'
+    k8s_client = MagicMock()
+    k8s_client.list_namespaced_job.side_effect = [job_list, StopWatching()]
+    job = MagicMock()
+    job.metadata.resource_version = '101'
+    streams = [
+        [{'type': 'MODIFIED', 'object': job, 'raw_object': {}}],
+        [{'type': 'ERROR', 'object': None, 'raw_object': {'code': 410}}],
+    ]
+    watcher = MagicMock()
+    watcher.stream.side_effect = streams
+    with patch('reana_job_controller.k8s.current_k8s_batchv1_api_client',
+               k8s_client), \
+            patch('reana_job_controller.k8s.watch.Watch',
+                  return_value=watcher), \
+            patch('reana_job_controller.k8s.time.sleep') as sleep:
+        with pytest.raises(StopWatching):
+            k8s_watch_jobs(JobStore(), MagicMock())
+    assert k8s_client.list_namespaced_job.call_count == 2
+    # Only the 410 error waited before listing again.
+    sleep.assert_called_once()
+    assert 'reana-job-controller=' in \
+        k8s_client.list_namespaced_job.call_args[1]['label_selector']
+    stream_kwargs = [call[1] for call in watcher.stream.call_args_list]
+    assert [kwargs['resource_version'] for kwargs in stream_kwargs] == \
+        ['100', '101']
+
+
+def test_k8s_watch_jobs_backoff():
+    """Test failing requests are retried with a growing, capped backoff."""
+    k8s_client = MagicMock()
+    k8s_client.list_namespaced_job.side_effect = \
+        [Exception('API server unavailable')] * 8 + [StopWatching()]
+    with patch('reana_job_controller.k8s.current_k8s_batchv1_api_client',
+               k8s_client), \
+            patch('reana_job_controller.k8s.random.uniform',
+                  return_value=1), \
+            patch('reana_job_controller.k8s.time.sleep') as sleep:
+        with pytest.raises(StopWatching):
+            k8s_watch_jobs(JobStore(), MagicMock())
+    assert [call[0][0] for call in sleep.call_args_list] == \
+        [1, 2, 4, 8, 16, 32, 60, 60]
+    with patch('reana_job_controller.k8s.random.uniform',
+               return_value=0.5):
+        assert get_watch_backoff(1) == 0.5
+
+
+def test_k8s_job_finalization_pool():
+    """Test finished jobs are finalized in background threads."""
+    job_db = JobStore()
+    job_db.add('job', deleted=False)
+    pool = K8sJobFinalizationPool(job_db, workers=2, queue_size=10)
+    with patch('reana_job_controller.k8s.finalize_k8s_job') as finalize:
+        pool.start()
+        pool.submit('job', 'kubernetes-job', 'default')
+        pool.queue.join()
+    finalize.assert_called_once_with(job_db, 'job', 'kubernetes-job',
+                                     'default', None)
+    stats = pool.get_stats()
+    assert stats['queue_depth'] == 0
+    assert stats['finalized_jobs'] == 1
+    assert stats['failed_jobs'] == 0
+
+
+def test_k8s_job_finalization_pool_retries():
+    """Test failed finalizations are retried a limited number of times."""
+    job_db = JobStore()
+    pool = K8sJobFinalizationPool(job_db, workers=1, queue_size=10)
+    attempts = {'job': 0, 'other-job': 0}
+
+    def finalize(job_db, job_id, *args):
+        attempts[job_id] += 1
+        if job_id == 'other-job' or attempts[job_id] == 1:
+            raise IndexError()
+
+    with patch('reana_job_controller.k8s.config.'
+               'K8S_FINALIZATION_RETRY_DELAY', 0.01), \
+            patch('reana_job_controller.k8s.config.'
+                  'K8S_FINALIZATION_MAX_ATTEMPTS', 3), \
+            patch('reana_job_controller.k8s.finalize_k8s_job',
+                  side_effect=finalize):
+        pool.start()
+        pool.submit('job', 'kubernetes-job', 'default')
+        pool.submit('other-job', 'other-kubernetes-job', 'default')
+        deadline = time.time() + 5
+        while sum(attempts.values()) < 5 and time.time() < deadline:
+            time.sleep(0.01)
+        pool.queue.join()
+    assert attempts == {'job': 2, 'other-job': 3}
+    stats = pool.get_stats()
+    assert stats['finalized_jobs'] == 1
+    assert stats['retried_jobs'] == 3
+    assert stats['failed_jobs'] == 1
+
+
+def test_process_k8s_job_array():
+    """Test items of a job array are updated as their pods succeed."""
+    job_db = JobStore()
+    for index in range(3):
+        job_db.add('item-{0}'.format(index), deleted=False, status='started',
+                   backend_job_id='array.{0}'.format(index))
+    job = MagicMock()
+    job.metadata.name = 'array'
+    job.spec.completion_mode = 'Indexed'
+    job.spec.completions = 3
+    job.status.succeeded = 1
+    job.status.failed = None
+    job.status.completed_indexes = None
+    pod = MagicMock()
+    pod.metadata.annotations = {
+        'batch.kubernetes.io/job-completion-index': '1'}
+    finalization_pool = MagicMock()
+    with patch('reana_job_controller.k8s.current_k8s_corev1_api_client') \
+            as k8s_client:
+        k8s_client.list_namespaced_pod.return_value.items = [pod]
+        process_k8s_job(job_db, job, finalization_pool)
+    assert job_db['item-1'].status == 'succeeded'
+    assert job_db['item-0'].status == 'started'
+    finalization_pool.submit.assert_called_once_with(
+        'item-1', 'array', job.metadata.namespace, 1)
+    # The remaining items fail with the job, the pods are not listed again
+    # as no other item succeeded.
+    job.status.failed = 3
+    with patch('reana_job_controller.k8s.current_k8s_corev1_api_client') \
+            as k8s_client:
+        process_k8s_job(job_db, job, finalization_pool)
+    assert not k8s_client.list_namespaced_pod.called
+    assert job_db['item-0'].status == 'failed'
+    assert job_db['item-2'].status == 'failed'
+    assert finalization_pool.submit.call_count == 3
+    assert 'array' not in K8S_JOB_ARRAY_SUCCEEDED_INDEXES
+    # Jobs which are not Indexed Jobs are not job arrays.
+    job.metadata.name = 'other-job'
+    job.spec.completion_mode = 'NonIndexed'
+    job.spec.completions = 1
+    with patch('reana_job_controller.k8s.process_k8s_job_array') as \
+            process_k8s_job_array:
+        process_k8s_job(job_db, job, finalization_pool)
+    assert not process_k8s_job_array.called
+
+
+def test_process_k8s_job_array_completed_indexes():
+    """Test succeeded items are read from the completed indexes."""
+    assert parse_completed_indexes('1,3-5') == {1, 3, 4, 5}
+    job_db = JobStore()
+    for index in range(4):
+        job_db.add('item-{0}'.format(index), deleted=False, status='started',
+                   backend_job_id='indexed-array.{0}'.format(index))
+    job = MagicMock()
+    job.metadata.name = 'indexed-array'
+    job.spec.completion_mode = 'Indexed'
+    job.spec.completions = 4
+    job.status.succeeded = 3
+    job.status.failed = None
+    job.status.completed_indexes = '0,2-3'
+    finalization_pool = MagicMock()
+    with patch('reana_job_controller.k8s.current_k8s_corev1_api_client') \
+            as k8s_client:
+        process_k8s_job(job_db, job, finalization_pool)
+    assert not k8s_client.list_namespaced_pod.called
+    assert [job_db['item-{0}'.format(index)].status
+            for index in range(4)] == \
+        ['succeeded', 'started', 'succeeded', 'succeeded']
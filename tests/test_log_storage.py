@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of REANA.
+# Copyright (C) 2019 CERN.
+#
+# REANA is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""REANA-Job-Controller job logs storage tests."""
+
+from mock import patch
+
+from reana_job_controller.job_logs import stream_stored_log
+from reana_job_controller.log_storage import (LogExcerpt, build_db_log,
+                                              open_job_log, store_job_log)
+
+
+def test_log_excerpt_small_log():
+    """Test that short logs are kept entirely."""
+    excerpt = LogExcerpt(head_size=4, tail_size=4)
+    excerpt.write(b'abc')
+    excerpt.write(b'def')
+    assert excerpt.omitted_size == 0
+    assert excerpt.getvalue() == 'abcdef'
+
+
+def test_log_excerpt_large_log():
+    """Test that only the head and the tail of long logs are kept."""
+    excerpt = LogExcerpt(head_size=2, tail_size=3)
+    for chunk in (b'ab', b'cdef', b'ghij'):
+        excerpt.write(chunk)
+    assert excerpt.size == 10
+    assert excerpt.omitted_size == 5
+    assert excerpt.getvalue() == 'ab\n[... 5 bytes omitted ...]\nhij'
+
+
+def test_store_job_log(tmpdir):
+    """Test storing and reading back a compressed job log."""
+    with patch('reana_job_controller.config.JOB_LOGS_STORAGE_PATH',
+               str(tmpdir)):
+        excerpt, log_path = store_job_log('abcd', [b'line 1\n', 'line 2\n'])
+    assert log_path == str(tmpdir.join('ab', 'abcd.log.gz'))
+    with open_job_log(log_path) as log_file:
+        assert log_file.read() == b'line 1\nline 2\n'
+    assert excerpt.size == 14
+    assert build_db_log(excerpt, log_path).endswith(
+        '[Full log (14 bytes): {0}]\n'.format(log_path))
+    assert b''.join(stream_stored_log(log_path, tail=1)) == b'line 2\n'
+    assert b''.join(stream_stored_log(log_path, offset=5, limit=3)) == \
+        b'1\nl'
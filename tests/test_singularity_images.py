@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of REANA.
+# Copyright (C) 2019 CERN.
+#
+# REANA is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""REANA-Job-Controller Singularity image cache tests."""
+
+import os
+import threading
+import time
+
+import pytest
+from mock import patch
+
+from reana_job_controller.singularity_images import (SingularityImageCache,
+                                                     parse_image_reference,
+                                                     pin_image_reference)
+
+DIGEST = 'sha256:' + 'a' * 64
+
+
+@pytest.mark.parametrize('docker_img,expected', [
+    ('busybox', ('registry-1.docker.io', 'library/busybox', 'latest')),
+    ('reanahub/reana-env-root6:6.18.04',
+     ('registry-1.docker.io', 'reanahub/reana-env-root6', '6.18.04')),
+    ('localhost:5000/image:1.0', ('localhost:5000', 'image', '1.0')),
+    ('gitlab-registry.cern.ch/group/image@' + DIGEST,
+     ('gitlab-registry.cern.ch', 'group/image', DIGEST)),
+])
+def test_parse_image_reference(docker_img, expected):
+    """Test splitting image references."""
+    assert parse_image_reference(docker_img) == expected
+
+
+def test_pin_image_reference():
+    """Test replacing the tag of an image with its digest."""
+    assert pin_image_reference('localhost:5000/image:1.0', DIGEST) == \
+        'localhost:5000/image@' + DIGEST
+    assert pin_image_reference('busybox', DIGEST) == 'busybox@' + DIGEST
+
+
+def test_get_converts_image_once(tmpdir):
+    """Test that images are converted once and then reused."""
+    images = SingularityImageCache(str(tmpdir), build_command='singularity')
+
+    def build(args, **kwargs):
+        open(args[2], 'w').close()
+
+    with patch('reana_job_controller.singularity_images.'
+               'resolve_image_digest', return_value=DIGEST), \
+            patch('reana_job_controller.singularity_images.which',
+                  return_value='/usr/bin/singularity'), \
+            patch('reana_job_controller.singularity_images.subprocess.'
+                  'check_call', side_effect=build) as check_call:
+        assert images.get('busybox:1.31') is None
+        images.resolver.shutdown()
+        assert images.get('busybox:1.31') == (DIGEST, None)
+        images.executor.shutdown()
+        image_path = str(tmpdir.join(DIGEST.replace(':', '-') + '.sif'))
+        assert images.get('busybox:1.31') == (DIGEST, image_path)
+    check_call.assert_called_once()
+    assert check_call.call_args[0][0][3] == 'docker://busybox@' + DIGEST
+    assert tmpdir.listdir() == [tmpdir.join(DIGEST.replace(':', '-') +
+                                            '.sif')]
+
+
+def test_get_skips_image_converted_elsewhere(tmpdir):
+    """Test that images converted by another controller are not converted."""
+    images = SingularityImageCache(str(tmpdir), build_command='singularity')
+    lock = tmpdir.join(DIGEST.replace(':', '-') + '.sif.lock')
+    lock.write('')
+    with patch('reana_job_controller.singularity_images.which',
+               return_value='/usr/bin/singularity'), \
+            patch('reana_job_controller.singularity_images.subprocess.'
+                  'check_call') as check_call:
+        assert images.get('busybox@' + DIGEST) == (DIGEST, None)
+        images.executor.shutdown()
+    assert not check_call.called
+    assert lock.exists()
+
+
+def test_get_digest_resolves_once_in_background(tmpdir):
+    """Test that image tags are resolved by one background thread."""
+    images = SingularityImageCache(str(tmpdir))
+    resolving = threading.Event()
+    release = threading.Event()
+
+    def resolve(docker_img):
+        resolving.set()
+        release.wait(5)
+        return DIGEST
+
+    with patch('reana_job_controller.singularity_images.'
+               'resolve_image_digest', side_effect=resolve) as resolve_digest:
+        assert images.get_digest('busybox') is None
+        assert resolving.wait(5)
+        assert images.get_digest('busybox') is None
+        release.set()
+        images.resolver.shutdown()
+        assert images.get_digest('busybox') == DIGEST
+    resolve_digest.assert_called_once_with('busybox')
+
+
+def test_remove_unused_images(tmpdir):
+    """Test that old images and least recently used ones are removed."""
+    images = SingularityImageCache(str(tmpdir))
+    now = time.time()
+    for name, age in [('old', 10), ('used', 1), ('recent', 0)]:
+        image = tmpdir.join(name + '.sif')
+        image.write('x' * 10)
+        os.utime(str(image), (now - age, now - age))
+    tmpdir.join('recent.sif.lock').write('')
+    images.remove_unused_images(max_age=5, max_size=100)
+    assert sorted(f.basename for f in tmpdir.listdir()) == \
+        ['recent.sif', 'recent.sif.lock', 'used.sif']
+    images.remove_unused_images(max_age=5, max_size=15)
+    assert sorted(f.basename for f in tmpdir.listdir()) == \
+        ['recent.sif', 'recent.sif.lock']
@@ -8,12 +8,18 @@
 
 """REST API test for REANA-Job-Controller. """
 
+import threading
 import uuid
 
 import pytest
 from flask import url_for
 from kubernetes.client.rest import ApiException
 from mock import Mock, patch
+from reana_commons.utils import calculate_hash_of_dir, calculate_job_input_hash
+from reana_db.models import Job, JobCache, JobStatus
+
+from reana_job_controller.job_db import JOB_DB
+from reana_job_controller.log_storage import store_job_log
 
 
 def test_delete_job(app, mocked_job):
@@ -26,6 +32,20 @@ def test_delete_job(app, mocked_job):
             assert res.status_code == 204
 
 
+def test_delete_htcondor_job(app):
+    """Test deletion of a job of the HTCondor backend."""
+    job_id = str(uuid.uuid4())
+    JOB_DB.add(job_id, backend='HTCondor', backend_job_id='42.1',
+               status='started', deleted=False)
+    with app.test_request_context(), app.test_client() as client:
+        with patch('reana_job_controller.htcondor_job_manager.'
+                   'SCHEDD_CACHE') as schedd_cache:
+            res = client.delete(url_for('jobs.delete_job', job_id=job_id))
+            assert res.status_code == 204
+    assert schedd_cache.act.call_args[0][1] == \
+        'ClusterId==42 && ProcId==1'
+
+
 def test_delete_unknown_job(app):
     """Test delete non existing job."""
     random_job = uuid.uuid4()
@@ -52,3 +72,182 @@ def test_delete_job_failed_backend(app, mocked_job):
                                         job_id=mocked_job))
             assert res.json == expected_msg
             assert res.status_code == 502
+
+
+def test_create_jobs_batch_validation(app):
+    """Test batch job creation reports per-item validation errors."""
+    with app.test_request_context(), app.test_client() as client:
+        res = client.post(url_for('jobs.create_jobs_batch'),
+                          json={'jobs': [{'job_name': 'missing-fields'},
+                                         {'job_name': 'unknown-backend',
+                                          'workflow_workspace': '/',
+                                          'workflow_uuid': str(uuid.uuid4()),
+                                          'docker_img': 'busybox',
+                                          'experiment': 'default',
+                                          'backend': 'Unknown'}]})
+        assert res.status_code == 400
+        assert len(res.json['jobs']) == 2
+        assert 'docker_img' in res.json['jobs'][0]['error']
+        assert 'backend' in res.json['jobs'][1]['error']
+        res = client.post(url_for('jobs.create_jobs_batch'), json={})
+        assert res.status_code == 400
+
+
+def test_get_logs_range(app):
+    """Test retrieving a range of the logs of a job."""
+    job_id = str(uuid.uuid4())
+    JOB_DB.add(job_id, log='line1\nline2\nline3\n', deleted=True,
+               backend='Kubernetes', backend_job_id=job_id)
+    with app.test_request_context():
+        tail_url = url_for('jobs.get_logs', job_id=job_id, tail=2)
+        range_url = url_for('jobs.get_logs', job_id=job_id, offset=6,
+                            limit=5)
+        invalid_url = url_for('jobs.get_logs', job_id=job_id, tail=-1)
+    with app.test_client() as client:
+        res = client.get(tail_url)
+        assert res.status_code == 200
+        assert res.data == b'line2\nline3\n'
+        assert client.get(range_url).data == b'line2'
+        assert client.get(invalid_url).status_code == 400
+
+
+def test_get_logs_stored(app, tmpdir):
+    """Test stored logs are streamed instead of the excerpt kept in memory."""
+    job_id = str(uuid.uuid4())
+    with patch('reana_job_controller.log_storage.config.'
+               'JOB_LOGS_STORAGE_PATH', str(tmpdir)):
+        excerpt, log_path = store_job_log(job_id, [b'line1\n', b'line2\n'])
+    JOB_DB.add(job_id, log='excerpt', log_path=log_path, deleted=True,
+               backend='Kubernetes', backend_job_id=job_id)
+    with app.test_request_context():
+        logs_url = url_for('jobs.get_logs', job_id=job_id)
+    with app.test_client() as client:
+        res = client.get(logs_url)
+        assert res.status_code == 200
+        assert res.is_streamed
+        assert res.data == b'line1\nline2\n'
+
+
+def test_get_jobs_pagination(app):
+    """Test filtering, paginating and projecting the list of jobs."""
+    workflow_uuid = str(uuid.uuid4())
+    job_ids = [str(uuid.uuid4()) for _ in range(3)]
+    for job_id in job_ids:
+        JOB_DB.add(job_id, workflow_uuid=workflow_uuid,
+                   status='started', deleted=False)
+    JOB_DB.update(job_ids[1], status='succeeded')
+    with app.test_request_context(), app.test_client() as client:
+        res = client.get(url_for('jobs.get_jobs', workflow_uuid=workflow_uuid,
+                                 limit=2, fields='job_id,status'))
+        assert res.status_code == 200
+        assert res.json['jobs'] == [
+            {job_ids[0]: {'job_id': job_ids[0], 'status': 'started'}},
+            {job_ids[1]: {'job_id': job_ids[1], 'status': 'succeeded'}}]
+        res = client.get(url_for('jobs.get_jobs', workflow_uuid=workflow_uuid,
+                                 limit=2, after=res.json['next_after']))
+        assert [list(job)[0] for job in res.json['jobs']] == [job_ids[2]]
+        assert res.json['next_after'] is None
+        res = client.get(url_for('jobs.get_jobs', workflow_uuid=workflow_uuid,
+                                 status='succeeded'))
+        assert [list(job)[0] for job in res.json['jobs']] == [job_ids[1]]
+        assert client.get(url_for('jobs.get_jobs', limit=0)).status_code == \
+            400
+        assert client.get(url_for('jobs.get_jobs',
+                                  fields='obj')).status_code == 400
+        res = client.get(url_for('jobs.get_jobs_summary'))
+        assert res.json['jobs']['succeeded'] >= 1
+        assert res.json['total'] == sum(res.json['jobs'].values())
+        finalization_stats = {'queue_depth': 0, 'finalized_jobs': 1,
+                              'failed_jobs': 0, 'average_latency': 0.5,
+                              'max_latency': 0.5}
+        with patch('reana_job_controller.k8s.K8S_FINALIZATION_POOL') \
+                as finalization_pool:
+            finalization_pool.get_stats.return_value = finalization_stats
+            res = client.get(url_for('jobs.get_jobs_summary'))
+        assert res.json['finalization'] == finalization_stats
+
+
+def test_get_job_wait(app):
+    """Test waiting for the status of a job to change."""
+    job_id = str(uuid.uuid4())
+    JOB_DB.add(job_id, docker_img='busybox', experiment='default',
+               status='started', restart_count=0, max_restart_count=3,
+               deleted=False)
+    timer = threading.Timer(0.1, JOB_DB.update, args=(job_id,),
+                            kwargs={'status': 'succeeded'})
+    with app.test_request_context():
+        wait_url = url_for('jobs.get_job', job_id=job_id, wait=10,
+                           since_status='started')
+        job_url = url_for('jobs.get_job', job_id=job_id)
+    with app.test_client() as client:
+        timer.start()
+        res = client.get(wait_url)
+        assert res.status_code == 200
+        assert res.json['status'] == 'succeeded'
+        etag = res.headers['ETag']
+        res = client.get(job_url, headers={'If-None-Match': etag})
+        assert res.status_code == 304
+        res = client.get(job_url + '?wait=0', headers={'If-None-Match': etag})
+        assert res.status_code == 304
+
+
+def test_check_if_cached_batch(app, session, tmpdir):
+    """Test looking up several jobs of a workflow in the cache."""
+    workflow_json = {'steps': ['a', 'b']}
+    job_specs = [{'cmd': 'a', 'workflow_workspace': str(tmpdir)},
+                 {'cmd': 'b'}]
+    tmpdir.join('input.txt').write('input')
+    cached_job = Job(backend_job_id='1', status=JobStatus.finished)
+    session.add(cached_job)
+    session.flush()
+    session.add(JobCache(
+        job_id=cached_job.id_, result_path='/results',
+        parameters=calculate_job_input_hash(dict(job_specs[0]),
+                                            workflow_json),
+        workspace_hash=calculate_hash_of_dir(str(tmpdir))))
+    session.commit()
+    with app.test_request_context(), app.test_client() as client:
+        res = client.post(url_for('jobs.check_if_cached_batch'),
+                          json={'job_specs': job_specs,
+                                'workflow_json': workflow_json,
+                                'workflow_workspace': str(tmpdir)})
+        assert res.status_code == 200
+        assert res.json['jobs'] == [
+            {'cached': True, 'result_path': '/results',
+             'job_id': str(cached_job.id_)},
+            {'cached': False, 'result_path': None}]
+        res = client.post(url_for('jobs.check_if_cached_batch'),
+                          json={'job_specs': job_specs})
+        assert res.status_code == 400
+
+
+def test_create_job_array(app):
+    """Test each item of a job array is addressable by its own job ID."""
+    job_array = {
+        'job': {'job_name': 'sweep', 'workflow_workspace': '/',
+                'workflow_uuid': str(uuid.uuid4()), 'docker_img': 'busybox',
+                'experiment': 'default', 'cmd': 'echo',
+                'backend': 'Kubernetes'},
+        'items': [{'args': '1'}, {'args': '2', 'env_vars': {'B': '2'}}]}
+
+    def execute_array(item_managers):
+        for index, item_manager in enumerate(item_managers):
+            item_manager.job_id = str(uuid.uuid4())
+        return ['array.{0}'.format(index)
+                for index in range(len(item_managers))]
+
+    with app.test_request_context(), app.test_client() as client, \
+            patch('reana_job_controller.kubernetes_job_manager.'
+                  'KubernetesJobManager.execute_array',
+                  side_effect=execute_array):
+        res = client.post(url_for('jobs.create_job_array'), json=job_array)
+        assert res.status_code == 201
+        job_ids = res.json['job_ids']
+        assert len(job_ids) == 2
+        res = client.get(url_for('jobs.get_job', job_id=job_ids[1]))
+        assert res.status_code == 200
+        assert res.json['cmd'] == 'echo 2'
+        assert JOB_DB[job_ids[1]].backend_job_id == 'array.1'
+        job_array['items'] = []
+        res = client.post(url_for('jobs.create_job_array'), json=job_array)
+        assert res.status_code == 400
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of REANA.
+# Copyright (C) 2019 CERN.
+#
+# REANA is free software; you can redistribute it and/or modify it
+# under the terms of the MIT License; see LICENSE file for more details.
+
+"""REANA-Job-Controller incremental workspace hashing tests."""
+
+import os
+
+from mock import patch
+from reana_commons.utils import calculate_hash_of_dir
+
+from reana_job_controller import workspace_hash
+from reana_job_controller.workspace_hash import WorkspaceHashCache
+
+
+def set_old_mtime(path):
+    """Make a file look older than the hashing scan."""
+    os.utime(path, (1000000000, 1000000000))
+
+
+def test_workspace_hash_matches_calculate_hash_of_dir(tmpdir):
+    """Test the incremental hash is the one stored in the job cache."""
+    workspace = tmpdir.mkdir('workspace')
+    workspace.join('small.txt').write('hello')
+    workspace.mkdir('data').join('big.bin').write_binary(
+        os.urandom(3 * 4096 + 17))
+    workspace.join('data').mkdir('empty')
+    for path in ('small.txt', 'data/big.bin'):
+        set_old_mtime(str(workspace.join(path)))
+    cache = WorkspaceHashCache(size=2)
+    expected_hash = calculate_hash_of_dir(str(workspace))
+    assert cache.calculate_hash(str(workspace)) == expected_hash
+    with patch.object(workspace_hash, 'hash_file_chunks',
+                      wraps=workspace_hash.hash_file_chunks) as hash_chunks:
+        assert cache.calculate_hash(str(workspace)) == expected_hash
+        assert not hash_chunks.called
+        workspace.join('small.txt').write('hello world')
+        set_old_mtime(str(workspace.join('small.txt')))
+        assert cache.calculate_hash(str(workspace)) == \
+            calculate_hash_of_dir(str(workspace))
+        hash_chunks.assert_called_once_with(str(workspace.join('small.txt')))
+    assert cache.calculate_hash(str(tmpdir.join('missing'))) == -1
+
+
+def test_workspace_hash_reused_for_same_version(tmpdir):
+    """Test workspaces are not scanned again while the version holds."""
+    workspace = tmpdir.mkdir('workspace')
+    workspace.join('small.txt').write('hello')
+    cache = WorkspaceHashCache()
+    first_hash = cache.calculate_hash(str(workspace), version=1)
+    workspace.join('new.txt').write('new')
+    assert cache.calculate_hash(str(workspace), version=1) == first_hash
+    assert cache.calculate_hash(str(workspace), version=2) == \
+        calculate_hash_of_dir(str(workspace))
+
+
+def test_workspace_hash_cache_digest_size(tmpdir):
+    """Test the cache is bounded by the size of the digests it keeps."""
+    workspaces = []
+    for i in range(3):
+        workspace = tmpdir.mkdir('workspace-{0}'.format(i))
+        workspace.join('data.bin').write_binary(b'0' * 4 * 4096)
+        set_old_mtime(str(workspace.join('data.bin')))
+        workspaces.append(str(workspace))
+    # Each workspace has 4 chunk digests of 16 bytes and a SHA-256.
+    cache = WorkspaceHashCache(size=10, max_digest_size=192)
+    for workspace in workspaces:
+        cache.calculate_hash(workspace)
+    assert list(cache.indexes) == workspaces[1:]
+    cache = WorkspaceHashCache(size=10, max_digest_size=64)
+    cache.calculate_hash(workspaces[0])
+    assert cache.indexes[workspaces[0]].files == {}